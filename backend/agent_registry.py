@@ -8,6 +8,7 @@ Author: Emzyking AI
 
 from typing import List, Dict
 from backend.agents.base_agent import BaseAgent
+from backend.keyword_index import KeywordIndex
 from backend.agents.code_generator import CodeGeneratorAgent
 from backend.agents.bug_fixer import BugFixerAgent
 from backend.agents.code_explainer import CodeExplainerAgent
@@ -34,6 +35,11 @@ AGENT_REGISTRY: Dict[str, BaseAgent] = {
     MEMORY: memory_agent,
 }
 
+# --- Keyword Index Shared by All Agents (one scan per prompt) ---
+KEYWORD_INDEX = KeywordIndex({
+    name: agent.keywords() for name, agent in AGENT_REGISTRY.items() if agent.keywords()
+})
+
 def get_all_agents() -> List[BaseAgent]:
     """
     Returns a list of all agents that can directly handle user prompts.
@@ -49,4 +55,4 @@ from backend.agents.router_agent import RouterAgent
 router_agent = RouterAgent()
 AGENT_REGISTRY[ROUTER] = router_agent
 
-__all__ = ["AGENT_REGISTRY", "get_all_agents"]
+__all__ = ["AGENT_REGISTRY", "KEYWORD_INDEX", "get_all_agents"]
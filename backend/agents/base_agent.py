@@ -7,7 +7,10 @@ Author: Emzyking AI
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import AsyncIterator, Dict, List, Optional
+from backend.keyword_index import KeywordIndex
+from backend.context.chat_context import ChatContext
+from backend.model_registry import model_registry
 
 
 class BaseAgent(ABC):
@@ -17,8 +20,13 @@ class BaseAgent(ABC):
     Subclasses must implement:
     - can_handle(): Determines if the agent can process the given request.
     - handle(): Performs the actual task and returns the response.
+
+    Agents whose reply depends only on the prompt (and context) set
+    `cacheable = True` so the RouterAgent may serve repeats from the response cache.
     """
 
+    cacheable: bool = False
+
     def __init__(self, name: str, description: str):
         """
         Initializes the agent with a name and description.
@@ -29,6 +37,46 @@ class BaseAgent(ABC):
         """
         self.name = name
         self.description = description
+        self._keyword_index: Optional[KeywordIndex] = None
+
+    def keywords(self) -> List[str]:
+        """
+        Returns the keywords that signal this agent's expertise.
+        Agents that score by keywords override this.
+
+        Returns:
+            List[str]: Lowercase keywords (empty by default).
+        """
+        return []
+
+    def score_keyword_hits(self, hits: int) -> int:
+        """
+        Converts a count of distinct matched keywords into this agent's score.
+        Keeps can_handle() and the registry-wide keyword scan consistent.
+
+        Args:
+            hits (int): Number of this agent's keywords found in the prompt.
+
+        Returns:
+            int: Relevance score (the hit count by default).
+        """
+        return hits
+
+    @property
+    def keyword_index(self) -> KeywordIndex:
+        """
+        Compiled matcher over this agent's keywords, built on first use.
+        """
+        if self._keyword_index is None:
+            self._keyword_index = KeywordIndex({self.name: self.keywords()})
+        return self._keyword_index
+
+    @property
+    def model_name(self) -> str:
+        """
+        Gemini model this agent's requests go to (see backend.model_registry).
+        """
+        return model_registry.model_name(self.name)
 
     @abstractmethod
     def can_handle(self, prompt: str) -> bool:
@@ -44,19 +92,34 @@ class BaseAgent(ABC):
         pass
 
     @abstractmethod
-    async def handle(self, prompt: str, context: Dict[str, Any] = {}) -> str:
+    async def handle(self, prompt: str, context: Optional[ChatContext] = None) -> str:
         """
         Handles the prompt and returns a response.
 
         Args:
             prompt (str): The user input.
-            context (Dict): Optional context information.
+            context (ChatContext | None): Conversation context for the request.
 
         Returns:
             str: The agent's response.
         """
         pass
 
+    async def stream(self, prompt: str, context: Optional[ChatContext] = None) -> AsyncIterator[str]:
+        """
+        Streams the response as text chunks. Agents that call the LLM override
+        this to forward model chunks; the default yields the full handle() reply.
+
+        Args:
+            prompt (str): The user input.
+            context (ChatContext | None): Conversation context for the request.
+
+        Yields:
+            str: Response text chunks.
+        """
+        result = await self.handle(prompt, context)
+        yield result if isinstance(result, str) else result[0]
+
     def get_info(self) -> Dict[str, str]:
         """
         Returns basic info about the agent.
@@ -6,14 +6,11 @@ Author: Emzyking AI
 """
 
 from backend.agents.base_agent import BaseAgent
-from typing import Any, Dict, Tuple, List
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, List
+from backend.llm_client import llm_client
+from backend.rate_limiter import is_rate_limit_error
+from backend.context.chat_context import ChatContext
+from backend.prompt_builder import Prompt, build_prompt
 
 
 class CodeExplainerAgent(BaseAgent):
@@ -22,12 +19,35 @@ class CodeExplainerAgent(BaseAgent):
     in plain English.
     """
 
+    cacheable = True
+
+    system_instruction = (
+        "You are Emzyking AI, a helpful programming assistant.\n"
+        "If the prompt is a code snippet, explain what the code does using bullet points and examples.\n"
+        "If the prompt is a question about a programming concept (e.g., 'What is polymorphism?'), give a simple, concise explanation suitable for beginners."
+    )
+
     def __init__(self):
         super().__init__(
             name="CodeExplainer",
             description="Explains code behavior or programming terms clearly in a human-readable format."
         )
 
+    def keywords(self) -> List[str]:
+        """
+        Returns a list of keywords relevant to explanation requests.
+        """
+        return [
+            "explain", "understand", "describe", "what does", "meaning of",
+            "comment this", "what is", "define", "purpose of", "how does"
+        ]
+
+    def score_keyword_hits(self, hits: int) -> int:
+        """
+        Any explanation keyword makes this agent a strong match.
+        """
+        return 10 if hits else 0
+
     def can_handle(self, prompt: str) -> int:
         """
         Determines how suitable this agent is for the prompt.
@@ -35,14 +55,16 @@ class CodeExplainerAgent(BaseAgent):
         Returns:
             int: Relevance score (0–10)
         """
-        keywords = [
-            "explain", "understand", "describe", "what does", "meaning of",
-            "comment this", "what is", "define", "purpose of", "how does"
-        ]
-        matches = sum(keyword in prompt.lower() for keyword in keywords)
-        return 10 if matches else 0
+        return self.score_keyword_hits(self.keyword_index.count(prompt))
+
+    def _build_prompt(self, prompt: str, context: Optional[ChatContext] = None) -> Prompt:
+        """
+        Builds the explanation prompt sent to Gemini: the fixed instructions
+        as system instruction, then the conversation and the prompt.
+        """
+        return build_prompt(self.system_instruction, f"Prompt:\n{prompt}\n\nExplanation:", context)
 
-    async def handle(self, prompt: str, context: Dict[str, Any] = {}) -> Tuple[str, Dict[str, str], List[Dict[str, Any]]]:
+    async def handle(self, prompt: str, context: Optional[ChatContext] = None) -> Tuple[str, Dict[str, str], List[Dict[str, Any]]]:
         """
         Processes the user request and provides a clear explanation of code or a programming term.
 
@@ -51,34 +73,25 @@ class CodeExplainerAgent(BaseAgent):
             - thought: Explanation meta (reasoning and source)
             - tool_calls: Tool usage metadata (empty for now)
         """
-        explanation_prompt = (
-            "You are Emzyking AI, a helpful programming assistant.\n"
-            "If the prompt is a code snippet, explain what the code does using bullet points and examples.\n"
-            "If the prompt is a question about a programming concept (e.g., 'What is polymorphism?'), give a simple, concise explanation suitable for beginners.\n\n"
-            f"Prompt:\n{prompt}\n\n"
-            "Explanation:"
-        )
-
         try:
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            response = model.generate_content(explanation_prompt)
+            response_text = await llm_client.generate(self._build_prompt(prompt, context), model_key=self.name)
             return (
-                response.text.strip(),
+                response_text,
                 {
                     "reasoning": "Identified as a code explanation or programming definition request.",
-                    "tool_invoked": "gemini-2.5-flash",
+                    "tool_invoked": self.model_name,
                     "observation": "Response successfully generated using Gemini."
                 },
                 []  # no tool calls
             )
 
         except Exception as e:
-            if "Quota" in str(e) or "429" in str(e):
+            if is_rate_limit_error(e):
                 return (
                     "⚠️ Emzyking AI quota exceeded. Please try again later.",
                     {
                         "reasoning": "API quota exceeded.",
-                        "tool_invoked": "gemini-2.5-flash",
+                        "tool_invoked": self.model_name,
                         "observation": "Could not generate explanation due to usage limits."
                     },
                     []
@@ -87,8 +100,28 @@ class CodeExplainerAgent(BaseAgent):
                 f"❌ Error while explaining: {str(e)}",
                 {
                     "reasoning": "Gemini API call failed.",
-                    "tool_invoked": "gemini-2.5-flash",
+                    "tool_invoked": self.model_name,
                     "observation": "An exception occurred while generating explanation."
                 },
                 []
             )
+
+    async def stream(self, prompt: str, context: Optional[ChatContext] = None) -> AsyncIterator[str]:
+        """
+        Streams the explanation from Gemini as it is produced.
+
+        Yields:
+            str: Explanation text chunks.
+        """
+        started = False
+        try:
+            async for chunk in llm_client.generate_stream(self._build_prompt(prompt, context), model_key=self.name):
+                started = True
+                yield chunk
+
+        except Exception as e:
+            prefix = "\n" if started else ""
+            if is_rate_limit_error(e):
+                yield prefix + "⚠️ Emzyking AI quota exceeded. Please try again later."
+            else:
+                yield prefix + f"❌ Error while explaining: {str(e)}"
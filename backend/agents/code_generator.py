@@ -6,14 +6,11 @@ Author: Emzyking AI
 """
 
 from backend.agents.base_agent import BaseAgent
-from typing import Any, Dict, List
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from typing import AsyncIterator, List, Optional
+from backend.llm_client import llm_client
+from backend.rate_limiter import is_rate_limit_error
+from backend.context.chat_context import ChatContext
+from backend.prompt_builder import Prompt, build_prompt
 
 
 class CodeGeneratorAgent(BaseAgent):
@@ -21,6 +18,14 @@ class CodeGeneratorAgent(BaseAgent):
     Agent responsible for generating code from user prompts.
     """
 
+    cacheable = True
+
+    system_instruction = (
+        "You are Emzyking AI, a smart and concise code generation assistant.\n"
+        "Your task is to generate clean, correct, and efficient code for the user's request.\n"
+        "Respond ONLY with the code. Use comments where needed but no extra text."
+    )
+
     def __init__(self):
         super().__init__(
             name="CodeGenerator",
@@ -49,34 +54,53 @@ class CodeGeneratorAgent(BaseAgent):
         Returns:
             int: Match score based on keyword occurrences.
         """
-        prompt_lower = prompt.lower()
-        return sum(1 for kw in self.keywords() if kw in prompt_lower)
+        return self.score_keyword_hits(self.keyword_index.count(prompt))
 
-    async def handle(self, prompt: str, context: Dict[str, Any] = {}) -> str:
+    def _build_prompt(self, prompt: str, context: Optional[ChatContext] = None) -> Prompt:
+        """
+        Builds the code generation prompt sent to Gemini: the fixed
+        instructions as system instruction, then the conversation and request.
+        """
+        return build_prompt(self.system_instruction, f"User Request: {prompt.strip()}\n\nGenerated Code:", context)
+
+    def _error_message(self, e: Exception) -> str:
+        if is_rate_limit_error(e):
+            return "⚠️ Emzyking AI quota exceeded. Please try again later."
+        return f"❌ Error generating code: {str(e)}"
+
+    async def handle(self, prompt: str, context: Optional[ChatContext] = None) -> str:
         """
         Handles the prompt by generating code using Gemini API.
 
         Args:
             prompt (str): The user input.
-            context (Dict[str, Any]): Optional context for generation.
+            context (ChatContext | None): Conversation context for the request.
 
         Returns:
             str: Generated code snippet.
         """
-        full_prompt = (
-            "You are Emzyking AI, a smart and concise code generation assistant.\n"
-            "Your task is to generate clean, correct, and efficient code for the following user request.\n"
-            "Respond ONLY with the code. Use comments where needed but no extra text.\n\n"
-            f"User Request: {prompt.strip()}\n\n"
-            "Generated Code:"
-        )
+        try:
+            return await llm_client.generate(self._build_prompt(prompt, context), model_key=self.name)
 
+        except Exception as e:
+            return self._error_message(e)
+
+    async def stream(self, prompt: str, context: Optional[ChatContext] = None) -> AsyncIterator[str]:
+        """
+        Streams generated code from Gemini as it is produced.
+
+        Args:
+            prompt (str): The user input.
+            context (ChatContext | None): Conversation context for the request.
+
+        Yields:
+            str: Generated code chunks.
+        """
+        started = False
         try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(full_prompt)
-            return response.text.strip()
+            async for chunk in llm_client.generate_stream(self._build_prompt(prompt, context), model_key=self.name):
+                started = True
+                yield chunk
 
         except Exception as e:
-            if "Quota" in str(e) or "429" in str(e):
-                return "⚠️ Emzyking AI quota exceeded. Please try again later."
-            return f"❌ Error generating code: {str(e)}"
+            yield ("\n" if started else "") + self._error_message(e)
@@ -6,9 +6,12 @@ Author: Emzyking AI
 """
 
 from backend.agents.base_agent import BaseAgent
-from backend.database.db_connection import SessionLocal
+from backend.database.db_connection import AsyncSessionLocal
 from backend.database.db_models import MemoryStore
-from typing import Dict, Any
+from backend.context.context_cache import context_cache
+from backend.context.chat_context import ChatContext
+from sqlalchemy import select
+from typing import List, Optional
 import re
 
 
@@ -24,6 +27,18 @@ class MemoryAgent(BaseAgent):
             description="Stores or retrieves memories such as facts, preferences, or tasks per session."
         )
 
+    def keywords(self) -> List[str]:
+        """
+        Returns a list of keywords that suggest a memory action.
+        """
+        return ["remember", "forget", "recall", "remind", "store this", "what did i", "what was my"]
+
+    def score_keyword_hits(self, hits: int) -> int:
+        """
+        Memory requests are a yes/no match rather than a graded one.
+        """
+        return 1 if hits else 0
+
     def can_handle(self, prompt: str) -> bool:
         """
         Determines if the prompt suggests a memory-related action.
@@ -34,65 +49,61 @@ class MemoryAgent(BaseAgent):
         Returns:
             bool: True if memory action keywords are detected.
         """
-        keywords = ["remember", "forget", "recall", "remind", "store this", "what did I", "what was my"]
-        return any(kw in prompt.lower() for kw in keywords)
+        return self.keyword_index.count(prompt) > 0
 
-    async def handle(self, prompt: str, context: Dict[str, Any] = {}) -> str:
+    async def handle(self, prompt: str, context: Optional[ChatContext] = None) -> str:
         """
         Executes a memory action: store or retrieve memory for a chat session.
 
         Args:
             prompt (str): User request.
-            context (Dict): Should include 'chat_id'.
+            context (ChatContext | None): Must carry the session's chat_id.
 
         Returns:
             str: Memory action result.
         """
-        chat_id = context.get("chat_id")
+        chat_id = context.chat_id if context else None
         if not chat_id:
             return "❌ Chat session ID is required to manage memory."
 
-        db = SessionLocal()
-
         try:
-            prompt_lower = prompt.lower()
-
-            # Example: "remember my favorite language is Python"
-            if "remember" in prompt_lower or "store this" in prompt_lower:
-                memory_type = "fact"
-                memory_content = self._extract_memory_fact(prompt)
-                if not memory_content:
-                    return "⚠️ Could not extract any memory to store. Please be more specific."
-
-                new_memory = MemoryStore(chat_id=chat_id, memory_type=memory_type, content=memory_content)
-                db.add(new_memory)
-                db.commit()
-                return f"✅ Got it. I've remembered: '{memory_content}'"
-
-            # Example: "what did I say", "recall", "remind me"
-            elif any(word in prompt_lower for word in ["recall", "what did", "remind", "what was"]):
-                memories = (
-                    db.query(MemoryStore)
-                    .filter(MemoryStore.chat_id == chat_id)
-                    .order_by(MemoryStore.updated_at.desc())
-                    .limit(5)
-                    .all()
-                )
-
-                if not memories:
-                    return "🤷‍♂️ I don't have anything stored for this session yet."
-
-                response = "🧠 Here's what I remember:\n"
-                for i, mem in enumerate(memories, start=1):
-                    response += f"{i}. {mem.content} (last updated: {mem.updated_at.strftime('%Y-%m-%d %H:%M')})\n"
-                return response.strip()
-
-            return "❌ I couldn't identify a valid memory action in your prompt."
+            async with AsyncSessionLocal() as db:
+                prompt_lower = prompt.lower()
+
+                # Example: "remember my favorite language is Python"
+                if "remember" in prompt_lower or "store this" in prompt_lower:
+                    memory_type = "fact"
+                    memory_content = self._extract_memory_fact(prompt)
+                    if not memory_content:
+                        return "⚠️ Could not extract any memory to store. Please be more specific."
+
+                    new_memory = MemoryStore(chat_id=chat_id, memory_type=memory_type, content=memory_content)
+                    db.add(new_memory)
+                    await db.commit()
+                    await context_cache.add_memory(chat_id, memory_type, memory_content)
+                    return f"✅ Got it. I've remembered: '{memory_content}'"
+
+                # Example: "what did I say", "recall", "remind me"
+                elif any(word in prompt_lower for word in ["recall", "what did", "remind", "what was"]):
+                    memories = (await db.execute(
+                        select(MemoryStore)
+                        .where(MemoryStore.chat_id == chat_id)
+                        .order_by(MemoryStore.updated_at.desc())
+                        .limit(5)
+                    )).scalars().all()
+
+                    if not memories:
+                        return "🤷‍♂️ I don't have anything stored for this session yet."
+
+                    response = "🧠 Here's what I remember:\n"
+                    for i, mem in enumerate(memories, start=1):
+                        response += f"{i}. {mem.content} (last updated: {mem.updated_at.strftime('%Y-%m-%d %H:%M')})\n"
+                    return response.strip()
+
+                return "❌ I couldn't identify a valid memory action in your prompt."
 
         except Exception as e:
             return f"❌ Error accessing memory: {str(e)}"
-        finally:
-            db.close()
 
     def _extract_memory_fact(self, prompt: str) -> str:
         """
@@ -6,10 +6,36 @@ and contextual memory.
 Author: Emzyking AI
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, List, Dict, Any, Optional, Sequence, Tuple
 from backend.agents.base_agent import BaseAgent
-from backend.scorer import rank_agents
-from backend import llm_handler
+from backend.scorer import rank_agents, rank_agents_batch
+from backend import llm_handler, tracing
+from backend.metrics import AGENT_SECONDS
+from backend.model_registry import FALLBACK_MODEL_KEY, model_registry
+from backend.response_cache import response_cache
+from backend.single_flight import SingleFlight
+from backend.resilience import (
+    FALLBACK_TIMEOUT_SECONDS, HEDGE_ENABLED, HEDGE_MIN_DELAY_SECONDS, HEDGE_PERCENTILE,
+    CircuitBreaker, CircuitOpenError, LatencyTracker, agent_timeout, hedged, iterate_with_deadline
+)
+from backend.utils import is_error_response
+from backend.context.chat_context import ChatContext
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+FALLBACK_MESSAGE = (
+    "🤖 Hi, I am Emzyking AI your programming Assistant, I'm not sure how to help with that.\n"
+    "Try one of the following:\n"
+    "• 'Generate a Python function to sort a list'\n"
+    "• 'Fix this broken JavaScript code'\n"
+    "• 'Explain what this SQL query does'\n"
+    "• 'Remember that I prefer Python over Java'"
+)
 
 
 class RouterAgent(BaseAgent):
@@ -19,6 +45,20 @@ class RouterAgent(BaseAgent):
     """
 
     def __init__(self):
+        super().__init__(
+            name="Router",
+            description="Routes prompts to the best-suited specialized agent."
+        )
+        # Concurrent identical requests share one in-flight agent call
+        self.flights = SingleFlight()
+
+        # Failure isolation: a breaker per agent (and "llm_handler"), latencies for hedging
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.hedge_enabled = HEDGE_ENABLED
+        self.timeouts = 0
+        self.hedges = 0
+
         # import to avoid circular import at top-level
         from backend.agent_registry import get_all_agents
         self.agents: List[BaseAgent] = [
@@ -36,20 +76,140 @@ class RouterAgent(BaseAgent):
     async def handle(
         self,
         user_input: str,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[ChatContext] = None
     ) -> Tuple[str, Optional[Dict[str, str]], List[Dict[str, Any]]]:
         response, thought, tools, _, _ = await self.route(user_input=user_input, context=context)
         return response, thought, tools
 
+    def _request_key(self, agent: BaseAgent, user_input: str, context: ChatContext) -> Optional[str]:
+        """
+        Returns the identity of this dispatch (agent, normalized prompt, model,
+        context hash), or None if the agent's replies must not be shared.
+        Used both as the response cache key and the single-flight key.
+        """
+        if not agent.cacheable:
+            return None
+        # Hash the rendered context, not chat_id, so identical conversations share entries
+        return response_cache.make_key(agent.name, user_input, agent.model_name, context.render())
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker for an agent name or "llm_handler".
+        """
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    def _hedge_after(self, agent: BaseAgent) -> Optional[float]:
+        """
+        Returns when a hedged second call to the agent should start, or None.
+        Only cacheable agents are hedged: their calls have no side effects.
+        """
+        if not self.hedge_enabled or not agent.cacheable or agent.name not in self.latencies:
+            return None
+        threshold = self.latencies[agent.name].percentile(HEDGE_PERCENTILE)
+        return max(threshold, HEDGE_MIN_DELAY_SECONDS) if threshold is not None else None
+
+    async def _call_agent(self, agent: BaseAgent, user_input: str, context: ChatContext) -> Any:
+        """
+        Calls agent.handle() under the agent's deadline, hedging slow calls,
+        and records the outcome on its breaker.
+
+        Raises:
+            asyncio.TimeoutError: If no reply arrived within agent_timeout(agent.name).
+        """
+        breaker = self.breaker(agent.name)
+
+        def accept(result: Any) -> bool:
+            return not is_error_response(result if isinstance(result, str) else result[0])
+
+        def count_hedge() -> None:
+            self.hedges += 1
+
+        start = time.perf_counter()
+        try:
+            with tracing.span("agent.handle", agent=agent.name):
+                result = await asyncio.wait_for(
+                    hedged(lambda: agent.handle(user_input, context), self._hedge_after(agent), accept, count_hedge),
+                    agent_timeout(agent.name)
+                )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            breaker.record_failure()
+            AGENT_SECONDS.observe(time.perf_counter() - start, agent=agent.name, outcome="timeout")
+            raise
+        except Exception:
+            breaker.record_failure()
+            AGENT_SECONDS.observe(time.perf_counter() - start, agent=agent.name, outcome="error")
+            raise
+
+        elapsed = time.perf_counter() - start
+        if accept(result):
+            breaker.record_success()
+            self.latencies.setdefault(agent.name, LatencyTracker()).record(elapsed)
+            AGENT_SECONDS.observe(elapsed, agent=agent.name, outcome="success")
+        else:
+            breaker.record_failure()
+            AGENT_SECONDS.observe(elapsed, agent=agent.name, outcome="error")
+        return result
+
+    async def _dispatch(
+        self,
+        agent: BaseAgent,
+        user_input: str,
+        context: ChatContext
+    ) -> Tuple[str, Optional[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        Calls the agent and normalizes its reply to (response, thought, tool_calls).
+        """
+        result = await self._call_agent(agent, user_input, context)
+
+        if isinstance(result, str):
+            thought = {
+                "reasoning": f"Handled by {agent.__class__.__name__} based on prompt match.",
+                "tool_invoked": agent.model_name,
+                "observation": "Returned simple text."
+            }
+            return result, thought, []
+
+        response, thought, tools = result
+        return response, thought, tools
+
+    async def _dispatch_and_cache(
+        self,
+        agent: BaseAgent,
+        user_input: str,
+        context: ChatContext,
+        request_key: str
+    ) -> Tuple[str, Optional[Dict[str, str]], List[Dict[str, Any]]]:
+        """
+        Dispatches to the agent and stores a successful reply in the response cache.
+        """
+        response, thought, tools = await self._dispatch(agent, user_input, context)
+
+        if response_cache.enabled and not is_error_response(response):
+            await response_cache.set(
+                request_key,
+                {"response": response, "thought": thought, "tool_calls": tools},
+                agent_name=agent.name,
+                model_name=agent.model_name
+            )
+        return response, thought, tools
+
     async def route(
         self,
         user_input: str,
         chat_id: Optional[str] = None,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[ChatContext] = None,
+        ranked: Optional[List[Tuple[BaseAgent, float]]] = None
     ) -> Tuple[str, Optional[Dict[str, str]], List[Dict[str, Any]], str, float]:
         """
         Main routing function. Scores and selects the best agent.
 
+        Args:
+            ranked (List[Tuple[BaseAgent, float]] | None): Ranking already computed
+                for user_input (see route_batch); scored here when omitted.
+
         Returns:
             - response: The agent's reply to the prompt
             - thought: Optional thought or internal reasoning
@@ -57,52 +217,246 @@ class RouterAgent(BaseAgent):
             - agent_name: The name of the selected agent
             - confidence_score: Relevance score from ranking
         """
-        context = context or {}
+        context = ChatContext.coerce(context, chat_id)
 
         # Step 1: Score agents by relevance
-        ranked: List[Tuple[BaseAgent, int]] = rank_agents(user_input)
+        if ranked is None:
+            with tracing.span("router.rank"):
+                ranked = rank_agents(user_input)
 
         # Step 2: Try the best ranked agent (even if score is 0)
         if ranked:
             best_agent, score = ranked[0]
-            try:
-                result = await best_agent.handle(user_input, context)
+            agent_name = best_agent.__class__.__name__
 
-                if isinstance(result, str):
-                    response = result
-                    thought = {
-                        "reasoning": f"Handled by {best_agent.__class__.__name__} based on prompt match.",
-                        "tool_invoked": "gemini-2.5-flash",
-                        "observation": "Returned simple text."
-                    }
-                    return response, thought, [], best_agent.__class__.__name__, float(score)
+            # Serve repeats of cacheable prompts without calling the agent
+            request_key = self._request_key(best_agent, user_input, context)
+            if request_key and response_cache.enabled:
+                cached = await response_cache.get(request_key)
+                if cached is not None:
+                    return cached["response"], cached["thought"], cached["tool_calls"], agent_name, float(score)
 
-                response, thought, tools = result
-                return response, thought, tools, best_agent.__class__.__name__, float(score)
+            try:
+                # An open breaker skips the agent instead of waiting on it
+                self.breaker(best_agent.name).check()
+                if request_key:
+                    response, thought, tools = await self.flights.do(
+                        request_key, lambda: self._dispatch_and_cache(best_agent, user_input, context, request_key)
+                    )
+                else:
+                    response, thought, tools = await self._dispatch(best_agent, user_input, context)
+
+                return response, thought, tools, agent_name, float(score)
 
+            except asyncio.TimeoutError:
+                logger.warning("Agent timed out", extra={"agent": agent_name, "timeout_s": agent_timeout(best_agent.name)})
             except Exception as e:
-                print(f"Agent {best_agent.__class__.__name__} failed: {e}")
+                logger.warning("Agent failed", extra={"agent": agent_name, "error": str(e)})
 
         # Step 3: Fallback to direct model handler if all else fails
+        fallback_breaker = self.breaker("llm_handler")
         try:
-            response = await llm_handler.generate(user_input)
+            fallback_breaker.check()
+            with tracing.span("agent.handle", agent="llm_handler"):
+                response = await asyncio.wait_for(llm_handler.generate(user_input, context), FALLBACK_TIMEOUT_SECONDS)
+            if is_error_response(response):
+                fallback_breaker.record_failure()
+            else:
+                fallback_breaker.record_success()
             thought = {
                 "reasoning": "No specialized agent scored confidently or succeeded. Used LLM handler fallback.",
-                "tool_invoked": "gemini-2.5-flash",
+                "tool_invoked": model_registry.model_name(FALLBACK_MODEL_KEY),
                 "observation": "Handled via direct LLM call."
             }
             return response, thought, [], "llm_handler", 0.0
 
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            fallback_breaker.record_failure()
+            logger.warning("LLM handler fallback timed out", extra={"timeout_s": FALLBACK_TIMEOUT_SECONDS})
+        except CircuitOpenError as e:
+            logger.warning("LLM handler fallback skipped", extra={"error": str(e)})
         except Exception as e:
-            print(f"LLM Handler Fallback failed: {e}")
+            fallback_breaker.record_failure()
+            logger.warning("LLM handler fallback failed", extra={"error": str(e)})
 
         # Step 4: Final fallback message
-        fallback_msg = (
-            "🤖 Hi, I am Emzyking AI your programming Assistant, I'm not sure how to help with that.\n"
-            "Try one of the following:\n"
-            "• 'Generate a Python function to sort a list'\n"
-            "• 'Fix this broken JavaScript code'\n"
-            "• 'Explain what this SQL query does'\n"
-            "• 'Remember that I prefer Python over Java'"
-        )
-        return fallback_msg, None, [], "router", 0.0
+        return FALLBACK_MESSAGE, None, [], "router", 0.0
+
+    async def route_batch(
+        self,
+        prompts: Sequence[str],
+        max_concurrency: int
+    ) -> AsyncIterator[Tuple[int, Tuple[str, Optional[Dict[str, str]], List[Dict[str, Any]], str, float]]]:
+        """
+        Routes independent one-off prompts. All prompts are ranked in one
+        scoring pass, then dispatched with at most max_concurrency in flight.
+
+        Args:
+            prompts (Sequence[str]): The user inputs.
+            max_concurrency (int): Prompts routed at the same time.
+
+        Yields:
+            (index, route() result) pairs in completion order.
+        """
+        with tracing.span("router.rank_batch", prompts=len(prompts)):
+            rankings = rank_agents_batch(prompts)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Batch ranked", extra={
+                "prompts": len(prompts), "agents": [r[0][0].name if r else None for r in rankings]
+            })
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def route_one(index: int):
+            async with semaphore:
+                return index, await self.route(prompts[index], chat_id=str(uuid.uuid4()), ranked=rankings[index])
+
+        tasks = [asyncio.ensure_future(route_one(index)) for index in range(len(prompts))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The caller stopped early (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def route_stream(
+        self,
+        user_input: str,
+        chat_id: Optional[str] = None,
+        context: Optional[ChatContext] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of route(). Selects the best agent the same way and
+        forwards its output as it is generated.
+
+        Yields events as {"event": name, "data": payload}:
+            - "route": routed_agent and confidence_score, always first
+            - "chunk": a piece of response text
+            - "done": full response, thought, tool_calls, and final routed_agent
+        """
+        context = ChatContext.coerce(context, chat_id)
+
+        with tracing.span("router.rank"):
+            ranked: List[Tuple[BaseAgent, float]] = rank_agents(user_input)
+
+        if ranked:
+            best_agent, score = ranked[0]
+            agent_name, confidence = best_agent.__class__.__name__, float(score)
+        else:
+            best_agent, agent_name, confidence = None, "llm_handler", 0.0
+
+        yield {"event": "route", "data": {"routed_agent": agent_name, "confidence_score": confidence}}
+
+        chunks: List[str] = []
+
+        # Stream from the selected agent; fall back only if it fails before any output
+        if best_agent is not None:
+            cache_key = self._request_key(best_agent, user_input, context) if response_cache.enabled else None
+            if cache_key:
+                cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    yield {"event": "chunk", "data": {"text": cached["response"]}}
+                    yield {"event": "done", "data": {
+                        "response": cached["response"], "agent_thought": cached["thought"],
+                        "tools_used": cached["tool_calls"], "routed_agent": agent_name, "confidence_score": confidence
+                    }}
+                    return
+
+            breaker = self.breaker(best_agent.name)
+            try:
+                breaker.check()
+                stream = iterate_with_deadline(best_agent.stream(user_input, context), agent_timeout(best_agent.name))
+                with tracing.span("agent.stream", agent=best_agent.name):
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        yield {"event": "chunk", "data": {"text": chunk}}
+
+                thought = {
+                    "reasoning": f"Handled by {agent_name} based on prompt match.",
+                    "tool_invoked": best_agent.model_name,
+                    "observation": "Streamed response text."
+                }
+                response = "".join(chunks)
+                if is_error_response(response):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if cache_key and not is_error_response(response):
+                    await response_cache.set(
+                        cache_key,
+                        {"response": response, "thought": thought, "tool_calls": []},
+                        agent_name=best_agent.name,
+                        model_name=best_agent.model_name
+                    )
+                yield {"event": "done", "data": {
+                    "response": response, "agent_thought": thought, "tools_used": [],
+                    "routed_agent": agent_name, "confidence_score": confidence
+                }}
+                return
+
+            except Exception as e:
+                reason = str(e)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                    reason = f"no reply within {agent_timeout(best_agent.name)}s"
+                if not isinstance(e, CircuitOpenError):
+                    breaker.record_failure()
+                logger.warning("Agent failed", extra={"agent": agent_name, "error": reason})
+                if chunks:
+                    yield {"event": "done", "data": {
+                        "response": "".join(chunks), "agent_thought": None, "tools_used": [],
+                        "routed_agent": agent_name, "confidence_score": confidence
+                    }}
+                    return
+
+        fallback_breaker = self.breaker("llm_handler")
+        try:
+            fallback_breaker.check()
+            stream = iterate_with_deadline(llm_handler.generate_stream(user_input, context), FALLBACK_TIMEOUT_SECONDS)
+            with tracing.span("agent.stream", agent="llm_handler"):
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield {"event": "chunk", "data": {"text": chunk}}
+        except Exception as e:
+            reason = str(e)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                reason = f"no reply within {FALLBACK_TIMEOUT_SECONDS}s"
+            if not isinstance(e, CircuitOpenError):
+                fallback_breaker.record_failure()
+            logger.warning("LLM handler fallback failed", extra={"error": reason})
+            if not chunks:
+                yield {"event": "chunk", "data": {"text": FALLBACK_MESSAGE}}
+                yield {"event": "done", "data": {
+                    "response": FALLBACK_MESSAGE, "agent_thought": None, "tools_used": [],
+                    "routed_agent": "router", "confidence_score": 0.0
+                }}
+                return
+        else:
+            if is_error_response("".join(chunks)):
+                fallback_breaker.record_failure()
+            else:
+                fallback_breaker.record_success()
+
+        thought = {
+            "reasoning": "No specialized agent scored confidently or succeeded. Used LLM handler fallback.",
+            "tool_invoked": model_registry.model_name(FALLBACK_MODEL_KEY),
+            "observation": "Streamed via direct LLM call."
+        }
+        yield {"event": "done", "data": {
+            "response": "".join(chunks), "agent_thought": thought, "tools_used": [],
+            "routed_agent": "llm_handler", "confidence_score": 0.0
+        }}
+
+    def resilience_stats(self) -> Dict[str, Any]:
+        """
+        Returns breaker states, recent p95 latencies, timeouts and hedged calls.
+        """
+        return {
+            "breakers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+            "p95_seconds": {name: tracker.percentile(95) for name, tracker in self.latencies.items()},
+            "timeouts": self.timeouts,
+            "hedge_enabled": self.hedge_enabled,
+            "hedges": self.hedges,
+        }
@@ -0,0 +1,84 @@
+"""
+This module defines ChatContext, the conversation context handed from the API
+through the RouterAgent to every agent. It carries the session id, the
+selected memory items and recent turns, and their estimated token count, and
+renders them for prompts (see backend.prompt_builder).
+
+Author: Emzyking AI
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class ChatContext:
+    """
+    Conversation context for one request. The current user prompt is not part
+    of turns; agents place it after the rendered context.
+    """
+    chat_id: Optional[str] = None
+    memories: List[Tuple[str, str]] = field(default_factory=list)  # (memory_type, content), most relevant first
+    turns: List[Tuple[str, str]] = field(default_factory=list)  # (role, content), oldest first
+    token_count: int = 0
+
+    @classmethod
+    def coerce(cls, context: Any = None, chat_id: Optional[str] = None) -> "ChatContext":
+        """
+        Accepts a ChatContext, a dict with the same keys, or None, so callers
+        that only know the chat id still produce a valid context.
+        """
+        if isinstance(context, ChatContext):
+            if chat_id and not context.chat_id:
+                context.chat_id = chat_id
+            return context
+        if isinstance(context, dict):
+            return cls(
+                chat_id=context.get("chat_id") or chat_id,
+                memories=list(context.get("memories", [])),
+                turns=list(context.get("turns", [])),
+                token_count=context.get("token_count", 0),
+            )
+        return cls(chat_id=chat_id)
+
+    def is_empty(self) -> bool:
+        return not self.memories and not self.turns
+
+    @staticmethod
+    def render_turns(turns: Sequence[Tuple[str, str]]) -> str:
+        """
+        Renders (role, content) turns as "User: ..." / "Emzyking AI: ..." lines.
+        """
+        return "\n".join(
+            f"{'User' if role == 'user' else 'Emzyking AI'}: {content}" for role, content in turns
+        )
+
+    def render(self) -> str:
+        """
+        Renders memory and recent conversation as a multi-section string.
+        Does not include chat_id, so identical conversations render identically.
+        """
+        context_parts = []
+
+        if self.memories:
+            context_parts.append("🧠 Memory:")
+            for memory_type, content in self.memories:
+                context_parts.append(f"- ({memory_type}) {content}")
+            context_parts.append("")  # Add blank line after memory block
+
+        if self.turns:
+            context_parts.append("💬 Recent Conversation:")
+            context_parts.append(self.render_turns(self.turns))
+
+        return "\n".join(context_parts).strip()
+
+    def memory_section(self) -> str:
+        """
+        Returns the memory block that precedes the current request, or "" when
+        there are no memories. Memories are chosen per prompt, so they travel
+        with the request rather than in the cacheable history.
+        """
+        if not self.memories:
+            return ""
+        lines = [f"- ({memory_type}) {content}" for memory_type, content in self.memories]
+        return "🧠 Memory:\n" + "\n".join(lines) + "\n\n"
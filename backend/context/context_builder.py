@@ -1,63 +1,115 @@
 """
-This module builds a structured context string from historical data for use by
-the LLM or routing agents. It combines long-term memory (facts, preferences)
-with recent conversation history.
+This module builds the conversation context (a ChatContext) from historical
+data for use by the LLM or routing agents. It combines long-term memory (facts,
+preferences) with recent conversation history.
 
 Author: Emzyking AI
 """
 
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import db_models
+from backend.context.chat_context import ChatContext
+from backend.context.context_cache import context_cache, CONTEXT_CACHE_WINDOW
+from backend.context.token_budget import (
+    CONTEXT_TOKEN_BUDGET, estimate_tokens, fit_turns, select_memories
+)
 
 
-def build_context(chat_id: str, db: Session, max_messages: int = 5) -> str:
+async def load_session_context(
+    chat_id: str,
+    db: AsyncSession,
+    min_messages: int
+) -> Dict[str, List[Tuple[str, str]]]:
     """
-    Builds a context string for the LLM or RouterAgent based on:
-      1. Memory items (long-term knowledge like user preferences)
-      2. Most recent N chat messages (for short-term conversational flow)
+    Returns the session's memory items (newest first) and at least its last
+    min_messages messages (oldest first), from the context cache when possible.
 
     Args:
         chat_id (str): The unique chat session ID.
-        db (Session): SQLAlchemy session instance.
-        max_messages (int): Number of most recent messages to include (default: 5).
+        db (AsyncSession): SQLAlchemy async session, used on a cache miss.
+        min_messages (int): Number of recent messages the caller needs.
 
     Returns:
-        str: A multi-section context string formatted for LLM input.
+        Dict[str, List[Tuple[str, str]]]: {"memories": [(type, content)], "messages": [(role, content)]}
     """
+    cacheable = min_messages <= context_cache.window
+    if cacheable:
+        snapshot = await context_cache.get(chat_id)
+        if snapshot is not None:
+            return snapshot
+        # Taken before reading so a turn persisted meanwhile voids the put
+        token = await context_cache.reserve(chat_id)
 
-    context_parts = []
-
-    # === 1. Load memory store entries for this chat session ===
-    memories = (
-        db.query(db_models.MemoryStore)
-        .filter(db_models.MemoryStore.chat_id == chat_id)
+    memories = (await db.execute(
+        select(db_models.MemoryStore.memory_type, db_models.MemoryStore.content)
+        .where(db_models.MemoryStore.chat_id == chat_id)
         .order_by(db_models.MemoryStore.updated_at.desc())
-        .all()
-    )
+    )).all()
 
-    if memories:
-        context_parts.append("🧠 Memory:")
-        for mem in memories:
-            context_parts.append(f"- ({mem.memory_type}) {mem.content}")
-        context_parts.append("")  # Add blank line after memory block
-
-    # === 2. Load most recent chat messages ===
-    messages = (
-        db.query(db_models.ChatMessage)
-        .filter(db_models.ChatMessage.chat_id == chat_id)
+    # Load a full cache window so later turns can be served from the cache
+    messages = (await db.execute(
+        select(db_models.ChatMessage.role, db_models.ChatMessage.content)
+        .where(db_models.ChatMessage.chat_id == chat_id)
         .order_by(db_models.ChatMessage.id.desc())  # Get latest first
-        .limit(max_messages)
-        .all()
-    )
+        .limit(max(min_messages, context_cache.window))
+    )).all()
+
+    snapshot = {
+        "memories": [(mem.memory_type, mem.content) for mem in memories],
+        # Reverse to maintain chronological order (oldest → newest)
+        "messages": [(msg.role, msg.content) for msg in reversed(messages)],
+    }
+    if cacheable:
+        await context_cache.put(chat_id, snapshot["memories"], snapshot["messages"], token)
+    return snapshot
+
+
+async def build_context(
+    chat_id: str,
+    db: AsyncSession,
+    max_messages: int = CONTEXT_CACHE_WINDOW,
+    pending_prompt: Optional[str] = None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> ChatContext:
+    """
+    Builds the context for the LLM or RouterAgent based on:
+      1. Memory items (long-term knowledge like user preferences), capped by
+         relevance to the prompt and recency
+      2. As many recent chat messages as fit in the token budget, newest first,
+         with oversized code blocks elided
 
-    # Reverse to maintain chronological order (oldest → newest)
-    messages.reverse()
+    Args:
+        chat_id (str): The unique chat session ID.
+        db (AsyncSession): SQLAlchemy async session.
+        max_messages (int): Upper bound on stored messages considered (default: the cache window).
+        pending_prompt (str | None): Current user message that is not saved yet. It is
+            not added to the turns (agents send it separately) but ranks memories
+            and is counted against the budget.
+        token_budget (int): Estimated tokens available for context plus the pending prompt.
+
+    Returns:
+        ChatContext: Selected memories and turns with their estimated token count.
+    """
+
+    # Memory items and recent messages come from the context cache or the database
+    session_context = await load_session_context(chat_id, db, max_messages)
+    remaining = token_budget - (estimate_tokens(pending_prompt) if pending_prompt else 0)
 
-    if messages:
-        context_parts.append("💬 Recent Conversation:")
-        for msg in messages:
-            speaker = "User" if msg.role == "user" else "Emzyking AI"
-            context_parts.append(f"{speaker}: {msg.content}")
+    # === 1. Memory store entries for this chat session ===
+    memories = select_memories(session_context["memories"], pending_prompt)
+    memory_tokens = sum(estimate_tokens(content) for _, content in memories)
+    remaining -= memory_tokens
 
-    # Combine all parts
-    return "\n".join(context_parts).strip()
+    # === 2. Most recent chat messages that fit in the remaining budget ===
+    turns, turn_tokens = [], 0
+    if remaining > 0 and max_messages > 0:
+        turns, turn_tokens = fit_turns(session_context["messages"][-max_messages:], remaining)
+
+    return ChatContext(
+        chat_id=chat_id,
+        memories=memories,
+        turns=turns,
+        token_count=memory_tokens + turn_tokens,
+    )
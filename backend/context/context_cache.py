@@ -0,0 +1,402 @@
+"""
+This module caches the inputs of build_context per chat session: the session's
+memory items and a rolling window of its most recent messages. The cache is
+updated write-through when a turn is persisted or a memory is stored, so most
+turns assemble their context without querying the database.
+
+A snapshot loaded from the database is stored only if no write for the
+session reached the cache since the load began: the loader reserves a token
+first, every write-through invalidates outstanding tokens, and a put with a
+stale token is dropped. Otherwise a load racing a persisted turn could cache
+a window that is missing that turn.
+
+The default store is an in-process LRU, which is exact for a single worker.
+Deployments running several workers should use the Redis store so every
+worker sees the same window.
+
+Author: Emzyking AI
+"""
+
+import os
+import json
+import time
+import itertools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+from backend.log import get_logger
+
+load_dotenv()
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "memory")  # memory | redis
+CONTEXT_CACHE_REDIS_URL = os.getenv("CONTEXT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+CONTEXT_CACHE_MAX_SESSIONS = int(os.getenv("CONTEXT_CACHE_MAX_SESSIONS", "1024"))
+CONTEXT_CACHE_WINDOW = int(os.getenv("CONTEXT_CACHE_WINDOW", "20"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900"))
+
+logger = get_logger(__name__)
+
+# (memory_type, content) and (role, content) pairs
+MemoryItem = Tuple[str, str]
+MessageItem = Tuple[str, str]
+
+
+class ContextStore(ABC):
+    """
+    Storage for cached session context. A snapshot is
+    {"memories": newest-first memory items, "messages": oldest-first messages}.
+    Appends are no-ops for sessions that are not cached, apart from
+    invalidating any reserved token.
+    """
+
+    @abstractmethod
+    async def get(self, chat_id: str) -> Optional[Dict[str, List[Tuple[str, str]]]]:
+        ...
+
+    @abstractmethod
+    async def reserve(self, chat_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def put(self, chat_id: str, memories: Sequence[MemoryItem], messages: Sequence[MessageItem], token: int) -> None:
+        ...
+
+    @abstractmethod
+    async def append_messages(self, chat_id: str, messages: Sequence[MessageItem]) -> None:
+        ...
+
+    @abstractmethod
+    async def add_memory(self, chat_id: str, memory: MemoryItem) -> None:
+        ...
+
+    @abstractmethod
+    async def invalidate(self, chat_id: str) -> None:
+        ...
+
+
+class InMemoryContextStore(ContextStore):
+    """
+    Per-process LRU of session snapshots, bounded by session count and TTL.
+    """
+
+    def __init__(self, window: int, max_sessions: int, ttl_seconds: int):
+        self.window = window
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, List[Tuple[str, str]]]]]" = OrderedDict()
+        # Tokens of loads in progress, bounded like the entries
+        self._reserved: "OrderedDict[str, int]" = OrderedDict()
+        self._tokens = itertools.count(1)
+        self.evictions = 0
+
+    def _live(self, chat_id: str) -> Optional[Dict[str, List[Tuple[str, str]]]]:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            del self._entries[chat_id]
+            return None
+        self._entries.move_to_end(chat_id)
+        return snapshot
+
+    async def get(self, chat_id):
+        snapshot = self._live(chat_id)
+        if snapshot is None:
+            return None
+        return {"memories": list(snapshot["memories"]), "messages": list(snapshot["messages"])}
+
+    async def reserve(self, chat_id):
+        token = next(self._tokens)
+        self._reserved[chat_id] = token
+        self._reserved.move_to_end(chat_id)
+        while len(self._reserved) > self.max_sessions:
+            self._reserved.popitem(last=False)
+        return token
+
+    async def put(self, chat_id, memories, messages, token):
+        if self._reserved.pop(chat_id, None) != token:
+            return
+        snapshot = {"memories": list(memories), "messages": list(messages)[-self.window:]}
+        self._entries[chat_id] = (time.monotonic() + self.ttl_seconds, snapshot)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def append_messages(self, chat_id, messages):
+        self._reserved.pop(chat_id, None)
+        snapshot = self._live(chat_id)
+        if snapshot is not None:
+            snapshot["messages"] = (snapshot["messages"] + list(messages))[-self.window:]
+
+    async def add_memory(self, chat_id, memory):
+        self._reserved.pop(chat_id, None)
+        snapshot = self._live(chat_id)
+        if snapshot is not None:
+            snapshot["memories"].insert(0, tuple(memory))
+
+    async def invalidate(self, chat_id):
+        self._reserved.pop(chat_id, None)
+        self._entries.pop(chat_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisContextStore(ContextStore):
+    """
+    Shared store on a Redis-compatible server (redis.asyncio client API).
+
+    Each session uses two lists plus a marker key, all with the same TTL. The
+    marker is written last when a snapshot is stored and read together with
+    the lists, so a session whose marker is missing is treated as not cached.
+
+    A version counter, bumped by every write, serves as the reservation
+    token. A put is skipped if the counter has moved, reads it back in the
+    same transaction, and undoes itself if it moved meanwhile. A write that
+    finds the session uncached also clears it, in case a put committed after
+    the write checked.
+    """
+
+    def __init__(self, client, window: int, ttl_seconds: int, prefix: str = "emzyking:ctx:"):
+        self.client = client
+        self.window = window
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def _keys(self, chat_id: str) -> Tuple[str, str, str]:
+        base = f"{self.prefix}{chat_id}"
+        return f"{base}:loaded", f"{base}:memories", f"{base}:messages"
+
+    def _version_key(self, chat_id: str) -> str:
+        return f"{self.prefix}{chat_id}:version"
+
+    @staticmethod
+    def _current(version, token: int) -> bool:
+        return version is not None and int(version) == token
+
+    def _bump_version(self, pipe, chat_id: str) -> None:
+        version = self._version_key(chat_id)
+        pipe.incr(version)
+        pipe.expire(version, self.ttl_seconds)
+
+    @staticmethod
+    def _encode(item: Tuple[str, str]) -> str:
+        return json.dumps(list(item))
+
+    @staticmethod
+    def _decode(raw) -> Tuple[str, str]:
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        first, second = json.loads(raw)
+        return first, second
+
+    async def get(self, chat_id):
+        loaded, memories_key, messages_key = self._keys(chat_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.exists(loaded)
+        pipe.lrange(memories_key, 0, -1)
+        pipe.lrange(messages_key, 0, -1)
+        exists, memories, messages = await pipe.execute()
+        if not exists:
+            return None
+        return {
+            "memories": [self._decode(raw) for raw in memories],
+            "messages": [self._decode(raw) for raw in messages],
+        }
+
+    async def reserve(self, chat_id):
+        pipe = self.client.pipeline(transaction=True)
+        self._bump_version(pipe, chat_id)
+        token, _ = await pipe.execute()
+        return int(token)
+
+    async def put(self, chat_id, memories, messages, token):
+        loaded, memories_key, messages_key = self._keys(chat_id)
+        if not self._current(await self.client.get(self._version_key(chat_id)), token):
+            return
+        messages = list(messages)[-self.window:]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(loaded, memories_key, messages_key)
+        if memories:
+            pipe.rpush(memories_key, *[self._encode(m) for m in memories])
+            pipe.expire(memories_key, self.ttl_seconds)
+        if messages:
+            pipe.rpush(messages_key, *[self._encode(m) for m in messages])
+            pipe.expire(messages_key, self.ttl_seconds)
+        pipe.set(loaded, 1, ex=self.ttl_seconds)
+        pipe.get(self._version_key(chat_id))
+        *_, version = await pipe.execute()
+        if not self._current(version, token):
+            # A write landed since the snapshot was read from the database
+            await self.client.delete(loaded, memories_key, messages_key)
+
+    async def append_messages(self, chat_id, messages):
+        loaded, _, messages_key = self._keys(chat_id)
+        if not messages:
+            return
+        if not await self.client.exists(loaded):
+            await self._clear(chat_id)
+            return
+        pipe = self.client.pipeline(transaction=True)
+        self._bump_version(pipe, chat_id)
+        pipe.rpush(messages_key, *[self._encode(m) for m in messages])
+        pipe.ltrim(messages_key, -self.window, -1)
+        pipe.expire(messages_key, self.ttl_seconds)
+        pipe.expire(loaded, self.ttl_seconds)
+        await pipe.execute()
+
+    async def add_memory(self, chat_id, memory):
+        loaded, memories_key, _ = self._keys(chat_id)
+        if not await self.client.exists(loaded):
+            await self._clear(chat_id)
+            return
+        pipe = self.client.pipeline(transaction=True)
+        self._bump_version(pipe, chat_id)
+        pipe.lpush(memories_key, self._encode(memory))
+        pipe.expire(memories_key, self.ttl_seconds)
+        await pipe.execute()
+
+    async def invalidate(self, chat_id):
+        await self._clear(chat_id)
+
+    async def _clear(self, chat_id: str) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        self._bump_version(pipe, chat_id)
+        pipe.delete(*self._keys(chat_id))
+        await pipe.execute()
+
+
+class ContextCache:
+    """
+    Front for the configured ContextStore. Store errors are logged and treated
+    as misses so a cache outage never fails a turn.
+    """
+
+    def __init__(self, store: ContextStore, window: int = CONTEXT_CACHE_WINDOW, enabled: bool = CONTEXT_CACHE_ENABLED):
+        self.store = store
+        self.window = window
+        self.enabled = enabled
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, chat_id: str) -> Optional[Dict[str, List[Tuple[str, str]]]]:
+        """
+        Returns the cached {"memories", "messages"} snapshot for a session, or None.
+        """
+        if not self.enabled:
+            return None
+        try:
+            snapshot = await self.store.get(chat_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Context cache read failed", extra={"chat_id": chat_id, "error": str(e)})
+            return None
+        if snapshot is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return snapshot
+
+    async def reserve(self, chat_id: str) -> Optional[int]:
+        """
+        Returns a token to pass to put() for a snapshot about to be read from
+        the database, or None if the snapshot should not be cached.
+        """
+        if not self.enabled:
+            return None
+        try:
+            return await self.store.reserve(chat_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Context cache write failed", extra={"method": "reserve", "error": str(e)})
+            return None
+
+    async def put(
+        self,
+        chat_id: str,
+        memories: Sequence[MemoryItem],
+        messages: Sequence[MessageItem],
+        token: Optional[int]
+    ) -> None:
+        """
+        Stores a snapshot freshly loaded from the database, unless the session
+        was written to since the token was reserved.
+        """
+        if token is not None:
+            await self._call("put", chat_id, memories, messages, token)
+
+    async def append_messages(self, chat_id: str, messages: Sequence[MessageItem]) -> None:
+        """
+        Write-through for newly persisted messages of a cached session.
+        """
+        await self._call("append_messages", chat_id, messages)
+
+    async def add_memory(self, chat_id: str, memory_type: str, content: str) -> None:
+        """
+        Write-through for a newly stored memory of a cached session.
+        """
+        await self._call("add_memory", chat_id, (memory_type, content))
+
+    async def invalidate(self, chat_id: str) -> None:
+        await self._call("invalidate", chat_id)
+
+    async def _call(self, method: str, *args: Any) -> None:
+        if not self.enabled:
+            return
+        try:
+            await getattr(self.store, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Context cache write failed", extra={"method": method, "error": str(e)})
+            # Drop the entry rather than leave it stale
+            if method != "invalidate":
+                try:
+                    await self.store.invalidate(args[0])
+                except Exception:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit, miss, and error counters for the context cache.
+        """
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "window": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+        if isinstance(self.store, InMemoryContextStore):
+            stats.update(size=len(self.store), max_sessions=self.store.max_sessions, evictions=self.store.evictions)
+        return stats
+
+
+def create_context_store(backend: str = CONTEXT_CACHE_BACKEND) -> ContextStore:
+    """
+    Builds the store selected by CONTEXT_CACHE_BACKEND.
+    """
+    if backend == "redis":
+        import redis.asyncio as redis  # optional dependency, only needed for this backend
+
+        client = redis.Redis.from_url(CONTEXT_CACHE_REDIS_URL)
+        return RedisContextStore(client, CONTEXT_CACHE_WINDOW, CONTEXT_CACHE_TTL_SECONDS)
+
+    if backend != "memory":
+        raise ValueError(f"Unknown CONTEXT_CACHE_BACKEND: {backend}")
+
+    return InMemoryContextStore(CONTEXT_CACHE_WINDOW, CONTEXT_CACHE_MAX_SESSIONS, CONTEXT_CACHE_TTL_SECONDS)
+
+
+# Shared context cache used by build_context, continue_chat and MemoryAgent
+context_cache = ContextCache(create_context_store())
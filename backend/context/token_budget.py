@@ -0,0 +1,164 @@
+"""
+This module keeps conversation context within a token budget. Token counts
+are estimated locally (no tokenizer round-trip), oversized code blocks and
+messages are elided down to their head and tail, recent turns are added newest
+first until the budget is spent, and memory items are capped by relevance to
+the current prompt and then recency.
+
+Author: Emzyking AI
+"""
+
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+from backend.utils import tokenize_keywords
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_MEMORY_TOKEN_BUDGET = int(os.getenv("CONTEXT_MEMORY_TOKEN_BUDGET", "300"))
+CONTEXT_MAX_MEMORIES = int(os.getenv("CONTEXT_MAX_MEMORIES", "10"))
+CONTEXT_MAX_BLOCK_TOKENS = int(os.getenv("CONTEXT_MAX_BLOCK_TOKENS", "400"))
+CONTEXT_MAX_MESSAGE_TOKENS = int(os.getenv("CONTEXT_MAX_MESSAGE_TOKENS", "800"))
+
+# Gemini and most BPE tokenizers average roughly four characters per token
+# for English and source code
+CHARS_PER_TOKEN = 4
+
+_CODE_BLOCK = re.compile(r"(```[^\n]*\n)(.*?)(```|\Z)", re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Returns an approximate token count for text. Runs in O(1).
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _elide_middle(text: str, max_tokens: int) -> str:
+    """
+    Keeps the head and tail of text so it fits in about max_tokens, replacing
+    the middle with a marker saying how many lines were left out.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    keep_chars = max(max_tokens, 1) * CHARS_PER_TOKEN
+    head = text[: keep_chars * 2 // 3]
+    tail = text[len(text) - keep_chars // 3:]
+
+    # Cut on line boundaries so code stays readable
+    if "\n" in head:
+        head = head[: head.rfind("\n") + 1]
+    if "\n" in tail:
+        tail = tail[tail.find("\n") + 1:]
+
+    omitted_lines = text.count("\n", len(head), len(text) - len(tail)) + 1
+    return f"{head}… [{omitted_lines} lines elided] …\n{tail}"
+
+
+def elide_code_blocks(text: str, max_block_tokens: int = CONTEXT_MAX_BLOCK_TOKENS) -> str:
+    """
+    Shortens fenced code blocks longer than max_block_tokens to their first
+    and last lines. Text outside code blocks is left as is.
+    """
+    if "```" not in text:
+        return text
+
+    def shorten(match: "re.Match[str]") -> str:
+        opening, body, closing = match.groups()
+        if estimate_tokens(body) <= max_block_tokens:
+            return match.group(0)
+        body = _elide_middle(body, max_block_tokens)
+        if closing and not body.endswith("\n"):
+            body += "\n"
+        return opening + body + closing
+
+    return _CODE_BLOCK.sub(shorten, text)
+
+
+def compact_message(
+    text: str,
+    max_block_tokens: int = CONTEXT_MAX_BLOCK_TOKENS,
+    max_message_tokens: int = CONTEXT_MAX_MESSAGE_TOKENS
+) -> str:
+    """
+    Elides oversized code blocks, then caps the whole message (e.g. an
+    unfenced pasted file) at max_message_tokens.
+    """
+    text = elide_code_blocks(text, max_block_tokens)
+    return _elide_middle(text, max_message_tokens)
+
+
+def select_memories(
+    memories: Sequence[Tuple[str, str]],
+    prompt: Optional[str] = None,
+    max_items: int = CONTEXT_MAX_MEMORIES,
+    token_budget: int = CONTEXT_MEMORY_TOKEN_BUDGET
+) -> List[Tuple[str, str]]:
+    """
+    Picks the memory items to include: those sharing keywords with the prompt
+    first, then the most recent, up to max_items and token_budget.
+
+    Args:
+        memories (Sequence[Tuple[str, str]]): (memory_type, content), newest first.
+        prompt (str | None): Current user prompt, used to rank relevance.
+        max_items (int): Maximum number of memories.
+        token_budget (int): Maximum estimated tokens across included memories.
+
+    Returns:
+        List[Tuple[str, str]]: Selected memories, most relevant first.
+    """
+    prompt_terms = set(tokenize_keywords(prompt)) if prompt else set()
+
+    def relevance(item: Tuple[int, Tuple[str, str]]) -> Tuple[int, int]:
+        recency, (_, content) = item
+        overlap = len(prompt_terms.intersection(tokenize_keywords(content))) if prompt_terms else 0
+        return -overlap, recency
+
+    selected, used = [], 0
+    for _, memory in sorted(enumerate(memories), key=relevance):
+        if len(selected) >= max_items:
+            break
+        cost = estimate_tokens(memory[1])
+        if used + cost > token_budget:
+            continue
+        selected.append(memory)
+        used += cost
+    return selected
+
+
+def fit_turns(
+    turns: Sequence[Tuple[str, str]],
+    token_budget: int,
+    max_block_tokens: int = CONTEXT_MAX_BLOCK_TOKENS,
+    max_message_tokens: int = CONTEXT_MAX_MESSAGE_TOKENS
+) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    Compacts each turn and keeps the newest turns that fit in token_budget.
+    The budget applies to every turn, the newest included: the pending prompt
+    is counted separately by the caller, so a stored turn that does not fit
+    on its own is left out rather than overrunning the budget.
+
+    Args:
+        turns (Sequence[Tuple[str, str]]): (role, content), oldest first.
+        token_budget (int): Estimated tokens available for the turns.
+
+    Returns:
+        Tuple[List[Tuple[str, str]], int]: Kept turns (oldest first) and their estimated tokens.
+    """
+    kept: List[Tuple[str, str]] = []
+    used = 0
+
+    for role, content in reversed(turns):
+        content = compact_message(content, max_block_tokens, max_message_tokens)
+        cost = estimate_tokens(content)
+        if used + cost > token_budget:
+            break
+        kept.append((role, content))
+        used += cost
+
+    kept.reverse()
+    return kept, used
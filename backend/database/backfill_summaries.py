@@ -0,0 +1,85 @@
+"""
+Script to populate ChatSession.summary and ChatSession.keyword_counts for
+sessions created before summaries were maintained incrementally. It replays
+each session's user messages through the same keyword sketch used by
+/continue-chat, processing sessions in batches.
+
+Usage:
+    python -m backend.database.backfill_summaries            # only sessions without a summary
+    python -m backend.database.backfill_summaries --all      # recompute every session
+"""
+
+import argparse
+from collections import defaultdict
+
+from backend.database.db_connection import SessionLocal
+from backend.database import db_models
+from backend.log import get_logger
+from backend.utils import update_keyword_sketch, summarize_keyword_sketch
+
+logger = get_logger(__name__)
+
+
+def backfill_summaries(batch_size: int = 500, recompute_all: bool = False) -> int:
+    """
+    Rebuilds keyword summaries in batches of sessions.
+
+    Args:
+        batch_size (int): Number of sessions loaded and committed per batch.
+        recompute_all (bool): Recompute sessions that already have a summary.
+
+    Returns:
+        int: Number of sessions updated.
+    """
+    db = SessionLocal()
+    updated = 0
+    last_id = 0
+
+    try:
+        while True:
+            query = db.query(db_models.ChatSession).filter(db_models.ChatSession.id > last_id)
+            if not recompute_all:
+                query = query.filter(db_models.ChatSession.summary.is_(None))
+
+            sessions = query.order_by(db_models.ChatSession.id).limit(batch_size).all()
+            if not sessions:
+                break
+
+            user_messages = defaultdict(list)
+            rows = (
+                db.query(db_models.ChatMessage.chat_id, db_models.ChatMessage.content)
+                .filter(
+                    db_models.ChatMessage.chat_id.in_([s.chat_id for s in sessions]),
+                    db_models.ChatMessage.role == "user",
+                )
+                .order_by(db_models.ChatMessage.id)
+            )
+            for chat_id, content in rows:
+                user_messages[chat_id].append(content or "")
+
+            for session in sessions:
+                sketch = {}
+                for content in user_messages.get(session.chat_id, []):
+                    sketch = update_keyword_sketch(sketch, content)
+                session.keyword_counts = sketch
+                session.summary = summarize_keyword_sketch(sketch)
+
+            db.commit()
+            updated += len(sessions)
+            last_id = sessions[-1].id
+            logger.info("Backfilled chat sessions", extra={"updated": updated})
+
+        return updated
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill chat session keyword summaries.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--all", action="store_true", help="Recompute summaries that already exist.")
+    args = parser.parse_args()
+
+    total = backfill_summaries(batch_size=args.batch_size, recompute_all=args.all)
+    logger.info("Backfill complete", extra={"updated": total})
@@ -5,12 +5,15 @@ This is typically run once during setup or migrations to bootstrap the schema.
 
 from backend.database.db_connection import engine, Base
 from backend.database import db_models  # Ensure all models are imported so SQLAlchemy picks them up
+from backend.log import get_logger
+
+logger = get_logger(__name__)
 
 def initialize_tables():
     """Create all tables in the database based on the SQLAlchemy models."""
-    print("Creating database tables...")
+    logger.info("Creating database tables")
     Base.metadata.create_all(bind=engine)
-    print("Tables created successfully.")
+    logger.info("Tables created")
 
 if __name__ == "__main__":
     initialize_tables()
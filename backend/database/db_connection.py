@@ -1,8 +1,11 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from backend.database.pool_metrics import PoolMetrics, TimedAsyncAdaptedQueuePool, TimedQueuePool
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,11 +16,78 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in your environment variables.")
 
-# Create the SQLAlchemy engine
+# Async drivers used by the API for each backend
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Converts a sync database URL (e.g. postgresql:// or postgresql+psycopg2://)
+    into its async-driver equivalent (postgresql+asyncpg://, sqlite+aiosqlite://).
+
+    Args:
+        url (str): Database URL as used by the sync engine and Alembic.
+
+    Returns:
+        str: URL for create_async_engine.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+
+    if driver is None or parsed.get_driver_name() == driver:
+        return parsed.render_as_string(hide_password=False)
+
+    parsed = parsed.set(drivername=f"{backend}+{driver}")
+
+    # asyncpg takes "ssl" rather than libpq's "sslmode"
+    if driver == "asyncpg" and "sslmode" in parsed.query:
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+
+    return parsed.render_as_string(hide_password=False)
+
+
+# Optional override, otherwise derived from DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Connection pool settings, applied per engine and per worker process.
+# Pre-ping costs a round-trip per checkout; with it off, rely on DB_POOL_RECYCLE
+# (set below the server's idle timeout) to retire stale connections instead.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+def pool_options(url: str, pool_class) -> dict:
+    """
+    Returns the create_engine pool arguments for a database URL. SQLite keeps
+    SQLAlchemy's default pool, which does not take sizing arguments.
+    """
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            poolclass=pool_class,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+# Pool telemetry, reported by /debug/db-pool
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+# Create the SQLAlchemy engine (sync: Alembic, create_tables, scripts, thread-offloaded work)
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    pool_pre_ping=True
+    **pool_options(DATABASE_URL, TimedQueuePool)
 )
 
 # Create a configured session factory
@@ -27,6 +97,24 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Async engine used by the FastAPI endpoints and agents
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **pool_options(ASYNC_DATABASE_URL, TimedAsyncAdaptedQueuePool)
+)
+
+for _engine, _metrics in [(engine, sync_pool_metrics), (async_engine.sync_engine, async_pool_metrics)]:
+    _metrics.attach(_engine)
+    _engine.pool.metrics = _metrics
+
+# Objects stay readable after commit, since async sessions cannot lazy-load
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base class for declaring ORM models
 Base = declarative_base()
 
@@ -36,4 +124,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async dependency for retrieving DB session in routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index, func
 from sqlalchemy.orm import relationship
 from backend.database.db_connection import Base
 
@@ -10,6 +10,11 @@ class ChatSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(String, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    summary = Column(String, nullable=True)  # Keyword summary shown in chat listings
+    keyword_counts = Column(JSON, nullable=True)  # Bounded term-frequency sketch behind the summary
+
+    # Keyset pagination in /all-chat-history orders by (created_at, id)
+    __table_args__ = (Index("ix_chat_sessions_created_at_id", "created_at", "id"),)
 
     # One-to-many relationship with chat messages
     messages = relationship("ChatMessage", back_populates="chat_session", cascade="all, delete-orphan")
@@ -28,6 +33,9 @@ class ChatMessage(Base):
     content = Column(Text)  # Raw message content
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # History and context queries filter by chat_id and order by id
+    __table_args__ = (Index("ix_chat_messages_chat_id_id", "chat_id", "id"),)
+
     # Link back to session
     chat_session = relationship("ChatSession", back_populates="messages")
 
@@ -81,6 +89,9 @@ class MemoryStore(Base):
     content = Column(Text)  # Stored memory content
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    # Memory lookups filter by chat_id and order by updated_at
+    __table_args__ = (Index("ix_memory_store_chat_id_updated_at", "chat_id", "updated_at"),)
+
     # Link to session
     chat_session = relationship("ChatSession", back_populates="memories")
 
@@ -90,7 +101,7 @@ class AgentFeedback(Base):
     __tablename__ = "agent_feedback"
 
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("chat_messages.id"), nullable=False)  # The assistant's message
+    message_id = Column(Integer, ForeignKey("chat_messages.id"), nullable=False, index=True)  # The assistant's message
     agent_name = Column(String, nullable=False)  # Name of agent who generated the reply
     rating = Column(Integer, nullable=False)  # e.g., 1–5 scale
     comments = Column(Text, nullable=True)
@@ -98,3 +109,40 @@ class AgentFeedback(Base):
 
     # Relationship back to the message
     message = relationship("ChatMessage", back_populates="feedback_entries")
+
+
+# Cached agent responses shared across workers (persistent tier of the response cache)
+class ResponseCacheEntry(Base):
+    __tablename__ = "llm_response_cache"
+
+    cache_key = Column(String, primary_key=True)  # Digest of agent, normalized prompt, model, and context
+    agent_name = Column(String)  # Agent that produced the response
+    model_name = Column(String)  # Model used to generate it
+    response = Column(Text)  # Cached response text
+    thought = Column(JSON, nullable=True)  # Cached agent thought
+    tool_calls = Column(JSON, nullable=True)  # Cached tool usage metadata
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), index=True)  # Entry is ignored after this time
+
+
+# Background generation jobs, claimed by job workers (see backend.job_queue)
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True)  # UUID returned to the client
+    kind = Column(String, nullable=False)  # 'generate-code' or 'continue-chat'
+    chat_id = Column(String, nullable=True)  # Chat session for 'continue-chat' jobs
+    prompt = Column(Text, nullable=False)
+    webhook_url = Column(String, nullable=True)  # Notified with the job once it finishes
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    result = Column(JSON, nullable=True)  # Same payload the synchronous endpoint returns
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String, nullable=True)  # Worker holding the lease
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # A running job past this is reclaimed
+
+    # Workers look for the oldest claimable job
+    __table_args__ = (Index("ix_generation_jobs_status_created_at", "status", "created_at"),)
@@ -0,0 +1,134 @@
+"""
+This module collects connection pool telemetry (checkouts, overflow, time spent
+waiting for a connection) so the number of uvicorn workers and the pool size
+can be sized against what the database allows.
+
+Author: Emzyking AI
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """
+    Counters for one engine's pool. Checkout/checkin counts come from pool
+    events; wait time comes from the Timed* pool classes below.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+
+        # Counters
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def attach(self, engine) -> None:
+        """
+        Starts recording for a sync Engine (pass async_engine.sync_engine for async engines).
+        """
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, *_):
+        self.connects += 1
+
+    def _on_checkout(self, *_):
+        self.checkouts += 1
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool):
+            self.peak_checked_out = max(self.peak_checked_out, pool.checkedout())
+            self.peak_overflow = max(self.peak_overflow, pool.overflow())
+
+    def _on_checkin(self, *_):
+        self.checkins += 1
+
+    def _on_invalidate(self, *_):
+        self.invalidations += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        if timed_out:
+            self.timeouts += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns live pool occupancy plus cumulative counters.
+        """
+        pool = self.engine.pool if self.engine is not None else None
+        live: Dict[str, Optional[int]] = {"size": None, "checked_out": None, "checked_in": None, "overflow": None}
+
+        if isinstance(pool, QueuePool):
+            live = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            }
+
+        return {
+            "engine": self.name,
+            "pool_class": type(pool).__name__ if pool is not None else None,
+            **live,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "peak_checked_out": self.peak_checked_out,
+            "peak_overflow": self.peak_overflow,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "avg_wait_ms": self.wait_seconds_total / self.waits * 1000 if self.waits else 0.0,
+        }
+
+
+class _TimedGetMixin:
+    """
+    Times every connection acquisition, including time queued behind a full pool.
+    """
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting to the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class TimedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
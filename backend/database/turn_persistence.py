@@ -0,0 +1,106 @@
+"""
+This module persists a complete chat turn — the user message, the assistant
+reply, its thought and any tool usages, plus the session's keyword summary —
+in a single transaction. Both messages are written with one multi-row
+INSERT ... RETURNING, so no flush/refresh round-trips are needed to learn
+their ids.
+
+Author: Emzyking AI
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import tracing
+from backend.database import db_models
+from backend.context.context_cache import context_cache
+from backend.utils import update_keyword_sketch, summarize_keyword_sketch
+
+
+@dataclass
+class PersistedTurn:
+    """Ids of the rows written for one turn."""
+    user_message_id: int
+    assistant_message_id: Optional[int] = None
+
+
+async def persist_turn(
+    db: AsyncSession,
+    chat_session: db_models.ChatSession,
+    user_prompt: str,
+    response_text: Optional[str] = None,
+    thought: Optional[Dict[str, Any]] = None,
+    tool_calls: Optional[List[Dict[str, Any]]] = None
+) -> PersistedTurn:
+    """
+    Writes one turn and commits once. When response_text is None only the
+    user message is stored (e.g. the reply failed mid-stream).
+
+    Args:
+        db (AsyncSession): SQLAlchemy async session; committed on success, rolled back on error.
+        chat_session (ChatSession): Session the turn belongs to.
+        user_prompt (str): The user's message.
+        response_text (str | None): The assistant's reply.
+        thought (Dict | None): Optional agent thought for the reply.
+        tool_calls (List[Dict] | None): Optional tool usages for the reply.
+
+    Returns:
+        PersistedTurn: Ids of the inserted messages.
+    """
+    try:
+        # Lock the session row only for the write so concurrent turns do not
+        # lose keyword summary updates
+        await db.refresh(chat_session, with_for_update=True)
+        chat_session.keyword_counts = update_keyword_sketch(chat_session.keyword_counts, user_prompt)
+        chat_session.summary = summarize_keyword_sketch(chat_session.keyword_counts)
+
+        rows = [{"chat_id": chat_session.chat_id, "role": "user", "content": user_prompt}]
+        if response_text is not None:
+            rows.append({"chat_id": chat_session.chat_id, "role": "assistant", "content": response_text})
+
+        # Roles are distinct within a turn, so ids are matched by role rather
+        # than by forcing RETURNING order (which splits the insert on SQLite)
+        with tracing.span("db.insert_messages", messages=len(rows)):
+            result = await db.execute(
+                insert(db_models.ChatMessage).returning(db_models.ChatMessage.id, db_models.ChatMessage.role),
+                rows
+            )
+        message_ids = {role: message_id for message_id, role in result}
+
+        turn = PersistedTurn(user_message_id=message_ids["user"])
+
+        if response_text is not None:
+            turn.assistant_message_id = message_ids["assistant"]
+
+            if thought:
+                await db.execute(insert(db_models.AgentThought), [{
+                    "message_id": turn.assistant_message_id,
+                    "reasoning": thought.get("reasoning"),
+                    "tool_invoked": thought.get("tool_invoked"),
+                    "observation": thought.get("observation"),
+                }])
+
+            if tool_calls:
+                await db.execute(insert(db_models.ToolUsage), [
+                    {
+                        "message_id": turn.assistant_message_id,
+                        "tool_name": tool.get("tool_name"),
+                        "input_params": tool.get("input"),
+                        "output_result": tool.get("output"),
+                    }
+                    for tool in tool_calls
+                ])
+
+        with tracing.span("db.commit"):
+            await db.commit()
+
+    except Exception:
+        await db.rollback()
+        raise
+
+    # Keep a cached context window in step with what was just committed
+    await context_cache.append_messages(chat_session.chat_id, [(row["role"], row["content"]) for row in rows])
+    return turn
@@ -1,49 +1,60 @@
 """
 This module manages feedback from users about agent responses.
-Feedback includes approval/disapproval and optional comments, which
-can later be used to refine agent routing or retrain models.
+Feedback includes a 1-5 rating and optional comments, which can later
+be used to refine agent routing or retrain models.
 
 Author: Emzyking AI
 """
 
-from sqlalchemy.orm import Session
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import db_models
+from backend.log import get_logger
 from backend.schemas import FeedbackRequest
 
+logger = get_logger(__name__)
 
-def save_feedback_from_request(request: FeedbackRequest, db: Session) -> bool:
+# Stored when the client does not say which agent produced the message
+UNKNOWN_AGENT = "unknown"
+
+
+async def save_feedback_from_request(request: FeedbackRequest, db: AsyncSession) -> bool:
     """
     Saves user feedback from a validated Pydantic request object.
 
     Args:
-        request (FeedbackRequest): Feedback input including message ID, approval, and comment.
-        db (Session): SQLAlchemy database session.
+        request (FeedbackRequest): Feedback input including message ID, rating, and comment.
+        db (AsyncSession): SQLAlchemy async session.
 
     Returns:
         bool: True if feedback is saved successfully, False otherwise.
     """
-    return save_feedback(
+    return await save_feedback(
         message_id=request.message_id,
-        is_approved=request.is_approved,
+        rating=request.rating,
         user_comment=request.comment,
+        agent_name=request.agent_name,
         db=db
     )
 
 
-def save_feedback(
+async def save_feedback(
     message_id: int,
-    is_approved: bool,
-    user_comment: str,
-    db: Session
+    rating: int,
+    user_comment: Optional[str],
+    db: AsyncSession,
+    agent_name: Optional[str] = None
 ) -> bool:
     """
     Saves user feedback for a specific assistant message.
 
     Args:
         message_id (int): ID of the ChatMessage being reviewed.
-        is_approved (bool): Whether the user approved the response.
-        user_comment (str): Optional feedback or clarification from the user.
-        db (Session): SQLAlchemy session.
+        rating (int): The user's rating of the response, 1 to 5.
+        user_comment (str | None): Optional feedback or clarification from the user.
+        db (AsyncSession): SQLAlchemy async session.
+        agent_name (str | None): Agent that produced the message, if the client knows it.
 
     Returns:
         bool: True if feedback saved successfully, False otherwise.
@@ -51,39 +62,39 @@ def save_feedback(
     try:
         feedback = db_models.AgentFeedback(
             message_id=message_id,
-            is_approved=is_approved,
-            comment=user_comment or ""
+            agent_name=agent_name or UNKNOWN_AGENT,
+            rating=rating,
+            comments=user_comment
         )
         db.add(feedback)
-        db.commit()
+        await db.commit()
         return True
-    except Exception as e:
-        db.rollback()
-        print(f"[Feedback Error] {e}")
+    except Exception:
+        await db.rollback()
+        logger.exception("Saving feedback failed", extra={"message_id": message_id})
         return False
 
 
-def get_feedback_summary(message_id: int, db: Session) -> dict:
+async def get_feedback_summary(message_id: int, db: AsyncSession) -> dict:
     """
     Retrieves all feedback entries for a given message.
 
     Args:
         message_id (int): The ChatMessage ID for which feedback is needed.
-        db (Session): SQLAlchemy session.
+        db (AsyncSession): SQLAlchemy async session.
 
     Returns:
-        dict: Feedback breakdown including counts and comments.
+        dict: Feedback breakdown including rating count, average, and comments.
     """
-    feedback_entries = db.query(db_models.AgentFeedback).filter(
-        db_models.AgentFeedback.message_id == message_id
-    ).all()
+    feedback_entries = (await db.execute(
+        select(db_models.AgentFeedback).where(db_models.AgentFeedback.message_id == message_id)
+    )).scalars().all()
 
-    approved = [f for f in feedback_entries if f.is_approved]
-    disapproved = [f for f in feedback_entries if not f.is_approved]
+    ratings = [f.rating for f in feedback_entries]
 
     return {
         "message_id": message_id,
-        "approved_count": len(approved),
-        "disapproved_count": len(disapproved),
-        "comments": [f.comment for f in feedback_entries if f.comment]
+        "ratings_count": len(ratings),
+        "average_rating": sum(ratings) / len(ratings) if ratings else None,
+        "comments": [f.comments for f in feedback_entries if f.comments]
     }
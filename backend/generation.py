@@ -0,0 +1,99 @@
+"""
+This module holds the generation flows behind /generate-code and
+/continue-chat, so the endpoints and the background job workers (see
+backend.job_queue) produce the same replies and payloads.
+
+Author: Emzyking AI
+"""
+
+import uuid
+from typing import Any, Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import tracing
+from backend.agent_registry import router_agent
+from backend.context.context_builder import build_context
+from backend.database import db_models
+from backend.database.turn_persistence import persist_turn
+from backend.log import get_logger
+
+logger = get_logger(__name__)
+
+
+async def load_chat_session(db: AsyncSession, chat_id: str) -> Optional[db_models.ChatSession]:
+    """
+    Looks up a chat session by its public ID.
+    """
+    with tracing.span("db.session_lookup"):
+        return await db.scalar(select(db_models.ChatSession).where(db_models.ChatSession.chat_id == chat_id))
+
+
+async def generate_code(prompt: str) -> Dict[str, Any]:
+    """
+    Routes a one-off prompt.
+
+    Args:
+        prompt (str): The user's coding request.
+
+    Returns:
+        Dict[str, Any]: {"code": reply}.
+    """
+    result, _, _, _, _ = await router_agent.route(chat_id=str(uuid.uuid4()), user_input=prompt)
+    return {"code": result}
+
+
+async def save_user_message(db: AsyncSession, chat_session: db_models.ChatSession, prompt: str) -> None:
+    """
+    Saves just the user's message of a turn whose reply failed. Errors are
+    logged, not raised, so the original failure is the one reported.
+    """
+    try:
+        await persist_turn(db, chat_session, prompt)
+    except Exception:
+        logger.exception("Saving the user message failed", extra={"chat_id": chat_session.chat_id})
+
+
+async def continue_chat(db: AsyncSession, chat_session: db_models.ChatSession, prompt: str) -> Dict[str, Any]:
+    """
+    Answers the next message of a chat and saves the turn. The turn is
+    written in one transaction after the reply; if routing or that write
+    fails, the user's message is still saved on its own before the error
+    is raised.
+
+    Args:
+        db (AsyncSession): SQLAlchemy async session.
+        chat_session (ChatSession): The chat the message belongs to.
+        prompt (str): The user's message.
+
+    Returns:
+        Dict[str, Any]: Reply, thought, tools used, routed agent and confidence.
+    """
+    chat_id = chat_session.chat_id
+    with tracing.span("context.build"):
+        context = await build_context(chat_id, db, pending_prompt=prompt)
+
+    # Return the connection to the pool while the model is generating
+    await db.commit()
+
+    try:
+        response_text, thought, tool_calls, agent_name, confidence = await router_agent.route(
+            chat_id=chat_id, user_input=prompt, context=context
+        )
+
+        # User message, reply, thought and tool usages are written in one transaction
+        with tracing.span("db.persist_turn"):
+            await persist_turn(db, chat_session, prompt, response_text, thought, tool_calls)
+    except Exception:
+        # persist_turn rolls back on error, so this does not duplicate the message
+        await save_user_message(db, chat_session, prompt)
+        raise
+
+    return {
+        "chat_id": chat_id,
+        "response": response_text,
+        "agent_thought": thought,
+        "tools_used": tool_calls,
+        "routed_agent": agent_name,
+        "confidence_score": confidence
+    }
@@ -0,0 +1,479 @@
+"""
+This module runs long generations as background jobs. /generate-code and
+/continue-chat enqueue a row in the generation_jobs table and return its id
+at once; job workers claim queued rows, run the same generation flow as the
+synchronous endpoints, store the result, and optionally POST it to a
+webhook. Clients read the job with GET /jobs/{id}, optionally long-polling.
+
+The database is the broker, so API processes and workers scale
+independently: every API process runs JOB_WORKERS workers (0 to only
+enqueue), and more can be started on their own with
+
+    python -m backend.job_queue
+
+A worker claims a job with a conditional UPDATE, so two workers never run
+the same job, and holds it under a lease that it renews while the job runs.
+Jobs whose worker stopped are picked up again once the lease expires, up to
+JOB_MAX_ATTEMPTS times; a worker that loses its lease stops the job and
+cannot overwrite the result of the worker that took it over.
+
+Webhook URLs come from clients, so they must be https and resolve to public
+addresses (or name a host in JOB_WEBHOOK_ALLOWED_HOSTS); the worker checks
+them again before posting and does not follow redirects.
+
+Author: Emzyking AI
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import ipaddress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import requests
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import db_models
+from backend.database.db_connection import AsyncSessionLocal
+from backend import generation, tracing
+from backend.log import get_logger
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_LONG_POLL_MAX_SECONDS = float(os.getenv("JOB_LONG_POLL_MAX_SECONDS", "30"))
+JOB_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("JOB_WEBHOOK_TIMEOUT_SECONDS", "10"))
+# Comma-separated hosts webhooks may be sent to; empty allows any public host
+JOB_WEBHOOK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+
+logger = get_logger(__name__)
+
+GENERATE_CODE = "generate-code"
+CONTINUE_CHAT = "continue-chat"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+Job = db_models.GenerationJob
+
+# Wakes this process's idle workers when a job is enqueued here
+_job_enqueued = asyncio.Event()
+# Long-polls in this process per job, woken when the job finishes here
+_job_waiters: Dict[str, Set[asyncio.Event]] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def job_payload(job: db_models.GenerationJob) -> Dict[str, Any]:
+    """
+    Returns the client-facing view of a job (GET /jobs/{id} and webhooks).
+    """
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "chat_id": job.chat_id,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class WebhookURLError(ValueError):
+    """
+    Raised for a webhook URL the workers will not post to.
+    """
+
+
+def check_webhook_url(url: str) -> None:
+    """
+    Checks that a webhook URL is safe to POST to from inside the deployment:
+    https, and either an allowed host or a host whose every address is
+    public (not private, loopback, link-local or otherwise reserved).
+    Resolves the host, so call it off the event loop.
+
+    Raises:
+        WebhookURLError: If the URL is not allowed.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise WebhookURLError("webhook_url must be an https URL.")
+    if parts.username or parts.password:
+        raise WebhookURLError("webhook_url must not contain credentials.")
+
+    host = parts.hostname.lower()
+    if JOB_WEBHOOK_ALLOWED_HOSTS:
+        if host not in JOB_WEBHOOK_ALLOWED_HOSTS:
+            raise WebhookURLError(f"webhook_url host '{host}' is not allowed.")
+        return
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise WebhookURLError(f"webhook_url host '{host}' does not resolve.")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise WebhookURLError(f"webhook_url host '{host}' resolves to a non-public address.")
+
+
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    prompt: str,
+    chat_id: Optional[str] = None,
+    webhook_url: Optional[str] = None
+) -> db_models.GenerationJob:
+    """
+    Stores a new queued job and wakes a local worker.
+
+    Args:
+        db (AsyncSession): SQLAlchemy async session; committed here.
+        kind (str): GENERATE_CODE or CONTINUE_CHAT.
+        prompt (str): The user's prompt.
+        chat_id (str | None): Chat session for CONTINUE_CHAT jobs.
+        webhook_url (str | None): URL to POST the finished job to.
+
+    Returns:
+        GenerationJob: The queued job.
+
+    Raises:
+        WebhookURLError: If webhook_url is not allowed.
+    """
+    if webhook_url:
+        await asyncio.to_thread(check_webhook_url, webhook_url)
+
+    job = Job(
+        id=str(uuid.uuid4()), kind=kind, prompt=prompt, chat_id=chat_id,
+        webhook_url=webhook_url, status=QUEUED, attempts=0, created_at=_now()
+    )
+    db.add(job)
+    await db.commit()
+    _job_enqueued.set()
+    return job
+
+
+async def get_job(job_id: str) -> Optional[db_models.GenerationJob]:
+    """
+    Reads the current state of a job, or None if it does not exist.
+    """
+    async with AsyncSessionLocal() as db:
+        return await db.get(Job, job_id)
+
+
+async def wait_for_job(job_id: str, wait_seconds: float) -> Optional[db_models.GenerationJob]:
+    """
+    Returns the job once it has finished or wait_seconds have passed. A job
+    finished in this process returns at once; others are seen by polling.
+    """
+    deadline = asyncio.get_running_loop().time() + min(wait_seconds, JOB_LONG_POLL_MAX_SECONDS)
+    finished = asyncio.Event()
+    _job_waiters.setdefault(job_id, set()).add(finished)
+    try:
+        while True:
+            job = await get_job(job_id)
+            remaining = deadline - asyncio.get_running_loop().time()
+            if job is None or job.status in FINISHED or remaining <= 0:
+                return job
+            try:
+                await asyncio.wait_for(finished.wait(), min(JOB_POLL_INTERVAL_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        waiters = _job_waiters[job_id]
+        waiters.discard(finished)
+        if not waiters:
+            del _job_waiters[job_id]
+
+
+def _claimable(now: datetime):
+    return and_(
+        Job.attempts < JOB_MAX_ATTEMPTS,
+        or_(Job.status == QUEUED, and_(Job.status == RUNNING, Job.lease_expires_at < now))
+    )
+
+
+async def claim(db: AsyncSession, worker_id: str) -> Optional[db_models.GenerationJob]:
+    """
+    Claims the oldest queued job (or one whose worker's lease expired).
+    The claim is a conditional UPDATE, so it succeeds for one worker only.
+
+    Returns:
+        GenerationJob | None: The claimed job, now running under worker_id.
+    """
+    now = _now()
+    candidates = await db.scalars(
+        select(Job.id).where(_claimable(now)).order_by(Job.created_at).limit(5)
+    )
+    for job_id in candidates.all():
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, _claimable(now))
+            .values(
+                status=RUNNING, worker_id=worker_id, attempts=Job.attempts + 1,
+                started_at=now, lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return await db.get(Job, job_id, populate_existing=True)
+    return None
+
+
+async def renew_lease(job_id: str, worker_id: str) -> bool:
+    """
+    Extends the lease of a running job held by worker_id.
+
+    Returns:
+        bool: False if the job is no longer running under worker_id.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == RUNNING)
+            .values(lease_expires_at=_now() + timedelta(seconds=JOB_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    return result.rowcount == 1
+
+
+async def fail_abandoned(db: AsyncSession) -> int:
+    """
+    Marks running jobs whose lease expired on their last attempt as failed.
+
+    Returns:
+        int: Number of jobs failed.
+    """
+    result = await db.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.lease_expires_at < _now(), Job.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status=FAILED, error="The worker running this job stopped.", finished_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def _run(job: db_models.GenerationJob) -> Dict[str, Any]:
+    if job.kind == GENERATE_CODE:
+        return await generation.generate_code(job.prompt)
+
+    if job.kind == CONTINUE_CHAT:
+        async with AsyncSessionLocal() as db:
+            chat_session = await generation.load_chat_session(db, job.chat_id)
+            if chat_session is None:
+                raise ValueError("Chat session not found.")
+            return await generation.continue_chat(db, chat_session, job.prompt)
+
+    raise ValueError(f"Unknown job kind '{job.kind}'.")
+
+
+def _post_webhook(url: str, payload: Dict[str, Any]) -> None:
+    # Checked again here: the host may resolve differently than at enqueue time
+    check_webhook_url(url)
+    response = requests.post(
+        url, data=json.dumps(payload, default=str), headers={"Content-Type": "application/json"},
+        timeout=JOB_WEBHOOK_TIMEOUT_SECONDS, allow_redirects=False
+    )
+    if response.is_redirect:
+        raise requests.HTTPError(f"Webhook answered with a redirect ({response.status_code}).", response=response)
+    response.raise_for_status()
+
+
+class JobWorkerPool:
+    """
+    Runs job workers as tasks on the current event loop.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        # Abandoned jobs are failed by one idle worker per lease period
+        self._next_sweep = 0.0
+
+        # Counters
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.requeued = 0
+        self.lease_losses = 0
+        self.webhook_failures = 0
+
+    def start(self, workers: int = JOB_WORKERS) -> None:
+        """
+        Starts `workers` worker tasks (no-op for 0).
+        """
+        for index in range(workers):
+            self._tasks.append(asyncio.create_task(self._work(f"{self.worker_id}:{index}")))
+
+    async def stop(self) -> None:
+        """
+        Cancels the workers; their running jobs go back to the queue.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _work(self, worker_id: str) -> None:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await claim(db, worker_id)
+                    if job is None and self._sweep_due():
+                        await fail_abandoned(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Could not claim a job", extra={"worker_id": worker_id, "error": str(e)})
+                job = None
+
+            if job is None:
+                _job_enqueued.clear()
+                try:
+                    await asyncio.wait_for(_job_enqueued.wait(), JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._execute(job)
+
+    def _sweep_due(self) -> bool:
+        """
+        Returns True at most once per JOB_LEASE_SECONDS across this pool's
+        workers; a lease takes that long to expire, so sweeping more often
+        finds nothing new.
+        """
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return False
+        self._next_sweep = now + JOB_LEASE_SECONDS
+        return True
+
+    async def _finish(self, job: db_models.GenerationJob, **values: Any) -> Optional[db_models.GenerationJob]:
+        """
+        Stores the outcome of a job, unless another worker has taken it over.
+
+        Returns:
+            GenerationJob | None: The updated job, or None if the lease was lost.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.worker_id == job.worker_id, Job.status == RUNNING)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if result.rowcount != 1:
+                self.lease_losses += 1
+                logger.warning("Job taken over by another worker; result discarded", extra={
+                    "job_id": job.id, "worker_id": job.worker_id
+                })
+                return None
+            finished = await db.get(Job, job.id)
+        for event in _job_waiters.get(job.id, ()):
+            event.set()
+        return finished
+
+    async def _hold_lease(self, job: db_models.GenerationJob, run: asyncio.Task) -> None:
+        # Renews the lease while the job runs; returns after cancelling the
+        # run if another worker has taken the job over
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                held = await renew_lease(job.id, job.worker_id)
+            except Exception as e:
+                logger.warning("Could not renew job lease", extra={"job_id": job.id, "error": str(e)})
+                continue
+            if not held:
+                run.cancel()
+                return
+
+    async def _execute(self, job: db_models.GenerationJob) -> None:
+        self.running += 1
+        try:
+            with tracing.request_trace(f"job {job.kind}"):
+                run = asyncio.create_task(_run(job))
+                lease = asyncio.create_task(self._hold_lease(job, run))
+                try:
+                    result = await run
+                finally:
+                    lease.cancel()
+        except asyncio.CancelledError:
+            if lease.done() and not lease.cancelled():
+                # The lease was lost; the worker that took the job over finishes it
+                self.lease_losses += 1
+                logger.warning("Job lease lost; stopped running it", extra={"job_id": job.id, "worker_id": job.worker_id})
+                return
+            # Shutting down: let another worker pick the job up
+            self.requeued += 1
+            await asyncio.shield(self._finish(job, status=QUEUED, attempts=job.attempts - 1, worker_id=None))
+            raise
+        except Exception as e:
+            logger.exception("Job failed", extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempts})
+            self.failed += 1
+            finished = await self._finish(job, status=FAILED, error=str(e), finished_at=_now())
+        else:
+            self.succeeded += 1
+            finished = await self._finish(job, status=SUCCEEDED, result=result, finished_at=_now())
+        finally:
+            self.running -= 1
+
+        if finished is not None and finished.webhook_url:
+            try:
+                await asyncio.to_thread(_post_webhook, finished.webhook_url, job_payload(finished))
+            except Exception as e:
+                self.webhook_failures += 1
+                logger.warning("Job webhook failed", extra={"job_id": job.id, "error": str(e)})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "lease_losses": self.lease_losses,
+            "webhook_failures": self.webhook_failures,
+        }
+
+
+# Workers of this process, started by the API on startup
+job_workers = JobWorkerPool()
+
+
+async def _serve(workers: int) -> None:
+    job_workers.start(workers)
+    logger.info("Job workers running", extra={"workers": workers, "worker_id": job_workers.worker_id})
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await job_workers.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve(max(JOB_WORKERS, 1)))
@@ -0,0 +1,86 @@
+"""
+This module provides a multi-pattern keyword index used for agent scoring.
+It is built once from every agent's keywords and scans a prompt a single
+time, returning how many distinct keywords of each agent occur in it.
+
+Matching uses an Aho-Corasick automaton (pyahocorasick) when installed. Without
+it, the index falls back to one substring scan per distinct keyword over a
+prompt that is lowercased once.
+
+Author: Emzyking AI
+"""
+
+from typing import Dict, Iterable, List, Set
+
+try:
+    import ahocorasick
+except ImportError:  # optional dependency
+    ahocorasick = None
+
+
+class KeywordIndex:
+    """
+    Case-insensitive substring matcher for keywords grouped by owner (agent).
+    """
+
+    def __init__(self, keywords_by_owner: Dict[str, Iterable[str]]):
+        """
+        Args:
+            keywords_by_owner (Dict[str, Iterable[str]]): Owner name → keywords.
+        """
+        self.owners: List[str] = list(keywords_by_owner)
+        self._owners_by_keyword: Dict[str, List[str]] = {}
+
+        for owner, keywords in keywords_by_owner.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                owners = self._owners_by_keyword.setdefault(keyword, [])
+                if keyword and owner not in owners:
+                    owners.append(owner)
+
+        self._owners_by_keyword.pop("", None)
+        self.keywords: List[str] = list(self._owners_by_keyword)
+
+        self._automaton = None
+        if ahocorasick is not None and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+
+    @property
+    def backend(self) -> str:
+        return "aho-corasick" if self._automaton is not None else "substring"
+
+    def find(self, text: str) -> Set[str]:
+        """
+        Returns the distinct keywords that occur anywhere in the text.
+        """
+        lowered = text.lower()
+
+        if self._automaton is None:
+            return {kw for kw in self.keywords if kw in lowered}
+
+        found: Set[str] = set()
+        total = len(self.keywords)
+        for _, keyword in self._automaton.iter(lowered):
+            found.add(keyword)
+            if len(found) == total:
+                break
+        return found
+
+    def hit_counts(self, text: str) -> Dict[str, int]:
+        """
+        Returns owner → number of that owner's distinct keywords found in the text.
+        """
+        counts = dict.fromkeys(self.owners, 0)
+        for keyword in self.find(text):
+            for owner in self._owners_by_keyword[keyword]:
+                counts[owner] += 1
+        return counts
+
+    def count(self, text: str) -> int:
+        """
+        Returns the number of distinct keywords found, across all owners.
+        """
+        return len(self.find(text))
@@ -0,0 +1,258 @@
+"""
+This module provides the shared asynchronous LLM client used by every agent
+and by the fallback handler. Requests go to one of the configured providers
+(see backend.llm_providers): Gemini through the SDK's native async path (or a
+bounded thread pool with LLM_ASYNC_MODE=threadpool), an OpenAI-compatible
+endpoint, or a fake provider for offline runs.
+
+With several providers, each request goes to the one with the best recent
+latency and error rate. A provider that answers 429 or fails with a server
+error is skipped for a while, and the request moves on to the next provider
+straight away; only the last candidate retries 429s with backoff. Streams
+fail over only until the first chunk has been sent.
+
+Prompts built with backend.prompt_builder keep their static part separate,
+so Gemini receives it as system_instruction and long chat histories are
+served from a cached prefix (see backend.prompt_cache).
+
+The client also keeps simple concurrency and token counters, which makes it
+possible to measure how many in-flight requests a single worker sustains and
+how much of each prompt was served from cache.
+
+Author: Emzyking AI
+"""
+
+import time
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from backend import tracing
+from backend.context.token_budget import estimate_tokens
+from backend.llm_providers import (
+    LLM_ASYNC_MODE, LLM_MAX_WORKERS, LLM_PROVIDER_SELECTION, LLM_PROVIDERS, PROVIDER_COOLDOWN_SECONDS,
+    PROVIDER_EXPLORE_RATE, GeminiProvider, LLMProvider, build_providers, is_retryable_error
+)
+from backend.log import get_logger
+from backend.model_registry import DEFAULT_MODEL_KEY, ModelRegistry
+from backend.prompt_builder import Prompt
+from backend.prompt_cache import PromptCache
+from backend.rate_limiter import LLM_OUTPUT_TOKEN_ESTIMATE, RateLimiter, is_rate_limit_error, retry_after
+
+logger = get_logger(__name__)
+
+
+class LLMClient:
+    """
+    Non-blocking text generation across one or more LLM providers.
+    """
+
+    def __init__(
+        self,
+        mode: str = LLM_ASYNC_MODE,
+        max_workers: int = LLM_MAX_WORKERS,
+        registry: Optional[ModelRegistry] = None,
+        prompt_cache: Optional[PromptCache] = None,
+        limiter: Optional[RateLimiter] = None,
+        providers: Optional[List[LLMProvider]] = None,
+        selection: str = LLM_PROVIDER_SELECTION
+    ):
+        """
+        Args:
+            mode (str): Gemini calls: "native" for the SDK's async API, "threadpool" for a bounded pool.
+            max_workers (int): Thread pool size used in "threadpool" mode.
+            registry (ModelRegistry | None): Source of Gemini models; defaults to the shared one.
+            prompt_cache (PromptCache | None): Cached-prefix store; defaults to the shared one.
+            limiter (RateLimiter | None): Gemini rate and concurrency limits; defaults to the shared one.
+            providers (List[LLMProvider] | None): Providers to use; defaults to LLM_PROVIDERS,
+                with Gemini built from the arguments above.
+            selection (str): "latency" or "ordered" (see LLM_PROVIDER_SELECTION).
+        """
+        if selection not in ("latency", "ordered"):
+            raise ValueError(f"Unknown LLM_PROVIDER_SELECTION '{selection}'. Use 'latency' or 'ordered'.")
+
+        self.providers = providers or build_providers(
+            LLM_PROVIDERS, GeminiProvider(mode, max_workers, registry, prompt_cache, limiter)
+        )
+        self.selection = selection
+
+        # Concurrency counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_calls = 0
+        self.failed_calls = 0
+        self.total_latency = 0.0
+        self.failovers = 0
+
+    @staticmethod
+    def _estimate_tokens(prompt: Union[str, Prompt]) -> int:
+        """
+        Estimates the tokens a request will use, for the tokens-per-minute bucket.
+        """
+        text = prompt if isinstance(prompt, str) else prompt.text()
+        return estimate_tokens(text) + LLM_OUTPUT_TOKEN_ESTIMATE
+
+    def _candidates(self) -> List[LLMProvider]:
+        """
+        Returns the providers in the order to try them: those not cooling
+        down after a 429 first (by score, or in configured order), then the
+        rest by how soon they become available.
+        """
+        ready = [p for p in self.providers if not p.health.cooling_for() and not p.limiter.paused_for()]
+        waiting = sorted(
+            (p for p in self.providers if p not in ready),
+            key=lambda p: max(p.health.cooling_for(), p.limiter.paused_for())
+        )
+        if self.selection == "latency" and len(ready) > 1:
+            if random.random() < PROVIDER_EXPLORE_RATE:
+                random.shuffle(ready)
+            else:
+                ready.sort(key=lambda p: p.health.score())
+        return ready + waiting
+
+    @staticmethod
+    def _record_failure(provider: LLMProvider, e: Exception) -> None:
+        """
+        Counts a retryable error against the provider; a 429 also starts its cooldown.
+        """
+        cooldown = 0.0
+        if is_rate_limit_error(e):
+            cooldown = retry_after(e) or PROVIDER_COOLDOWN_SECONDS
+        provider.health.record_failure(cooldown)
+
+    def _start(self) -> float:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def _finish(self, start: float) -> None:
+        self.in_flight -= 1
+        self.total_calls += 1
+        self.total_latency += time.perf_counter() - start
+
+    async def generate(self, prompt: Union[str, Prompt], model_key: str = DEFAULT_MODEL_KEY) -> str:
+        """
+        Generates a completion without blocking the event loop.
+
+        Args:
+            prompt (str | Prompt): Full prompt string, or a Prompt with separate system instruction.
+            model_key (str): Registry key of the model to use (usually the agent name).
+
+        Returns:
+            str: Stripped response text.
+
+        Raises:
+            Exception: The last provider's error, unchanged, so callers can keep their handling.
+        """
+        start = self._start()
+        try:
+            estimated = self._estimate_tokens(prompt)
+            candidates = self._candidates()
+            for index, provider in enumerate(candidates):
+                last = index == len(candidates) - 1
+                call_start = time.perf_counter()
+                try:
+                    with tracing.span("llm.generate", provider=provider.name, model_key=model_key):
+                        text = await provider.generate(prompt, model_key, estimated, retries=None if last else 0)
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        raise
+                    self._record_failure(provider, e)
+                    if last:
+                        raise
+                    logger.warning("Provider failed, failing over", extra={
+                        "provider": provider.name, "next_provider": candidates[index + 1].name, "error": str(e)
+                    })
+                    self.failovers += 1
+                    continue
+                provider.health.record_success(time.perf_counter() - call_start)
+                return text
+
+        except Exception:
+            self.failed_calls += 1
+            raise
+
+        finally:
+            self._finish(start)
+
+    async def generate_stream(self, prompt: Union[str, Prompt], model_key: str = DEFAULT_MODEL_KEY) -> AsyncIterator[str]:
+        """
+        Streams a completion chunk by chunk without blocking the event loop.
+
+        Args:
+            prompt (str | Prompt): Full prompt string, or a Prompt with separate system instruction.
+            model_key (str): Registry key of the model to use (usually the agent name).
+
+        Yields:
+            str: Text chunks in the order the model produces them.
+        """
+        start = self._start()
+        try:
+            estimated = self._estimate_tokens(prompt)
+            candidates = self._candidates()
+            for index, provider in enumerate(candidates):
+                last = index == len(candidates) - 1
+                call_start = time.perf_counter()
+                started = False
+                try:
+                    with tracing.span("llm.stream", provider=provider.name, model_key=model_key):
+                        async for text in provider.generate_stream(prompt, model_key, estimated, retries=None if last else 0):
+                            if not started:
+                                # Streams are scored by time to first chunk
+                                provider.health.record_success(time.perf_counter() - call_start)
+                                started = True
+                            yield text
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        raise
+                    self._record_failure(provider, e)
+                    if started or last:
+                        raise
+                    logger.warning("Provider failed, failing over", extra={
+                        "provider": provider.name, "next_provider": candidates[index + 1].name, "error": str(e)
+                    })
+                    self.failovers += 1
+                    continue
+                return
+
+        except Exception:
+            self.failed_calls += 1
+            raise
+
+        finally:
+            self._finish(start)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns a snapshot of the client's concurrency counters.
+
+        Returns:
+            Dict[str, Any]: In-flight, peak, totals, average latency in seconds, prompt token
+            usage, and each provider's health, rate limiter and caches.
+        """
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "total_calls": self.total_calls,
+            "failed_calls": self.failed_calls,
+            "avg_latency_s": self.total_latency / self.total_calls if self.total_calls else 0.0,
+            "prompt_tokens": sum(p.prompt_tokens for p in self.providers),
+            "cached_prompt_tokens": sum(p.cached_prompt_tokens for p in self.providers),
+            "selection": self.selection,
+            "failovers": self.failovers,
+            "providers": {p.name: p.stats() for p in self.providers},
+        }
+
+    def reset_stats(self) -> None:
+        """Resets all counters except the current in-flight count."""
+        self.peak_in_flight = self.in_flight
+        self.total_calls = 0
+        self.failed_calls = 0
+        self.total_latency = 0.0
+        self.failovers = 0
+        for provider in self.providers:
+            provider.prompt_tokens = 0
+            provider.cached_prompt_tokens = 0
+
+
+# Shared client instance used across the backend
+llm_client = LLMClient()
@@ -0,0 +1,578 @@
+"""
+This module defines the LLM providers the shared client can send requests
+to. Each provider turns a prompt into text, either in one piece or as a
+stream, and has its own rate limiter and usage counters:
+
+- GeminiProvider: Google Gemini via the google.generativeai SDK, with
+  system instructions and cached chat prefixes (see backend.prompt_cache).
+- OpenAIProvider: any OpenAI-compatible /chat/completions endpoint.
+- FakeProvider: no network; answers after a simulated latency and can be
+  told to return errors and 429s, for local runs and offline benchmarks.
+
+LLM_PROVIDERS lists the providers to use, in order of preference. By default
+it is "gemini", plus "openai" when OPENAI_API_KEY is set.
+
+Author: Emzyking AI
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Union
+from dotenv import load_dotenv
+import requests
+from google.api_core import exceptions as google_exceptions
+
+from backend import tracing
+from backend.metrics import LLM_TOKENS
+from backend.model_registry import ModelRegistry, model_registry as shared_model_registry
+from backend.prompt_builder import Prompt
+from backend.prompt_cache import PromptCache, prompt_cache as shared_prompt_cache
+from backend.rate_limiter import (
+    LLM_RPM_LIMIT, LLM_TPM_LIMIT, RateLimiter, is_rate_limit_error, rate_limiter as shared_rate_limiter
+)
+
+load_dotenv()
+
+# "native" uses generate_content_async, "threadpool" offloads generate_content
+LLM_ASYNC_MODE = os.getenv("LLM_ASYNC_MODE", "native").lower()
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", str(LLM_RPM_LIMIT)))
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", str(LLM_TPM_LIMIT)))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.2"))
+FAKE_LLM_THROTTLE_RATE = float(os.getenv("FAKE_LLM_THROTTLE_RATE", "0"))
+
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "gemini,openai" if OPENAI_API_KEY else "gemini")
+# "latency" prefers the provider with the best recent latency and error rate,
+# "ordered" always tries LLM_PROVIDERS in order and only fails over
+LLM_PROVIDER_SELECTION = os.getenv("LLM_PROVIDER_SELECTION", "latency").lower()
+PROVIDER_EWMA_ALPHA = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.2"))
+PROVIDER_ERROR_PENALTY = float(os.getenv("PROVIDER_ERROR_PENALTY", "4"))
+# Share of requests sent to a random provider, so a recovered one is noticed
+PROVIDER_EXPLORE_RATE = float(os.getenv("PROVIDER_EXPLORE_RATE", "0.05"))
+# How long a provider is skipped after a 429 without a retry delay
+PROVIDER_COOLDOWN_SECONDS = float(os.getenv("PROVIDER_COOLDOWN_SECONDS", "30"))
+
+
+class ProviderError(Exception):
+    """
+    An HTTP error from a provider. The message starts with the status code,
+    so a 429 is recognized by is_rate_limit_error().
+    """
+
+    def __init__(self, status: int, message: str, response: Any = None):
+        super().__init__(f"{status} {message}")
+        self.status = status
+        self.response = response
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """
+    Returns True if another provider might succeed where this one failed:
+    quota errors, timeouts, server errors and connection failures.
+    """
+    if is_rate_limit_error(e):
+        return True
+    if isinstance(e, ProviderError):
+        return e.status >= 500
+    return isinstance(e, (
+        asyncio.TimeoutError,
+        google_exceptions.ServerError,
+        google_exceptions.DeadlineExceeded,
+        requests.ConnectionError,
+        requests.Timeout,
+    ))
+
+
+class ProviderHealth:
+    """
+    Recent latency and error rate of one provider, as exponentially weighted
+    moving averages, plus a cooldown after it answered 429.
+    """
+
+    def __init__(self, alpha: float = PROVIDER_EWMA_ALPHA):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def record_success(self, seconds: float) -> None:
+        self.successes += 1
+        self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+        self.error_rate -= self.alpha * self.error_rate
+
+    def record_failure(self, cooldown: float = 0.0) -> None:
+        self.failures += 1
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        if cooldown:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    def cooling_for(self) -> float:
+        return max(self.cooldown_until - time.monotonic(), 0.0)
+
+    def score(self) -> float:
+        """
+        Expected cost of sending a request here; lower is better. A provider
+        without samples scores 0 so it gets tried.
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + PROVIDER_ERROR_PENALTY * self.error_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ewma_latency_s": self.latency,
+            "error_rate": round(self.error_rate, 3),
+            "cooldown_s": round(self.cooling_for(), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+class LLMProvider(ABC):
+    """
+    Base class for providers. Subclasses implement _complete() and
+    _chunks(); requests go through the provider's rate limiter.
+    """
+
+    name: str = "provider"
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self.health = ProviderHealth()
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+
+    def _record_usage(self, prompt_tokens: int, cached_tokens: int, total_tokens: int, estimated_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.cached_prompt_tokens += cached_tokens
+        self.limiter.reconcile(estimated_tokens, total_tokens)
+
+        # Attributed to the agent whose span made the call
+        agent = tracing.current_attribute("agent") or "none"
+        LLM_TOKENS.inc(prompt_tokens, agent=agent, provider=self.name, kind="prompt")
+        LLM_TOKENS.inc(cached_tokens, agent=agent, provider=self.name, kind="cached_prompt")
+        LLM_TOKENS.inc(total_tokens - prompt_tokens, agent=agent, provider=self.name, kind="completion")
+
+    @abstractmethod
+    def model_name(self, model_key: str) -> str:
+        """
+        Returns the model this provider uses for a model key.
+        """
+        pass
+
+    @abstractmethod
+    async def _complete(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> str:
+        pass
+
+    @abstractmethod
+    def _chunks(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> AsyncIterator[str]:
+        pass
+
+    async def generate(
+        self,
+        prompt: Union[str, Prompt],
+        model_key: str,
+        estimated_tokens: int,
+        retries: Optional[int] = None
+    ) -> str:
+        """
+        Generates a completion within the provider's rate limits.
+
+        Args:
+            prompt (str | Prompt): The prompt to send.
+            model_key (str): Registry key of the model (usually the agent name).
+            estimated_tokens (int): Token estimate for the tokens-per-minute bucket.
+            retries (int | None): 429 retries; None uses the limiter's default.
+
+        Returns:
+            str: Stripped response text.
+        """
+        return await self.limiter.call(
+            lambda: self._complete(prompt, model_key, estimated_tokens), estimated_tokens, retries
+        )
+
+    async def generate_stream(
+        self,
+        prompt: Union[str, Prompt],
+        model_key: str,
+        estimated_tokens: int,
+        retries: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of generate().
+        """
+        async for text in self.limiter.stream(
+            lambda: self._chunks(prompt, model_key, estimated_tokens), estimated_tokens, retries
+        ):
+            yield text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "health": self.health.stats(),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "rate_limiter": self.limiter.stats(),
+        }
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini. Completions use the SDK's native async path, or a bounded
+    thread pool with LLM_ASYNC_MODE=threadpool.
+    """
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        mode: str = LLM_ASYNC_MODE,
+        max_workers: int = LLM_MAX_WORKERS,
+        registry: Optional[ModelRegistry] = None,
+        prompt_cache: Optional[PromptCache] = None,
+        limiter: Optional[RateLimiter] = None
+    ):
+        """
+        Args:
+            mode (str): "native" for the SDK's async API, "threadpool" for a bounded pool.
+            max_workers (int): Thread pool size used in "threadpool" mode.
+            registry (ModelRegistry | None): Source of model objects; defaults to the shared one.
+            prompt_cache (PromptCache | None): Cached-prefix store; defaults to the shared one.
+            limiter (RateLimiter | None): Rate and concurrency limits; defaults to the shared one.
+        """
+        if mode not in ("native", "threadpool"):
+            raise ValueError(f"Unknown LLM_ASYNC_MODE '{mode}'. Use 'native' or 'threadpool'.")
+
+        super().__init__(limiter or shared_rate_limiter)
+        self.mode = mode
+        self.max_workers = max_workers
+        self.registry = registry or shared_model_registry
+        self.prompt_cache = prompt_cache or shared_prompt_cache
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="llm-client"
+            )
+        return self._executor
+
+    def model_name(self, model_key: str) -> str:
+        return self.registry.model_name(model_key)
+
+    async def _prepare(self, prompt: Union[str, Prompt], model_key: str) -> tuple:
+        """
+        Returns (model, contents, uses cached prefix) for a prompt.
+        """
+        if isinstance(prompt, str):
+            return self.registry.get(model_key), prompt, False
+
+        cached = await self.prompt_cache.acquire(prompt, self.registry.config(model_key))
+        if cached is not None:
+            model, covered = cached
+            return model, prompt.contents(covered), True
+        return self.registry.get(model_key, prompt.system_instruction), prompt.contents(), False
+
+    def _record_response_usage(self, response: Any, estimated_tokens: int) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._record_usage(
+                getattr(usage, "prompt_token_count", 0) or 0,
+                getattr(usage, "cached_content_token_count", 0) or 0,
+                getattr(usage, "total_token_count", 0) or 0,
+                estimated_tokens
+            )
+
+    async def _send(self, model: Any, contents: Any, estimated_tokens: int) -> str:
+        if self.mode == "threadpool":
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._get_executor(), model.generate_content, contents
+            )
+        else:
+            response = await model.generate_content_async(contents)
+        self._record_response_usage(response, estimated_tokens)
+        return response.text.strip()
+
+    async def _send_stream(self, model: Any, contents: Any, estimated_tokens: int) -> AsyncIterator[str]:
+        last = None
+        if self.mode == "threadpool":
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            response = await loop.run_in_executor(
+                executor, lambda: iter(model.generate_content(contents, stream=True))
+            )
+            while True:
+                chunk = await loop.run_in_executor(executor, next, response, None)
+                if chunk is None:
+                    break
+                last = chunk
+                if chunk.text:
+                    yield chunk.text
+        else:
+            response = await model.generate_content_async(contents, stream=True)
+            async for chunk in response:
+                last = chunk
+                if chunk.text:
+                    yield chunk.text
+        # Usage totals arrive with the final chunk
+        self._record_response_usage(last, estimated_tokens)
+
+    async def _complete(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> str:
+        model, contents, cached = await self._prepare(prompt, model_key)
+        try:
+            return await self._send(model, contents, estimated_tokens)
+        except google_exceptions.NotFound:
+            if not cached:
+                raise
+            # The cached prefix expired at the provider; send the full prompt
+            self.prompt_cache.invalidate(prompt.chat_id)
+            model = self.registry.get(model_key, prompt.system_instruction)
+            return await self._send(model, prompt.contents(), estimated_tokens)
+
+    async def _chunks(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> AsyncIterator[str]:
+        model, contents, cached = await self._prepare(prompt, model_key)
+        started = False
+        try:
+            async for text in self._send_stream(model, contents, estimated_tokens):
+                started = True
+                yield text
+        except google_exceptions.NotFound:
+            if not cached or started:
+                raise
+            self.prompt_cache.invalidate(prompt.chat_id)
+            model = self.registry.get(model_key, prompt.system_instruction)
+            async for text in self._send_stream(model, prompt.contents(), estimated_tokens):
+                yield text
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            **super().stats(),
+            "prompt_cache": self.prompt_cache.stats(),
+            "models": self.registry.stats(),
+        }
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    An OpenAI-compatible chat completions endpoint (OpenAI, Azure OpenAI,
+    vLLM, Ollama, ...). Requests use a pooled requests.Session on a worker
+    thread, since requests is blocking.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = OPENAI_API_KEY,
+        base_url: str = OPENAI_BASE_URL,
+        model: str = OPENAI_MODEL,
+        timeout: float = OPENAI_TIMEOUT_SECONDS,
+        limiter: Optional[RateLimiter] = None
+    ):
+        """
+        Args:
+            api_key (str | None): Bearer token sent with every request.
+            base_url (str): API root, e.g. https://api.openai.com/v1.
+            model (str): Model used for every request.
+            timeout (float): Seconds to wait for the response to start.
+            limiter (RateLimiter | None): Defaults to OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT.
+        """
+        super().__init__(limiter or RateLimiter(rpm=OPENAI_RPM_LIMIT, tpm=OPENAI_TPM_LIMIT))
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def model_name(self, model_key: str) -> str:
+        return self.model
+
+    @staticmethod
+    def messages(prompt: Union[str, Prompt]) -> List[Dict[str, str]]:
+        """
+        Converts a prompt to chat messages: the system instruction, the
+        history turns, then the request as the final user message.
+        """
+        if isinstance(prompt, str):
+            return [{"role": "user", "content": prompt}]
+
+        messages = [{"role": "system", "content": prompt.system_instruction}]
+        for role, content in prompt.history:
+            messages.append({"role": "assistant" if role == "assistant" else "user", "content": content})
+        messages.append({"role": "user", "content": prompt.request})
+        return messages
+
+    def _post(self, prompt: Union[str, Prompt], stream: bool) -> requests.Response:
+        payload: Dict[str, Any] = {"model": self.model, "messages": self.messages(prompt)}
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+
+        response = self.session.post(
+            f"{self.base_url}/chat/completions", json=payload, stream=stream, timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise ProviderError(response.status_code, response.text[:500], response)
+        return response
+
+    def _record_openai_usage(self, usage: Optional[Dict[str, Any]], estimated_tokens: int) -> None:
+        if usage:
+            self._record_usage(
+                usage.get("prompt_tokens", 0),
+                (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                usage.get("total_tokens", 0),
+                estimated_tokens
+            )
+
+    async def _complete(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> str:
+        response = await asyncio.to_thread(self._post, prompt, False)
+        body = response.json()
+        self._record_openai_usage(body.get("usage"), estimated_tokens)
+        return (body["choices"][0]["message"].get("content") or "").strip()
+
+    async def _chunks(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> AsyncIterator[str]:
+        response = await asyncio.to_thread(self._post, prompt, True)
+        lines = response.iter_lines(decode_unicode=True)
+        try:
+            while True:
+                line = await asyncio.to_thread(next, lines, None)
+                if line is None or line.strip() == "data: [DONE]":
+                    break
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                # With include_usage, the last event carries usage and no choices
+                self._record_openai_usage(event.get("usage"), estimated_tokens)
+                for choice in event.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+        finally:
+            response.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.base_url, **super().stats()}
+
+
+class FakeProvider(LLMProvider):
+    """
+    Answers without calling any API. Each call takes about `latency` seconds;
+    a `throttle_rate` share of calls, and every call over `quota` per
+    `period` seconds, fails with a 429 that carries a retry delay.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        name: str = "fake",
+        latency: float = FAKE_LLM_LATENCY_SECONDS,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        throttle_rate: float = FAKE_LLM_THROTTLE_RATE,
+        quota: Optional[int] = None,
+        period: float = 60.0,
+        limiter: Optional[RateLimiter] = None
+    ):
+        """
+        Args:
+            name (str): Provider name, so several fakes can stand in for real providers.
+            latency (float): Median call latency in seconds.
+            jitter (float): Spread of the latency (sigma of a log-normal distribution).
+            error_rate (float): Share of calls that fail with a 503.
+            throttle_rate (float): Share of calls that fail with a 429.
+            quota (int | None): Calls allowed per period before 429s (None = unlimited).
+            period (float): Seconds the quota applies to.
+            limiter (RateLimiter | None): Defaults to an unlimited limiter without retries.
+        """
+        super().__init__(limiter or RateLimiter(rpm=0, tpm=0, max_concurrency=0, max_retries=0))
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.quota = quota
+        self.period = period
+        self._recent: Deque[float] = deque()
+        self.calls = 0
+        self.throttled = 0
+
+    def model_name(self, model_key: str) -> str:
+        return f"{self.name}-model"
+
+    async def _respond(self, prompt: Union[str, Prompt]) -> str:
+        self.calls += 1
+        now = time.monotonic()
+        while self._recent and self._recent[0] <= now - self.period:
+            self._recent.popleft()
+        if self.quota is not None and len(self._recent) >= self.quota:
+            self.throttled += 1
+            wait = self._recent[0] + self.period - now
+            raise ProviderError(429, f"Quota exceeded for {self.name}. Please retry in {wait:.3f}s.")
+        if random.random() < self.throttle_rate:
+            self.throttled += 1
+            raise ProviderError(429, f"Rate limited by {self.name}. Please retry in {self.period / 10:.3f}s.")
+        self._recent.append(now)
+
+        await asyncio.sleep(self.latency * random.lognormvariate(0, self.jitter) if self.jitter else self.latency)
+        if random.random() < self.error_rate:
+            raise ProviderError(503, f"{self.name} is overloaded.")
+
+        request = prompt if isinstance(prompt, str) else prompt.request
+        lines = request.strip().splitlines() or [""]
+        return f"[{self.name}] reply to: {lines[-1][:80]}"
+
+    async def _complete(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> str:
+        return await self._respond(prompt)
+
+    async def _chunks(self, prompt: Union[str, Prompt], model_key: str, estimated_tokens: int) -> AsyncIterator[str]:
+        text = await self._respond(prompt)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "throttled": self.throttled, **super().stats()}
+
+
+def build_providers(names: str = LLM_PROVIDERS, gemini: Optional[GeminiProvider] = None) -> List[LLMProvider]:
+    """
+    Builds the providers listed in names, in order.
+
+    Args:
+        names (str): Comma-separated provider names: gemini, openai, fake.
+        gemini (GeminiProvider | None): Gemini provider to use instead of a default one.
+
+    Returns:
+        List[LLMProvider]: The providers, most preferred first.
+    """
+    providers: List[LLMProvider] = []
+    for name in (part.strip().lower() for part in names.split(",")):
+        if name == "gemini":
+            providers.append(gemini or GeminiProvider())
+        elif name == "openai":
+            if not OPENAI_API_KEY:
+                raise ValueError("LLM_PROVIDERS includes 'openai' but OPENAI_API_KEY is not set.")
+            providers.append(OpenAIProvider())
+        elif name == "fake":
+            providers.append(FakeProvider())
+        elif name:
+            raise ValueError(f"Unknown LLM provider '{name}'. Use 'gemini', 'openai' or 'fake'.")
+    if not providers:
+        raise ValueError("LLM_PROVIDERS must name at least one provider.")
+    return providers
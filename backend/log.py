@@ -0,0 +1,200 @@
+"""
+This module sets up logging for the backend. Modules get a logger with
+
+    logger = get_logger(__name__)
+
+and log events with fields passed as `extra`:
+
+    logger.warning("Agent failed", extra={"agent": name, "error": str(e)})
+
+Records are written as one JSON object per line (LOG_FORMAT=json) or as
+readable text (LOG_FORMAT=text). Logging calls never write to stdout
+themselves: records go into a bounded in-memory queue and a background
+thread formats and writes them, so a slow or blocked stdout does not stall
+the event loop and lines from concurrent requests do not interleave. When
+the queue is full, records are dropped and counted instead of waiting.
+
+Debug events, such as the agent ranking of every request, are high volume:
+with LOG_LEVEL=DEBUG only a LOG_DEBUG_SAMPLE_RATE share of them is kept, and
+each kept record carries its sample_rate so counts can be scaled back up. A
+call can override the rate with extra={"sample_rate": ...}.
+
+Author: Emzyking AI
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = "backend"
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON line: timestamp, level, logger, message,
+    process id, the record's extra fields, and the traceback if any.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formats a record as one readable line with its fields as key=value.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in _fields(record).items())
+        return f"{line} {fields}".rstrip() if fields else line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a sample of DEBUG records (or of any record with a sample_rate field).
+    """
+
+    def __init__(self, debug_rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            if record.levelno > logging.DEBUG:
+                return True
+            rate = record.sample_rate = self.debug_rate
+        return rate >= 1 or random.random() < rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queues records for the writer thread and drops them when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now, but keep the extra fields
+        # (the base class would flatten the record into one formatted string)
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_configure_lock = threading.Lock()
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    format: str = LOG_FORMAT,
+    stream: Any = None
+) -> None:
+    """
+    Routes the backend's loggers through the queue to one writer thread.
+    Called on first use of get_logger(); calling it again reconfigures.
+
+    Args:
+        level (str): Minimum level, e.g. "INFO" or "DEBUG".
+        format (str): "json" or "text".
+        stream: Where the writer thread writes; defaults to stdout.
+    """
+    global _queue_handler, _listener
+
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(TextFormatter() if format == "text" else JsonFormatter())
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter())
+        _listener = QueueListener(_queue_handler.queue, output)
+        _listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.handlers = [_queue_handler]
+        root.setLevel(level)
+        root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger for a module. Names outside the backend package
+    (e.g. "__main__" when a module runs as a script) are nested under it.
+    """
+    if _listener is None:
+        configure_logging()
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + "."):
+        name = f"{ROOT_LOGGER}.{name}"
+    return logging.getLogger(name)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE,
+    }
+
+
+@atexit.register
+def _flush() -> None:
+    # Write out what is still queued when the process exits
+    if _listener is not None:
+        _listener.stop()
@@ -1,22 +1,57 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
+import os
+import asyncio
 import uuid
-import traceback
 
-from backend.schemas import PromptRequest, ContinueChatRequest, FeedbackRequest
-from backend.database.db_connection import get_db
+from backend.schemas import PromptRequest, BatchPromptRequest, ContinueChatRequest, FeedbackRequest
+from backend.database.db_connection import get_async_db, AsyncSessionLocal, sync_pool_metrics, async_pool_metrics
 from backend.database import db_models
-from backend.utils import extract_keywords
+from backend.database.turn_persistence import persist_turn
+from backend import generation, job_queue, log, metrics, tracing
+from backend.utils import format_sse, format_ndjson, encode_cursor, decode_cursor
 from backend.agent_registry import router_agent
+from backend.llm_client import llm_client
 from backend.context.context_builder import build_context
 from backend.feedback_handler import save_feedback_from_request
+from backend.response_cache import response_cache
+from backend.context.context_cache import context_cache
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+logger = log.get_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Generation workers for background jobs; JOB_WORKERS=0 leaves them to
+    # separate `python -m backend.job_queue` processes
+    job_queue.job_workers.start(job_queue.JOB_WORKERS)
+    yield
+    await job_queue.job_workers.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Keep proxies from buffering Server-Sent Events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# /generate-code/batch limits
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+
+def job_accepted(job: db_models.GenerationJob) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+    )
 
 # Allow CORS for frontend integration
 app.add_middleware(
@@ -27,103 +62,219 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Collects the stage spans of each request into a Server-Timing header and
+    records its latency by route. For streams this is the time to the first
+    byte; their stages are still recorded in the stage histogram.
+    """
+    with tracing.request_trace(f"{request.method} {request.url.path}") as trace:
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        trace.name = f"{request.method} {route}"
+
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        trace.duration, method=request.method, route=route, status=response.status_code
+    )
+    if tracing.TRACING_ENABLED:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
 @app.get("/")
 def home():
     return {"message": "Emzyking AI Backend is Running 🚀"}
 
 @app.post("/new-chat")
-def new_chat(db: Session = Depends(get_db)):
+async def new_chat(db: AsyncSession = Depends(get_async_db)):
     chat_id = str(uuid.uuid4())
     new_session = db_models.ChatSession(chat_id=chat_id)
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
+    await db.commit()
     return {"chat_id": chat_id, "message": "New chat created."}
 
 @app.post("/continue-chat")
-async def continue_chat(request: ContinueChatRequest, db: Session = Depends(get_db)):
+async def continue_chat(request: ContinueChatRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         chat_id = request.chat_id
         user_prompt = request.prompt
 
-        chat_session = db.query(db_models.ChatSession).filter(
-            db_models.ChatSession.chat_id == chat_id
-        ).first()
+        chat_session = await generation.load_chat_session(db, chat_id)
 
         if not chat_session:
             raise HTTPException(status_code=404, detail="Chat session not found.")
 
-        user_msg = db_models.ChatMessage(chat_id=chat_id, role="user", content=user_prompt)
-        db.add(user_msg)
-        db.commit()
-        db.refresh(user_msg)
+        if request.background:
+            try:
+                job = await job_queue.enqueue(
+                    db, job_queue.CONTINUE_CHAT, user_prompt, chat_id=chat_id, webhook_url=request.webhook_url
+                )
+            except job_queue.WebhookURLError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return job_accepted(job)
 
-        context = build_context(chat_id, db)
+        return await generation.continue_chat(db, chat_session, user_prompt)
 
-        response_text, thought, tool_calls, agent_name, confidence = await router_agent.route(
-            chat_id=chat_id, user_input=user_prompt, context=context
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Continue chat failed", extra={"chat_id": request.chat_id})
+        raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
-        assistant_msg = db_models.ChatMessage(
-            chat_id=chat_id, role="assistant", content=response_text
-        )
-        db.add(assistant_msg)
-        db.commit()
-        db.refresh(assistant_msg)
-
-        if thought:
-            agent_thought = db_models.AgentThought(
-                message_id=assistant_msg.id,
-                reasoning=thought.get("reasoning"),
-                tool_invoked=thought.get("tool_invoked"),
-                observation=thought.get("observation"),
-            )
-            db.add(agent_thought)
-
-        for tool in tool_calls or []:
-            db.add(
-                db_models.ToolUsage(
-                    message_id=assistant_msg.id,
-                    tool_name=tool.get("tool_name"),
-                    input_params=tool.get("input"),
-                    output_result=tool.get("output"),
-                )
-            )
+@app.post("/generate-code")
+async def generate_code(request: PromptRequest, db: AsyncSession = Depends(get_async_db)):
+    if request.background:
+        try:
+            job = await job_queue.enqueue(db, job_queue.GENERATE_CODE, request.prompt, webhook_url=request.webhook_url)
+        except job_queue.WebhookURLError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return job_accepted(job)
 
-        db.commit()
+    return await generation.generate_code(request.prompt)
 
-        return {
-            "chat_id": chat_id,
-            "response": response_text,
-            "agent_thought": thought,
-            "tools_used": tool_calls,
-            "routed_agent": agent_name,
-            "confidence_score": confidence
-        }
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description=f"Seconds to wait for the job to finish (at most {job_queue.JOB_LONG_POLL_MAX_SECONDS:g})."),
+):
+    """
+    Returns a background job's status, and its result once it has finished.
+    With ?wait=N the request is held until the job finishes or N seconds pass.
+    """
+    if wait:
+        job = await job_queue.wait_for_job(job_id, wait)
+    else:
+        job = await job_queue.get_job(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job_queue.job_payload(job)
+
+@app.post("/generate-code/batch")
+async def generate_code_batch(request: BatchPromptRequest):
+    """
+    Generates code for several independent prompts in one request. Results
+    are returned in prompt order, or with "stream": true as NDJSON lines in
+    the order they finish; each result carries its prompt's index.
+    """
+    if len(request.prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=422, detail=f"A batch may contain at most {BATCH_MAX_PROMPTS} prompts.")
+
+    def batch_result(index, result):
+        response, _, _, agent_name, score = result
+        return {"index": index, "code": response, "routed_agent": agent_name, "confidence_score": score}
+
+    if request.stream:
+        async def ndjson_stream():
+            try:
+                async for index, result in router_agent.route_batch(request.prompts, BATCH_MAX_CONCURRENCY):
+                    yield format_ndjson(batch_result(index, result))
+
+            except Exception as e:
+                logger.exception("Batch stream failed", extra={"prompts": len(request.prompts)})
+                yield format_ndjson({"error": f"Internal Error: {str(e)}"})
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+    try:
+        results = [None] * len(request.prompts)
+        async for index, result in router_agent.route_batch(request.prompts, BATCH_MAX_CONCURRENCY):
+            results[index] = batch_result(index, result)
+        return {"results": results}
 
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Batch generation failed", extra={"prompts": len(request.prompts)})
         raise HTTPException(status_code=500, detail=f"Internal Error: {str(e)}")
 
-@app.post("/generate-code")
-async def generate_code(request: PromptRequest):
-    result, _, _, _, _ = await router_agent.route(
-        chat_id=str(uuid.uuid4()), user_input=request.prompt
-    )
-    return {"code": result}
+@app.post("/continue-chat/stream")
+async def continue_chat_stream(request: ContinueChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Streams the assistant reply as Server-Sent Events. The first event carries
+    the routing metadata; the assistant message is saved once the stream completes.
+    """
+    chat_id = request.chat_id
+    user_prompt = request.prompt
+
+    chat_session = await generation.load_chat_session(db, chat_id)
+
+    if not chat_session:
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+
+    with tracing.span("context.build"):
+        context = await build_context(chat_id, db, pending_prompt=user_prompt)
+    await db.commit()
+
+    async def save_turn(response_text=None, thought=None, tool_calls=None):
+        # The request-scoped session is closed once streaming starts
+        with tracing.span("db.persist_turn"):
+            async with AsyncSessionLocal() as stream_db:
+                stream_session = await stream_db.merge(chat_session, load=False)
+                return await persist_turn(stream_db, stream_session, user_prompt, response_text, thought, tool_calls)
+
+    async def save_user_message():
+        try:
+            await save_turn()
+        except Exception:
+            logger.exception("Saving the user message failed", extra={"chat_id": chat_id})
+
+    async def event_stream():
+        saved = False
+        saving = None
+        try:
+            async for event in router_agent.route_stream(
+                chat_id=chat_id, user_input=user_prompt, context=context
+            ):
+                if event["event"] == "done":
+                    data = event["data"]
+                    # Shielded: a client disconnect cancels the stream, not the write
+                    saving = asyncio.ensure_future(save_turn(data["response"], data["agent_thought"], data["tools_used"]))
+                    turn = await asyncio.shield(saving)
+                    saved = True
+                    data["message_id"] = turn.assistant_message_id
+                    data["chat_id"] = chat_id
+                yield format_sse(event["event"], event["data"])
+
+        except Exception as e:
+            logger.exception("Chat stream failed", extra={"chat_id": chat_id})
+            yield format_sse("error", {"detail": f"Internal Error: {str(e)}"})
+
+        finally:
+            if not saved and (saving is None or saving.done()):
+                # Keep the user's message even if the reply failed or the client
+                # left; shielded since the stream is being cancelled in that case
+                await asyncio.shield(save_user_message())
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/generate-code/stream")
+async def generate_code_stream(request: PromptRequest):
+    """
+    Streams one-off code generation as Server-Sent Events.
+    """
+    async def event_stream():
+        try:
+            async for event in router_agent.route_stream(
+                chat_id=str(uuid.uuid4()), user_input=request.prompt
+            ):
+                yield format_sse(event["event"], event["data"])
+
+        except Exception as e:
+            logger.exception("Code stream failed")
+            yield format_sse("error", {"detail": f"Internal Error: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @app.get("/chat-history/{chat_id}")
-def get_chat_history(chat_id: str, db: Session = Depends(get_db)):
-    session = db.query(db_models.ChatSession).filter_by(chat_id=chat_id).first()
+async def get_chat_history(chat_id: str, db: AsyncSession = Depends(get_async_db)):
+    session = await db.scalar(select(db_models.ChatSession).filter_by(chat_id=chat_id))
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found.")
 
-    messages = (
-        db.query(db_models.ChatMessage)
+    messages = (await db.execute(
+        select(db_models.ChatMessage.role, db_models.ChatMessage.content)
         .filter_by(chat_id=chat_id)
         .order_by(db_models.ChatMessage.id)
-        .all()
-    )
+    )).all()
 
     return {
         "chat_id": chat_id,
@@ -131,52 +282,204 @@ def get_chat_history(chat_id: str, db: Session = Depends(get_db)):
     }
 
 @app.get("/all-chat-history")
-def get_all_chat_history(db: Session = Depends(get_db)):
+async def get_all_chat_history(
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of sessions to return."),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    include_messages: bool = Query(True, description="Set to false for summaries without message bodies."),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Returns one page of chat sessions, newest first, using keyset pagination
+    on (created_at, id). Summaries are read from the session row; messages for
+    the whole page are loaded in one query when requested.
+    """
     try:
-        all_chats = (
-            db.query(db_models.ChatSession)
-            .order_by(db_models.ChatSession.created_at.desc())
-            .all()
+        query = select(db_models.ChatSession).order_by(
+            db_models.ChatSession.created_at.desc(), db_models.ChatSession.id.desc()
         )
 
-        print(f"🗂️ Total chat sessions: {len(all_chats)}")
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
-        chat_histories = []
-        for chat in all_chats:
-            messages = (
-                db.query(db_models.ChatMessage)
-                .filter(db_models.ChatMessage.chat_id == chat.chat_id)
-                .order_by(db_models.ChatMessage.id)
-                .all()
+            # Compare against the stored timestamp of the cursor row so the
+            # keyset is exact regardless of how the driver formats datetimes;
+            # fall back to the encoded value if that row has been deleted
+            anchor_created_at = func.coalesce(
+                select(db_models.ChatSession.created_at)
+                .where(db_models.ChatSession.id == cursor_id)
+                .scalar_subquery(),
+                cursor_created_at,
+            )
+            query = query.where(
+                or_(
+                    db_models.ChatSession.created_at < anchor_created_at,
+                    and_(
+                        db_models.ChatSession.created_at == anchor_created_at,
+                        db_models.ChatSession.id < cursor_id,
+                    ),
+                )
             )
 
-            user_texts = [m.content for m in messages if m.role == "user"]
+        # Fetch one extra row to know whether another page exists
+        page = (await db.scalars(query.limit(limit + 1))).all()
+        has_more = len(page) > limit
+        page = page[:limit]
 
-            try:
-                summary = extract_keywords(user_texts)
-            except Exception as e:
-                print(f"⚠️ Failed to extract keywords for chat {chat.chat_id}: {e}")
-                summary = "Keyword summary failed"
-
-            chat_histories.append(
-                {
-                    "chat_id": chat.chat_id,
-                    "created_at": chat.created_at,
-                    "summary": summary,
-                    "messages": [{"role": m.role, "content": m.content} for m in messages],
-                }
-            )
+        logger.debug("Chat history page", extra={"sessions": len(page), "include_messages": include_messages})
+
+        # Load messages for every session on the page in a single query
+        messages_by_chat = defaultdict(list)
+        if page and include_messages:
+            message_query = select(
+                db_models.ChatMessage.chat_id,
+                db_models.ChatMessage.role,
+                db_models.ChatMessage.content,
+            ).where(db_models.ChatMessage.chat_id.in_([chat.chat_id for chat in page]))
 
-        return {"chats": chat_histories}
+            message_query = message_query.order_by(db_models.ChatMessage.chat_id, db_models.ChatMessage.id)
+            for m in await db.execute(message_query):
+                messages_by_chat[m.chat_id].append(m)
 
+        chat_histories = []
+        for chat in page:
+            chat_summary = {
+                "chat_id": chat.chat_id,
+                "created_at": chat.created_at,
+                "summary": chat.summary or "Untitled Chat",
+            }
+            if include_messages:
+                chat_summary["messages"] = [
+                    {"role": m.role, "content": m.content} for m in messages_by_chat.get(chat.chat_id, [])
+                ]
+            chat_histories.append(chat_summary)
+
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if has_more else None
+
+        return {"chats": chat_histories, "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Listing chat history failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/feedback")
-def submit_feedback(request: FeedbackRequest, db: Session = Depends(get_db)):
-    try:
-        save_feedback_from_request(db, request)
-        return {"message": "Feedback received successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def submit_feedback(request: FeedbackRequest, db: AsyncSession = Depends(get_async_db)):
+    if not await save_feedback_from_request(request, db):
+        raise HTTPException(status_code=500, detail="Feedback could not be saved.")
+    return {"message": "Feedback received successfully"}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: request, stage and agent latency histograms,
+    LLM token counts, and the counters behind the /debug endpoints.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+def slow_request_traces():
+    return {"threshold_seconds": tracing.TRACE_SLOW_REQUEST_SECONDS, "traces": tracing.slow_traces()}
+
+@app.get("/debug/response-cache")
+def response_cache_stats():
+    return response_cache.stats()
+
+@app.get("/debug/single-flight")
+def single_flight_stats():
+    return router_agent.flights.stats()
+
+@app.get("/debug/agent-health")
+def agent_health_stats():
+    return router_agent.resilience_stats()
+
+@app.get("/debug/llm-client")
+def llm_client_stats():
+    return llm_client.stats()
+
+@app.get("/debug/jobs")
+def job_worker_stats():
+    return job_queue.job_workers.stats()
+
+@app.get("/debug/context-cache")
+def context_cache_stats():
+    return context_cache.stats()
+
+@app.get("/debug/db-pool")
+def db_pool_stats():
+    return {"async": async_pool_metrics.stats(), "sync": sync_pool_metrics.stats()}
+
+BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+def collect_runtime_metrics():
+    """
+    Reads the stats behind the /debug endpoints for /metrics.
+    """
+    pools = [async_pool_metrics.stats(), sync_pool_metrics.stats()]
+    yield "db_pool_checked_out", "gauge", "Database connections in use.", [
+        ({"engine": pool["engine"]}, pool["checked_out"]) for pool in pools
+    ]
+    yield "db_pool_overflow", "gauge", "Connections open beyond the pool size.", [
+        ({"engine": pool["engine"]}, pool["overflow"]) for pool in pools
+    ]
+    yield "db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", [
+        ({"engine": pool["engine"]}, pool["wait_seconds_total"]) for pool in pools
+    ]
+    yield "db_pool_timeouts_total", "counter", "Connection checkouts that timed out.", [
+        ({"engine": pool["engine"]}, pool["timeouts"]) for pool in pools
+    ]
+
+    caches = {"response": response_cache.stats(), "context": context_cache.stats()}
+    yield "cache_hits_total", "counter", "Cache hits.", [({"cache": name}, c["hits"]) for name, c in caches.items()]
+    yield "cache_misses_total", "counter", "Cache misses.", [({"cache": name}, c["misses"]) for name, c in caches.items()]
+    yield "cache_entries", "gauge", "Entries held by the cache.", [({"cache": name}, c["size"]) for name, c in caches.items()]
+
+    client = llm_client.stats()
+    yield "llm_in_flight", "gauge", "LLM calls in progress.", [({}, client["in_flight"])]
+    yield "llm_calls_total", "counter", "Completed LLM calls.", [({}, client["total_calls"])]
+    yield "llm_failed_calls_total", "counter", "LLM calls that failed on every provider.", [({}, client["failed_calls"])]
+    yield "llm_failovers_total", "counter", "Calls moved to another provider.", [({}, client["failovers"])]
+    providers = client["providers"]
+    yield "llm_provider_latency_seconds", "gauge", "Recent (EWMA) provider latency.", [
+        ({"provider": name}, p["health"]["ewma_latency_s"]) for name, p in providers.items()
+    ]
+    yield "llm_provider_error_rate", "gauge", "Recent (EWMA) provider error rate.", [
+        ({"provider": name}, p["health"]["error_rate"]) for name, p in providers.items()
+    ]
+    yield "rate_limiter_waiting", "gauge", "Calls waiting for rate limiter capacity.", [
+        ({"provider": name}, p["rate_limiter"]["waiting"]) for name, p in providers.items()
+    ]
+    yield "rate_limiter_throttled_total", "counter", "429 answers received.", [
+        ({"provider": name}, p["rate_limiter"]["throttled"]) for name, p in providers.items()
+    ]
+    yield "prompt_cache_hits_total", "counter", "Requests served from a cached prompt prefix.", [
+        ({"provider": name}, p["prompt_cache"]["hits"]) for name, p in providers.items() if "prompt_cache" in p
+    ]
+
+    resilience = router_agent.resilience_stats()
+    yield "breaker_state", "gauge", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", [
+        ({"agent": name}, BREAKER_STATES.get(b["state"])) for name, b in resilience["breakers"].items()
+    ]
+    yield "breaker_opened_total", "counter", "Times the circuit breaker opened.", [
+        ({"agent": name}, b["times_opened"]) for name, b in resilience["breakers"].items()
+    ]
+    yield "agent_timeouts_total", "counter", "Agent and fallback calls past their deadline.", [({}, resilience["timeouts"])]
+    yield "hedged_calls_total", "counter", "Hedged second calls started.", [({}, resilience["hedges"])]
+    yield "single_flight_shared_total", "counter", "Requests that shared an in-flight call.", [
+        ({}, router_agent.flights.stats()["shared"])
+    ]
+
+    yield "log_records_dropped_total", "counter", "Log records dropped because the log queue was full.", [
+        ({}, log.stats()["dropped"])
+    ]
+
+    jobs = job_queue.job_workers.stats()
+    yield "job_workers_busy", "gauge", "Background jobs running in this process.", [({}, jobs["running"])]
+    yield "jobs_finished_total", "counter", "Background jobs finished in this process.", [
+        ({"status": "succeeded"}, jobs["succeeded"]), ({"status": "failed"}, jobs["failed"])
+    ]
+
+metrics.registry.register_collector(collect_runtime_metrics)
@@ -0,0 +1,138 @@
+"""
+This module is the one place where the Gemini SDK is configured and model
+objects are built. Each (model key, system instruction) pair is constructed
+once, with its generation config and safety settings, and then reused. All
+models share the SDK's default client and so one gRPC/HTTP channel per process.
+
+Model names are set here as well: GEMINI_MODEL applies to every caller, and
+GEMINI_AGENT_MODELS gives individual agents (by agent name) or the fallback
+handler ("fallback") a different model, e.g.
+"BugFixer=gemini-2.5-pro,fallback=gemini-2.5-flash-lite".
+
+Author: Emzyking AI
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+# Load environment variables and configure the Gemini SDK once per process
+load_dotenv()
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_AGENT_MODELS = os.getenv("GEMINI_AGENT_MODELS", "")
+GEMINI_TEMPERATURE = os.getenv("GEMINI_TEMPERATURE")
+GEMINI_MAX_OUTPUT_TOKENS = os.getenv("GEMINI_MAX_OUTPUT_TOKENS")
+# A block threshold such as BLOCK_ONLY_HIGH, applied to every harm category
+GEMINI_SAFETY_THRESHOLD = os.getenv("GEMINI_SAFETY_THRESHOLD")
+
+DEFAULT_MODEL_KEY = "default"
+FALLBACK_MODEL_KEY = "fallback"
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """
+    Settings used to construct one model.
+    """
+    model_name: str
+    generation_config: Optional[Dict[str, Any]] = None
+    safety_settings: Optional[Any] = None
+
+
+def load_model_configs() -> Dict[str, ModelConfig]:
+    """
+    Builds the model configurations from environment variables.
+
+    Returns:
+        Dict[str, ModelConfig]: Configs by model key; always has DEFAULT_MODEL_KEY.
+    """
+    generation_config = {}
+    if GEMINI_TEMPERATURE:
+        generation_config["temperature"] = float(GEMINI_TEMPERATURE)
+    if GEMINI_MAX_OUTPUT_TOKENS:
+        generation_config["max_output_tokens"] = int(GEMINI_MAX_OUTPUT_TOKENS)
+
+    def config(model_name: str) -> ModelConfig:
+        return ModelConfig(model_name, generation_config or None, GEMINI_SAFETY_THRESHOLD or None)
+
+    configs = {DEFAULT_MODEL_KEY: config(GEMINI_MODEL)}
+    for entry in GEMINI_AGENT_MODELS.split(","):
+        if "=" in entry:
+            key, model_name = (part.strip() for part in entry.split("=", 1))
+            configs[key] = config(model_name)
+    return configs
+
+
+class ModelRegistry:
+    """
+    Builds each configured model once and hands out the shared instance.
+    """
+
+    def __init__(
+        self,
+        configs: Optional[Dict[str, ModelConfig]] = None,
+        model_factory: Callable[..., Any] = genai.GenerativeModel
+    ):
+        """
+        Args:
+            configs (Dict[str, ModelConfig] | None): Configs by key; defaults to the environment.
+            model_factory (Callable): Builds a model from a model name and keyword settings.
+        """
+        self.configs = configs or load_model_configs()
+        self.model_factory = model_factory
+        self._models: Dict[Tuple[str, Optional[str]], Any] = {}
+
+    def config(self, key: str = DEFAULT_MODEL_KEY) -> ModelConfig:
+        """
+        Returns the config for a key, or the default config if the key has none.
+        """
+        return self.configs.get(key) or self.configs[DEFAULT_MODEL_KEY]
+
+    def model_name(self, key: str = DEFAULT_MODEL_KEY) -> str:
+        """
+        Returns the model name used for a key.
+        """
+        return self.config(key).model_name
+
+    def get(self, key: str = DEFAULT_MODEL_KEY, system_instruction: Optional[str] = None) -> Any:
+        """
+        Returns the model for a key and system instruction, building it on first use.
+
+        Args:
+            key (str): Agent name, FALLBACK_MODEL_KEY, or DEFAULT_MODEL_KEY.
+            system_instruction (str | None): Static instructions baked into the model.
+
+        Returns:
+            Any: A GenerativeModel (or whatever model_factory builds).
+        """
+        if key not in self.configs:
+            key = DEFAULT_MODEL_KEY
+        model = self._models.get((key, system_instruction))
+        if model is None:
+            config = self.configs[key]
+            kwargs: Dict[str, Any] = {}
+            if config.generation_config:
+                kwargs["generation_config"] = config.generation_config
+            if config.safety_settings:
+                kwargs["safety_settings"] = config.safety_settings
+            if system_instruction is not None:
+                kwargs["system_instruction"] = system_instruction
+            model = self._models[(key, system_instruction)] = self.model_factory(config.model_name, **kwargs)
+        return model
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the configured model names and how many models have been built.
+        """
+        return {
+            "models": {key: config.model_name for key, config in self.configs.items()},
+            "constructed": len(self._models),
+        }
+
+
+# Shared registry used by the LLM client
+model_registry = ModelRegistry()
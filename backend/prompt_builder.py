@@ -0,0 +1,110 @@
+"""
+This module assembles model prompts in three parts: the agent's static system
+instruction, the conversation history, and the per-request content (memory
+items plus the current request). Keeping the parts separate lets the client
+send the instruction as Gemini's system_instruction and keep the history in a
+cached-content prefix that later turns of the same chat reuse.
+
+Author: Emzyking AI
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.context.chat_context import ChatContext
+
+# ChatMessage roles mapped to Gemini content roles
+_ROLES = {"user": "user", "assistant": "model"}
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A prompt split into its static and per-request parts.
+    """
+    system_instruction: str
+    request: str
+    history: Tuple[Tuple[str, str], ...] = ()  # (role, content), oldest first, starts with a user turn
+    chat_id: Optional[str] = None
+
+    def history_contents(self, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns history[start:end] as Gemini contents, merging consecutive
+        turns with the same role (e.g. a user message whose reply was never saved).
+        """
+        contents: List[Dict[str, Any]] = []
+        for role, text in self.history[start:end]:
+            role = _ROLES.get(role, "user")
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"][0] += f"\n\n{text}"
+            else:
+                contents.append({"role": role, "parts": [text]})
+        return contents
+
+    def contents(self, start: int = 0) -> List[Dict[str, Any]]:
+        """
+        Returns the contents to send after the first `start` history turns,
+        which are either already in a cached prefix (start > 0) or sent here.
+
+        Args:
+            start (int): Number of history turns covered by cached content.
+
+        Returns:
+            List[Dict[str, Any]]: Remaining history turns followed by the request.
+        """
+        contents = self.history_contents(start)
+        if contents and contents[-1]["role"] == "user":
+            contents[-1]["parts"][0] += f"\n\n{self.request}"
+        else:
+            contents.append({"role": "user", "parts": [self.request]})
+        return contents
+
+    def last_model_turn(self) -> int:
+        """
+        Returns the number of history turns up to and including the last
+        assistant reply, i.e. the longest prefix that can be cached on its own.
+        """
+        for index in range(len(self.history) - 1, -1, -1):
+            if self.history[index][0] == "assistant":
+                return index + 1
+        return 0
+
+    def text(self) -> str:
+        """
+        Returns the prompt flattened into one string, for logging and for
+        callers that cannot send a system instruction.
+        """
+        parts = [self.system_instruction]
+        if self.history:
+            parts.append(f"💬 Recent Conversation:\n{ChatContext.render_turns(self.history)}")
+        parts.append(self.request)
+        return "\n\n".join(parts)
+
+
+def build_prompt(system_instruction: str, request: str, context: Optional[ChatContext] = None) -> Prompt:
+    """
+    Builds a Prompt for an agent from its fixed instructions, the formatted
+    request, and the conversation context.
+
+    Args:
+        system_instruction (str): The agent's static instructions.
+        request (str): The current request, already in the agent's template.
+        context (ChatContext | None): Conversation context for the request.
+
+    Returns:
+        Prompt: Instruction, history, and per-request content kept apart.
+    """
+    if context is None:
+        return Prompt(system_instruction, request)
+
+    # Gemini expects the conversation to open with a user turn
+    history = list(context.turns)
+    while history and history[0][0] != "user":
+        history.pop(0)
+
+    return Prompt(
+        system_instruction=system_instruction,
+        request=context.memory_section() + request,
+        history=tuple(history),
+        chat_id=context.chat_id,
+    )
@@ -0,0 +1,276 @@
+"""
+This module keeps Gemini cached-content prefixes for long-running chats. Once
+a chat's system instruction and history pass the provider's minimum cacheable
+size, they are stored as cached content and later turns send only the turns
+added since then plus the new request. As the history window slides, the
+oldest cached turns keep being sent from cache (they are cheap there) until
+either they or the uncached tail grow past the caching minimum, at which point
+the prefix is cached again.
+
+A chat that alternates agents (and so system instructions or models) keeps
+one prefix per instruction and model, so switching back and forth reuses
+them instead of replacing one cached prefix every turn.
+
+Shorter prompts are not cached explicitly; they still benefit from Gemini's
+implicit prefix caching because the instruction and history come first.
+
+Author: Emzyking AI
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+import google.generativeai as genai
+from google.generativeai import caching
+
+from backend.context.token_budget import estimate_tokens
+from backend.log import get_logger
+from backend.model_registry import ModelConfig
+from backend.prompt_builder import Prompt
+from backend.single_flight import SingleFlight
+
+load_dotenv()
+
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+# Gemini 2.5 Flash rejects cached content below 1,024 tokens
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "600"))
+PROMPT_CACHE_MAX_CHATS = int(os.getenv("PROMPT_CACHE_MAX_CHATS", "256"))
+PROMPT_CACHE_MAX_PREFIXES_PER_CHAT = int(os.getenv("PROMPT_CACHE_MAX_PREFIXES_PER_CHAT", "4"))
+
+logger = get_logger(__name__)
+
+# Stop using an entry this long before the provider expires it
+_EXPIRY_MARGIN_SECONDS = 30
+
+
+class GeminiCachedContentAPI:
+    """
+    Creates and deletes Gemini cached content. The SDK's caching calls are
+    blocking, so they run on a worker thread.
+    """
+
+    async def create(self, model_name: str, system_instruction: str, contents: List[Dict[str, Any]], ttl_seconds: int) -> Any:
+        return await asyncio.to_thread(
+            caching.CachedContent.create,
+            model=model_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+
+    async def delete(self, handle: Any) -> None:
+        await asyncio.to_thread(handle.delete)
+
+    def model(self, handle: Any, config: ModelConfig) -> Any:
+        return genai.GenerativeModel.from_cached_content(
+            cached_content=handle,
+            generation_config=config.generation_config,
+            safety_settings=config.safety_settings,
+        )
+
+
+@dataclass
+class _CachedPrefix:
+    handle: Any
+    model: Any
+    config: ModelConfig
+    system_instruction: str
+    turns: Tuple[Tuple[str, str], ...]
+    expires_at: float
+
+
+# A chat's prefixes are kept per (model name, system instruction)
+_PrefixKey = Tuple[str, str]
+
+
+class PromptCache:
+    """
+    Per-chat cached-content prefixes, one per model and system instruction,
+    bounded by chat count and by prefixes per chat. API errors are logged and
+    the prompt is sent uncached.
+    """
+
+    def __init__(
+        self,
+        api: Any = None,
+        min_tokens: int = PROMPT_CACHE_MIN_TOKENS,
+        ttl_seconds: int = PROMPT_CACHE_TTL_SECONDS,
+        max_chats: int = PROMPT_CACHE_MAX_CHATS,
+        max_prefixes_per_chat: int = PROMPT_CACHE_MAX_PREFIXES_PER_CHAT,
+        enabled: bool = PROMPT_CACHE_ENABLED
+    ):
+        """
+        Args:
+            api: Object with async create()/delete() and model(handle, config); defaults to Gemini.
+            min_tokens (int): Smallest prefix, in estimated tokens, worth caching.
+            ttl_seconds (int): Lifetime of each cached prefix at the provider.
+            max_chats (int): Chats holding a cached prefix at once.
+            max_prefixes_per_chat (int): Prefixes one chat keeps, for agents with different instructions.
+            enabled (bool): Turns explicit prefix caching on or off.
+        """
+        self.api = api or GeminiCachedContentAPI()
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.max_chats = max_chats
+        self.max_prefixes_per_chat = max_prefixes_per_chat
+        self.enabled = enabled
+        self.flights = SingleFlight()
+        self._entries: "OrderedDict[str, OrderedDict[_PrefixKey, _CachedPrefix]]" = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.creations = 0
+        self.skipped = 0
+        self.errors = 0
+
+    @staticmethod
+    def _tokens(turns: Tuple[Tuple[str, str], ...]) -> int:
+        return sum(estimate_tokens(content) for _, content in turns)
+
+    @staticmethod
+    def _covered(cached: Tuple[Tuple[str, str], ...], history: Tuple[Tuple[str, str], ...]) -> Optional[int]:
+        """
+        Returns how many leading history turns the cached turns cover, allowing
+        for turns that have slid out of the window since, or None if the
+        history does not continue the cached turns.
+        """
+        if not history:
+            return None
+        for dropped in range(len(cached)):
+            covered = len(cached) - dropped
+            if cached[dropped] == history[0] and cached[dropped:] == history[:covered]:
+                return covered
+        return None
+
+    def _live(self, chat_id: str, prefix_key: _PrefixKey) -> Optional[_CachedPrefix]:
+        prefixes = self._entries.get(chat_id)
+        entry = prefixes.get(prefix_key) if prefixes else None
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del prefixes[prefix_key]
+            if not prefixes:
+                del self._entries[chat_id]
+            return None
+        self._entries.move_to_end(chat_id)
+        prefixes.move_to_end(prefix_key)
+        return entry
+
+    async def acquire(self, prompt: Prompt, config: ModelConfig) -> Optional[Tuple[Any, int]]:
+        """
+        Returns a model bound to a cached prefix of the prompt's history and
+        the number of history turns that prefix covers, or None to send the
+        prompt uncached. The cached prefix may also hold a few older turns
+        that have since left the history window.
+
+        Args:
+            prompt (Prompt): Prompt about to be sent.
+            config (ModelConfig): Model the prompt is for.
+
+        Returns:
+            Tuple[Any, int] | None: (model, covered turns), or None.
+        """
+        if not self.enabled or not prompt.chat_id or not prompt.history:
+            return None
+
+        boundary = prompt.last_model_turn()
+        entry = self._live(prompt.chat_id, (config.model_name, prompt.system_instruction))
+        if entry is not None and entry.config == config:
+            covered = self._covered(entry.turns, prompt.history)
+            # Keep the entry until the turns added since, or those that slid
+            # out of the window, are worth caching on their own
+            if (
+                covered is not None
+                and self._tokens(prompt.history[covered:boundary]) < self.min_tokens
+                and self._tokens(entry.turns[:len(entry.turns) - covered]) < self.min_tokens
+            ):
+                self.hits += 1
+                return entry.model, covered
+
+        prefix = prompt.history[:boundary]
+        if estimate_tokens(prompt.system_instruction) + self._tokens(prefix) < self.min_tokens:
+            self.skipped += 1
+            return None
+
+        key = f"{prompt.chat_id}:{hash((config.model_name, prompt.system_instruction, prefix))}"
+        entry = await self.flights.do(key, lambda: self._create(prompt, config, boundary))
+        if entry is None:
+            return None
+        return entry.model, len(entry.turns)
+
+    async def _create(self, prompt: Prompt, config: ModelConfig, boundary: int) -> Optional[_CachedPrefix]:
+        try:
+            handle = await self.api.create(
+                config.model_name, prompt.system_instruction, prompt.history_contents(end=boundary), self.ttl_seconds
+            )
+            model = self.api.model(handle, config)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Prompt cache create failed", extra={"chat_id": prompt.chat_id, "error": str(e)})
+            return None
+
+        self.creations += 1
+        entry = _CachedPrefix(
+            handle=handle,
+            model=model,
+            config=config,
+            system_instruction=prompt.system_instruction,
+            turns=prompt.history[:boundary],
+            expires_at=time.monotonic() + self.ttl_seconds - _EXPIRY_MARGIN_SECONDS,
+        )
+
+        prefixes = self._entries.setdefault(prompt.chat_id, OrderedDict())
+        self._entries.move_to_end(prompt.chat_id)
+        prefix_key = (config.model_name, prompt.system_instruction)
+        stale = [prefixes.pop(prefix_key, None)]
+        prefixes[prefix_key] = entry
+        while len(prefixes) > self.max_prefixes_per_chat:
+            stale.append(prefixes.popitem(last=False)[1])
+        while len(self._entries) > self.max_chats:
+            stale.extend(self._entries.popitem(last=False)[1].values())
+
+        # Replaced prefixes are billed until they expire, so delete them now
+        for old in stale:
+            if old is not None:
+                await self._delete(old)
+        return entry
+
+    async def _delete(self, entry: _CachedPrefix) -> None:
+        try:
+            await self.api.delete(entry.handle)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Prompt cache delete failed", extra={"error": str(e)})
+
+    def invalidate(self, chat_id: str) -> None:
+        """
+        Forgets a chat's prefixes, e.g. after the provider reports one missing.
+        """
+        self._entries.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns prefix reuse counters for the prompt cache.
+        """
+        return {
+            "enabled": self.enabled,
+            "chats": len(self._entries),
+            "prefixes": sum(len(prefixes) for prefixes in self._entries.values()),
+            "max_chats": self.max_chats,
+            "max_prefixes_per_chat": self.max_prefixes_per_chat,
+            "min_tokens": self.min_tokens,
+            "hits": self.hits,
+            "creations": self.creations,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+# Shared prompt cache used by the LLM client
+prompt_cache = PromptCache()
@@ -6,17 +6,23 @@ Author: Emzyking AI
 """
 
 import os
+import threading
 import joblib
-from typing import List, Tuple
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
 from sklearn.pipeline import Pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.svm import LinearSVC
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 
+from backend.log import get_logger
+
 # Path to save trained model
 MODEL_PATH = "models/agent_ranking_model.joblib"
 
+logger = get_logger(__name__)
+
 def train_ranking_model(training_data: List[Tuple[str, str]]) -> None:
     """
     Train and save a text classifier to map prompts to agent labels.
@@ -35,11 +41,14 @@ def train_ranking_model(training_data: List[Tuple[str, str]]) -> None:
     pipeline.fit(X_train, y_train)
 
     y_pred = pipeline.predict(X_test)
-    print("[Model Evaluation]\n", classification_report(y_test, y_pred))
+    logger.info("Ranking model evaluated", extra={"report": classification_report(y_test, y_pred, output_dict=True)})
 
+    # Write to a temp file and swap it in, so hot reloads never see a partial file
     os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-    joblib.dump(pipeline, MODEL_PATH)
-    print(f"[Model Saved] to {MODEL_PATH}")
+    tmp_path = f"{MODEL_PATH}.tmp"
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, MODEL_PATH)
+    logger.info("Ranking model saved", extra={"path": MODEL_PATH})
 
 def load_model() -> Pipeline:
     """
@@ -52,27 +61,94 @@ def load_model() -> Pipeline:
         raise FileNotFoundError(f"Model not found at {MODEL_PATH}. Train it first.")
     return joblib.load(MODEL_PATH)
 
-def score_prompt(prompt: str, agent_labels: List[str]) -> List[Tuple[str, float]]:
+# Process-wide model cache, refreshed when MODEL_PATH's mtime changes
+_model_lock = threading.Lock()
+_cached_model: Optional[Pipeline] = None
+_cached_mtime: Optional[float] = None
+
+
+def get_model() -> Pipeline:
     """
-    Scores a prompt against a list of agent labels using the trained model.
+    Return the cached ranking model, loading it on first use and reloading
+    it whenever the file at MODEL_PATH is replaced (e.g. after retraining).
+
+    Returns:
+        Pipeline: Trained scikit-learn pipeline.
+    """
+    global _cached_model, _cached_mtime
+
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        raise FileNotFoundError(f"Model not found at {MODEL_PATH}. Train it first.")
+
+    if _cached_model is not None and mtime == _cached_mtime:
+        return _cached_model
+
+    with _model_lock:
+        if _cached_model is None or mtime != _cached_mtime:
+            _cached_model = load_model()
+            _cached_mtime = mtime
+            logger.info("Ranking model loaded", extra={"path": MODEL_PATH})
+
+    return _cached_model
+
+
+def _decision_scores(clf, vectorized) -> np.ndarray:
+    """
+    Returns an (n_prompts, n_classes) score matrix. Binary classifiers return a
+    single column from decision_function, which is expanded to both classes.
+    """
+    if not hasattr(clf, "decision_function"):
+        raise ValueError("Classifier does not support confidence scoring.")
+
+    scores = clf.decision_function(vectorized)
+    if scores.ndim == 1:
+        scores = np.column_stack([-scores, scores])
+    return scores
+
+
+def score_prompts(prompts: Sequence[str], agent_labels: Optional[List[str]] = None) -> List[List[Tuple[str, float]]]:
+    """
+    Scores many prompts with one vectorizer call and one decision_function call.
 
     Args:
-        prompt (str): User input prompt.
-        agent_labels (List[str]): Candidate agent labels.
+        prompts (Sequence[str]): User input prompts.
+        agent_labels (List[str], optional): Restrict results to these labels.
 
     Returns:
-        List[Tuple[str, float]]: List of (agent_label, confidence_score) sorted by confidence.
+        List[List[Tuple[str, float]]]: For each prompt, (agent_label, confidence_score)
+        pairs sorted by confidence.
     """
-    model = load_model()
+    if not prompts:
+        return []
+
+    model = get_model()
     clf = model.named_steps["clf"]
-    vectorized_prompt = model.named_steps["tfidf"].transform([prompt])
+    vectorized_prompts = model.named_steps["tfidf"].transform(list(prompts))
+    scores = _decision_scores(clf, vectorized_prompts)
+
+    allowed = set(agent_labels) if agent_labels else None
+    results = []
+    for row in scores:
+        confidence_scores = [
+            (str(label), float(score)) for label, score in zip(clf.classes_, row)
+            if allowed is None or label in allowed
+        ]
+        confidence_scores.sort(key=lambda x: x[1], reverse=True)
+        results.append(confidence_scores)
+    return results
+
+
+def score_prompt(prompt: str, agent_labels: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """
+    Scores a prompt against a list of agent labels using the trained model.
 
-    # Use decision function for confidence scores if available
-    if hasattr(clf, "decision_function"):
-        scores = clf.decision_function(vectorized_prompt)
-    else:
-        raise ValueError("Classifier does not support confidence scoring.")
+    Args:
+        prompt (str): User input prompt.
+        agent_labels (List[str], optional): Candidate agent labels.
 
-    confidence_scores = list(zip(clf.classes_, scores[0]))
-    confidence_scores.sort(key=lambda x: x[1], reverse=True)
-    return confidence_scores
+    Returns:
+        List[Tuple[str, float]]: List of (agent_label, confidence_score) sorted by confidence.
+    """
+    return score_prompts([prompt], agent_labels)[0]
@@ -0,0 +1,348 @@
+"""
+This module governs upstream LLM traffic for the whole worker. Requests take
+a permit from a requests-per-minute bucket and a tokens-per-minute bucket and
+a slot from a concurrency semaphore before they are sent, so bursts queue
+briefly instead of running into the provider's quota.
+
+When the provider still answers 429, the call is retried with jittered
+exponential backoff, honoring any retry delay the provider sends. Every
+caller pauses until that delay has passed, and the request rate is halved
+and then recovers gradually as calls succeed.
+
+Author: Emzyking AI
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+load_dotenv()
+
+# Limits of 0 turn the corresponding check off
+LLM_RPM_LIMIT = float(os.getenv("LLM_RPM_LIMIT", "1000"))
+LLM_TPM_LIMIT = float(os.getenv("LLM_TPM_LIMIT", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE_SECONDS = float(os.getenv("LLM_MAX_QUEUE_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Output tokens reserved per request until the response reports real usage
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "500"))
+
+T = TypeVar("T")
+
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request cannot be scheduled within the queueing deadline.
+    """
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """
+    Returns True if e means the provider quota or the local limit was hit.
+    """
+    if isinstance(e, (RateLimitExceeded, google_exceptions.TooManyRequests)):
+        return True
+    return "Quota" in str(e) or "429" in str(e)
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """
+    Extracts the provider's suggested retry delay, in seconds, from a 429
+    error: a Retry-After header, a RetryInfo detail, or the error text.
+    """
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    for detail in getattr(e, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return getattr(delay, "seconds", 0) + getattr(delay, "nanos", 0) / 1e9
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            return float(str(detail["retryDelay"]).rstrip("s"))
+
+    match = _RETRY_IN.search(str(e)) or _RETRY_DELAY.search(str(e))
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """
+    Holds up to `limit` units and refills continuously at limit / period
+    units per second. Waiters are served in arrival order.
+    """
+
+    def __init__(self, limit: float, period: float = 60.0):
+        self.limit = limit
+        self.period = period
+        self.max_rate = limit / period
+        self.rate = self.max_rate
+        self.capacity = limit
+        self.level = limit
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, amount: float, deadline: float) -> float:
+        """
+        Waits until amount units are available and takes them.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            RateLimitExceeded: If the units would not be available before deadline.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            wait = max(amount - self.level, 0) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded("429 Local rate limit: no capacity before the deadline")
+            if wait:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.level -= amount
+            return wait
+
+    def give_back(self, amount: float) -> None:
+        """
+        Adjusts the level after the real cost of a request is known. Negative
+        amounts take more; the level may go below zero.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Shared RPM/TPM buckets, concurrency cap, and 429 retry policy.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM_LIMIT,
+        tpm: float = LLM_TPM_LIMIT,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue_seconds: float = LLM_MAX_QUEUE_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_seconds: float = LLM_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = LLM_RETRY_MAX_SECONDS,
+        period: float = 60.0
+    ):
+        """
+        Args:
+            rpm (float): Requests per minute (0 = unlimited).
+            tpm (float): Estimated tokens per minute (0 = unlimited).
+            max_concurrency (int): Requests in flight at once (0 = unlimited).
+            max_queue_seconds (float): Longest a request waits for permits before failing.
+            max_retries (int): Retries after a 429.
+            retry_base_seconds (float): First backoff step; doubles on each retry.
+            retry_max_seconds (float): Upper bound of a single backoff.
+            period (float): Seconds the rpm/tpm limits apply to (60 outside of benchmarks).
+        """
+        self.requests = TokenBucket(rpm, period) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, period) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.max_queue_seconds = max_queue_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._paused_until = 0.0
+
+        # Counters
+        self.waiting = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+
+    async def _acquire(self, tokens: int) -> None:
+        deadline = time.monotonic() + self.max_queue_seconds
+        self.waiting += 1
+        start = time.perf_counter()
+        # (bucket, amount) taken so far, returned if a later stage fails
+        taken = []
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                if time.monotonic() + pause > deadline:
+                    raise RateLimitExceeded("429 Provider quota exhausted; retry later")
+                await asyncio.sleep(pause)
+            if self.requests is not None:
+                await self.requests.take(1, deadline)
+                taken.append((self.requests, 1))
+            if self.tokens is not None:
+                await self.tokens.take(tokens, deadline)
+                taken.append((self.tokens, min(tokens, self.tokens.capacity)))
+            if self._semaphore is not None:
+                await asyncio.wait_for(self._semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except (RateLimitExceeded, asyncio.TimeoutError):
+            self._give_back(taken)
+            self.rejected += 1
+            raise RateLimitExceeded("429 Local rate limit: request could not be scheduled in time")
+        except BaseException:
+            # Cancelled while queued: the request is not sent either
+            self._give_back(taken)
+            raise
+        finally:
+            self.waiting -= 1
+            waited = time.perf_counter() - start
+            if waited > 0.001:
+                self.queued += 1
+                self.total_wait += waited
+
+    @staticmethod
+    def _give_back(taken) -> None:
+        for bucket, amount in taken:
+            bucket.give_back(amount)
+
+    def _release(self) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        """
+        Returns the delay before the next attempt and slows the request rate.
+        """
+        self.throttled += 1
+        hinted = retry_after(e)
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        if hinted is not None:
+            delay = hinted + random.uniform(0, self.retry_base_seconds)
+
+        # Everyone waits out the provider's delay, then resumes at half rate;
+        # 429s from requests already in flight during the pause slow it only once
+        now = time.monotonic()
+        if self.requests is not None and now >= self._paused_until:
+            self.requests.rate = max(self.requests.rate / 2, self.requests.max_rate / 64)
+            self.requests.level = min(self.requests.level, 0)
+        self._paused_until = max(self._paused_until, now + delay)
+        return delay
+
+    def _recover(self) -> None:
+        if self.requests is not None and self.requests.rate < self.requests.max_rate:
+            self.requests.rate = min(self.requests.rate * 1.1, self.requests.max_rate)
+
+    def paused_for(self) -> float:
+        """
+        Returns how many seconds remain until the provider's last retry delay has passed.
+        """
+        return max(self._paused_until - time.monotonic(), 0.0)
+
+    def reconcile(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Corrects the token bucket once a response reports its real token usage.
+        """
+        if self.tokens is not None and used_tokens:
+            self.tokens.give_back(estimated_tokens - used_tokens)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], tokens: int, retries: Optional[int] = None) -> T:
+        """
+        Runs fn() once permits are available, retrying on 429.
+
+        Args:
+            fn (Callable): Zero-argument coroutine function performing the request.
+            tokens (int): Estimated tokens the request will use.
+            retries (int | None): Overrides max_retries, e.g. 0 when another provider can take the request.
+
+        Returns:
+            T: fn()'s result.
+
+        Raises:
+            RateLimitExceeded: If no permit was available within max_queue_seconds.
+            Exception: fn()'s error once retries are exhausted or for non-429 errors.
+        """
+        max_retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            await self._acquire(tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+            else:
+                self._recover()
+                return result
+            finally:
+                self._release()
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def stream(
+        self,
+        fn: Callable[[], AsyncIterator[str]],
+        tokens: int,
+        retries: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of call(). A 429 is retried only if it arrives
+        before the first chunk; the concurrency slot is held until the stream ends.
+        """
+        max_retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            await self._acquire(tokens)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started or not is_rate_limit_error(e) or attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+            else:
+                self._recover()
+                return
+            finally:
+                self._release()
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns queueing and throttling counters for the limiter.
+        """
+        return {
+            "rpm_limit": self.requests.max_rate * 60 if self.requests else None,
+            "rpm_current": round(self.requests.rate * 60, 1) if self.requests else None,
+            "tpm_limit": self.tokens.max_rate * 60 if self.tokens else None,
+            "tpm_available": int(self.tokens.level) if self.tokens else None,
+            "max_concurrency": self.max_concurrency or None,
+            "waiting": self.waiting,
+            "queued": self.queued,
+            "avg_queue_ms": self.total_wait / self.queued * 1000 if self.queued else 0.0,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+# Shared limiter used by the LLM client
+rate_limiter = RateLimiter()
@@ -0,0 +1,217 @@
+"""
+This module bounds how long and how often the RouterAgent waits on agents:
+per-agent deadlines, a circuit breaker per agent (and one for the fallback
+handler) that opens after consecutive failures, and optional hedged requests
+that start a second identical call once the first runs past the agent's
+recent p95 latency.
+
+Author: Emzyking AI
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", "45"))
+# Per-agent overrides, e.g. "BugFixer=60,CodeExplainer=30"
+AGENT_TIMEOUTS = os.getenv("AGENT_TIMEOUTS", "")
+FALLBACK_TIMEOUT_SECONDS = float(os.getenv("FALLBACK_TIMEOUT_SECONDS", "30"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1"))
+
+T = TypeVar("T")
+
+
+def _parse_timeouts(raw: str) -> Dict[str, float]:
+    timeouts = {}
+    for entry in raw.split(","):
+        if "=" in entry:
+            name, seconds = (part.strip() for part in entry.split("=", 1))
+            timeouts[name] = float(seconds)
+    return timeouts
+
+
+_AGENT_TIMEOUT_OVERRIDES = _parse_timeouts(AGENT_TIMEOUTS)
+
+
+def agent_timeout(agent_name: str) -> float:
+    """
+    Returns the deadline, in seconds, for one call to the named agent.
+    """
+    return _AGENT_TIMEOUT_OVERRIDES.get(agent_name, AGENT_TIMEOUT_SECONDS)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass. After `failure_threshold` consecutive failures it
+    opens and calls are refused for `reset_seconds`. Then one trial call is
+    let through (half-open): success closes the breaker, failure reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+        # Counters
+        self.times_opened = 0
+        self.refused = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Returns True if a call may go ahead now.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # A trial that never reported back (e.g. cancelled) is replaced after reset_seconds
+        if state == "half-open" and (self._trial_started is None or now - self._trial_started >= self.reset_seconds):
+            self._trial_started = now
+            return True
+        self.refused += 1
+        return False
+
+    def check(self) -> None:
+        """
+        Like allow(), but raises CircuitOpenError when the call may not go ahead.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit open for {self.name}; skipped for up to {self.reset_seconds:.0f}s")
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_started is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        self._trial_started = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "refused": self.refused,
+        }
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent successful call latencies of one agent.
+    """
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Returns the pct-th percentile latency, or None below HEDGE_MIN_SAMPLES samples.
+        """
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def hedged(
+    fn: Callable[[], Awaitable[T]],
+    hedge_after: Optional[float],
+    accept: Callable[[T], bool] = lambda _: True,
+    on_hedge: Optional[Callable[[], None]] = None
+) -> T:
+    """
+    Runs fn(). If it has not finished after hedge_after seconds, runs a second
+    fn() concurrently and returns the first acceptable result, cancelling the
+    other call. Without hedge_after this is a plain await.
+
+    Args:
+        fn (Callable): Zero-argument coroutine function; must be safe to run twice.
+        hedge_after (float | None): Seconds before the second call starts.
+        accept (Callable): Whether a result counts as a success.
+        on_hedge (Callable | None): Called when the second call starts.
+
+    Returns:
+        T: The first acceptable result, or the last result if neither is.
+    """
+    if hedge_after is None:
+        return await fn()
+
+    first = asyncio.ensure_future(fn())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            if on_hedge:
+                on_hedge()
+            pending.add(asyncio.ensure_future(fn()))
+
+        outcome = None
+        while True:
+            for task in done:
+                outcome = task
+                if task.exception() is None and accept(task.result()):
+                    return task.result()
+            if not pending:
+                return outcome.result()
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def iterate_with_deadline(chunks: AsyncIterator[T], timeout: float) -> AsyncIterator[T]:
+    """
+    Re-yields chunks, raising asyncio.TimeoutError if the whole stream takes
+    longer than timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    iterator = chunks.__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), max(deadline - time.monotonic(), 0))
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
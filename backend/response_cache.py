@@ -0,0 +1,208 @@
+"""
+This module caches agent responses for identical prompts so repeated requests
+skip the Gemini round-trip and do not count against quota.
+
+Entries are keyed on (agent name, normalized prompt, model name) plus a
+fingerprint of any conversation context, and expire after a TTL. An in-memory
+LRU tier is always used; an optional persistent tier stores entries in the
+llm_response_cache table so they survive restarts and are shared by workers.
+
+Author: Emzyking AI
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from backend.log import get_logger
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_PERSISTENT = os.getenv("RESPONSE_CACHE_PERSISTENT", "false").lower() == "true"
+
+logger = get_logger(__name__)
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a prompt for the cache key by trimming its ends only. Prompts
+    often carry code, where case and indentation change the meaning, so
+    anything inside the prompt is kept as written.
+    """
+    return prompt.strip()
+
+
+def context_fingerprint(context: Any) -> str:
+    """
+    Returns a stable digest of the conversation context, or "" when there is none.
+    """
+    if not context:
+        return ""
+    raw = context if isinstance(context, str) else json.dumps(context, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier TTL + LRU cache for agent responses.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        persistent: bool = RESPONSE_CACHE_PERSISTENT,
+        enabled: bool = RESPONSE_CACHE_ENABLED
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, agent_name: str, prompt: str, model_name: str, context: Any = None) -> str:
+        """
+        Builds the cache key for an agent/prompt/model combination.
+
+        Args:
+            agent_name (str): Agent that will answer the prompt.
+            prompt (str): Raw user prompt.
+            model_name (str): Model the agent uses.
+            context (Any): Optional conversation context; different context means a different entry.
+
+        Returns:
+            str: Hex digest key.
+        """
+        raw = "\x1f".join([agent_name, normalize_prompt(prompt), model_name, context_fingerprint(context)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Looks up a cached response, checking memory first and then the persistent tier.
+
+        Returns:
+            Dict[str, Any] | None: {"response", "thought", "tool_calls"} or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+
+        if self.persistent:
+            value = await asyncio.to_thread(self._db_get, key)
+            if value is not None:
+                self._store_in_memory(key, value)
+                self.hits += 1
+                self.persistent_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any], agent_name: str = "", model_name: str = "") -> None:
+        """
+        Stores a response in memory and, if enabled, in the persistent tier.
+        """
+        self._store_in_memory(key, value)
+        if self.persistent:
+            try:
+                await asyncio.to_thread(self._db_set, key, value, agent_name, model_name)
+            except Exception as e:
+                logger.warning("Response cache persist failed", extra={"agent": agent_name, "error": str(e)})
+
+    def _store_in_memory(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        from backend.database.db_connection import SessionLocal
+        from backend.database.db_models import ResponseCacheEntry
+
+        db = SessionLocal()
+        try:
+            row = db.get(ResponseCacheEntry, key)
+            if row is None:
+                return None
+
+            expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+            if expires_at <= datetime.now(timezone.utc):
+                db.delete(row)
+                db.commit()
+                self.expirations += 1
+                return None
+
+            return {"response": row.response, "thought": row.thought, "tool_calls": row.tool_calls or []}
+        finally:
+            db.close()
+
+    def _db_set(self, key: str, value: Dict[str, Any], agent_name: str, model_name: str) -> None:
+        from backend.database.db_connection import SessionLocal
+        from backend.database.db_models import ResponseCacheEntry
+
+        db = SessionLocal()
+        try:
+            db.merge(ResponseCacheEntry(
+                cache_key=key,
+                agent_name=agent_name,
+                model_name=model_name,
+                response=value["response"],
+                thought=value.get("thought"),
+                tool_calls=value.get("tool_calls") or [],
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        """Drops all in-memory entries (the persistent tier is left untouched)."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit, miss, and eviction counters plus current size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": self.persistent,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache instance used by the RouterAgent
+response_cache = ResponseCache()
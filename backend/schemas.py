@@ -6,11 +6,20 @@ from datetime import datetime
 
 class PromptRequest(BaseModel):
     prompt: str = Field(..., description="The user's input prompt or coding request.")
+    background: bool = Field(False, description="Run as a background job and return its ID at once.")
+    webhook_url: Optional[str] = Field(None, description="URL to POST the finished background job to.")
+
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, description="Independent one-off prompts.")
+    stream: bool = Field(False, description="Stream results as NDJSON in completion order.")
 
 
 class ContinueChatRequest(BaseModel):
     chat_id: str = Field(..., description="Unique ID of the chat session.")
     prompt: str = Field(..., description="The user's follow-up message or query.")
+    background: bool = Field(False, description="Run as a background job and return its ID at once.")
+    webhook_url: Optional[str] = Field(None, description="URL to POST the finished background job to.")
 
 
 # Response model for structured output
@@ -29,9 +38,15 @@ class AllChatSummarySchema(BaseModel):
     chat_id: str
     created_at: datetime
     summary: Optional[str]
-    messages: List[ChatMessageSchema]
+    messages: Optional[List[ChatMessageSchema]] = None
+
+
+class AllChatHistoryResponse(BaseModel):
+    chats: List[AllChatSummarySchema]
+    next_cursor: Optional[str] = None
 
 class FeedbackRequest(BaseModel):
     message_id: int = Field(..., description="ID of the assistant's message")
     rating: int = Field(..., ge=1, le=5, description="Rating between 1 and 5")
-    comment: Optional[str] = Field(None, description="Optional user feedback comment")
\ No newline at end of file
+    comment: Optional[str] = Field(None, description="Optional user feedback comment")
+    agent_name: Optional[str] = Field(None, description="Agent that produced the message (routed_agent of the reply)")
\ No newline at end of file
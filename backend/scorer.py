@@ -1,12 +1,31 @@
 """
-This module ranks available AI agents by how well they match the user’s prompt,
-based on keyword heuristics and/or agent-specific scoring logic.
+This module ranks available AI agents by how well they match the user’s prompt.
+Three scoring strategies are available, selected with the SCORING_MODE
+environment variable:
+
+- keyword:    keyword heuristics and agent-specific can_handle logic (default)
+- classifier: the trained TF-IDF + LinearSVC model from ranking_model.py
+- hybrid:     a weighted blend of the two
 
 Author: Emzyking AI
 """
 
-from typing import List, Tuple
+import os
+import math
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
 from backend.agents.base_agent import BaseAgent
+from backend import ranking_model
+from backend.log import get_logger
+
+SCORING_MODES = ("keyword", "classifier", "hybrid")
+SCORING_MODE = os.getenv("SCORING_MODE", "keyword").lower()
+
+# Weight of the classifier in hybrid mode (0 = keywords only, 1 = classifier only)
+HYBRID_CLASSIFIER_WEIGHT = float(os.getenv("SCORING_HYBRID_WEIGHT", "0.5"))
+
+logger = get_logger(__name__)
 
 
 def keyword_match_score(prompt: str, keywords: List[str]) -> int:
@@ -24,44 +43,261 @@ def keyword_match_score(prompt: str, keywords: List[str]) -> int:
     return sum(1 for kw in keywords if kw in prompt_lower)
 
 
-def rank_agents(prompt: str) -> List[Tuple[BaseAgent, int]]:
+class ScoringStrategy(ABC):
+    """
+    Base class for agent scoring strategies.
     """
-    Ranks all registered agents by their relevance to the prompt using
-    either keyword heuristics or custom can_handle scoring.
 
-    Returns:
-        List[Tuple[BaseAgent, int]]: Sorted list of (agent, score)
+    name: str = ""
+
+    @abstractmethod
+    def score(self, prompt: str, agents: Dict[str, BaseAgent]) -> Dict[str, float]:
+        """
+        Scores the prompt against each agent.
+
+        Args:
+            prompt (str): The user input prompt.
+            agents (Dict[str, BaseAgent]): Candidate agents keyed by registry name.
+
+        Returns:
+            Dict[str, float]: Registry name → score for agents that match.
+        """
+        pass
+
+    def score_batch(self, prompts: Sequence[str], agents: Dict[str, BaseAgent]) -> List[Dict[str, float]]:
+        """
+        Scores many prompts at once. Strategies backed by a model override
+        this to run one vectorized pass; the default scores prompts one by one.
+
+        Args:
+            prompts (Sequence[str]): The user input prompts.
+            agents (Dict[str, BaseAgent]): Candidate agents keyed by registry name.
+
+        Returns:
+            List[Dict[str, float]]: One score dict per prompt, in order.
+        """
+        return [self.score(prompt, agents) for prompt in prompts]
+
+
+class KeywordScoring(ScoringStrategy):
+    """
+    Scores with the registry-wide keyword index: the prompt is scanned once and
+    each agent converts its hit count via score_keyword_hits(). Agents without
+    keywords fall back to their own can_handle logic.
+    """
+
+    name = "keyword"
+
+    def score(self, prompt: str, agents: Dict[str, BaseAgent]) -> Dict[str, float]:
+        from backend.agent_registry import KEYWORD_INDEX
+
+        hits = KEYWORD_INDEX.hit_counts(prompt)
+        scores: Dict[str, float] = {}
+
+        for agent_name, agent in agents.items():
+            try:
+                if agent_name in hits:
+                    score = agent.score_keyword_hits(hits[agent_name])
+                else:
+                    # Agent not in the shared index (no keywords): use its own logic
+                    score = int(agent.can_handle(prompt))
+
+                if score > 0:
+                    scores[agent_name] = score
+
+            except Exception as e:
+                logger.warning("Error scoring agent", extra={"agent": agent_name, "error": str(e)})
+                continue
+
+        return scores
+
+
+class ClassifierScoring(ScoringStrategy):
+    """
+    Scores with the trained ranking model. Class labels are mapped onto
+    registry names; a label may be the registry name ("code_generator"),
+    the agent name ("CodeGenerator"), or the class name ("CodeGeneratorAgent").
+    Agents with a positive decision_function margin are kept.
+    """
+
+    name = "classifier"
+
+    def decision_scores_batch(self, prompts: Sequence[str], agents: Dict[str, BaseAgent]) -> List[Dict[str, float]]:
+        """
+        Returns, for each prompt, the raw decision_function score for every
+        agent the model knows, from a single vectorizer and classifier pass.
+
+        Raises:
+            FileNotFoundError: If no trained model is available.
+        """
+        aliases = label_aliases(agents)
+        batch: List[Dict[str, float]] = []
+        for ranked_labels in ranking_model.score_prompts(prompts):
+            scores: Dict[str, float] = {}
+            for label, value in ranked_labels:
+                agent_name = aliases.get(label.lower())
+                if agent_name is not None:
+                    scores[agent_name] = value
+            batch.append(scores)
+        return batch
+
+    def decision_scores(self, prompt: str, agents: Dict[str, BaseAgent]) -> Dict[str, float]:
+        """
+        Returns the raw decision_function score for every agent the model knows.
+
+        Raises:
+            FileNotFoundError: If no trained model is available.
+        """
+        return self.decision_scores_batch([prompt], agents)[0]
+
+    def score(self, prompt: str, agents: Dict[str, BaseAgent]) -> Dict[str, float]:
+        return self.score_batch([prompt], agents)[0]
+
+    def score_batch(self, prompts: Sequence[str], agents: Dict[str, BaseAgent]) -> List[Dict[str, float]]:
+        return [
+            {name: s for name, s in decisions.items() if s > 0}
+            for decisions in self.decision_scores_batch(prompts, agents)
+        ]
+
+
+class HybridScoring(ScoringStrategy):
+    """
+    Blends normalized keyword scores with classifier confidence:
+
+        score = (1 - w) * keyword / max_keyword + w * sigmoid(decision)
+
+    An agent is kept if either signal matches it.
     """
-    from backend.agent_registry import AGENT_REGISTRY
 
-    ranked: List[Tuple[BaseAgent, int]] = []
+    name = "hybrid"
+
+    def __init__(self, classifier_weight: float = HYBRID_CLASSIFIER_WEIGHT):
+        self.classifier_weight = classifier_weight
+        self.keyword = KeywordScoring()
+        self.classifier = ClassifierScoring()
+
+    def score(self, prompt: str, agents: Dict[str, BaseAgent]) -> Dict[str, float]:
+        return self.score_batch([prompt], agents)[0]
 
-    for agent_name, agent in AGENT_REGISTRY.items():
-        if not isinstance(agent, BaseAgent):
-            continue
+    def score_batch(self, prompts: Sequence[str], agents: Dict[str, BaseAgent]) -> List[Dict[str, float]]:
+        decisions = self.classifier.decision_scores_batch(prompts, agents)
+        return [
+            self._blend(self.keyword.score(prompt, agents), decision_scores, agents)
+            for prompt, decision_scores in zip(prompts, decisions)
+        ]
 
-        try:
-            # Try agent-defined logic
-            score = agent.can_handle(prompt)
-            if isinstance(score, int) and score > 0:
-                ranked.append((agent, score))
+    def _blend(
+        self,
+        keyword_scores: Dict[str, float],
+        decision_scores: Dict[str, float],
+        agents: Dict[str, BaseAgent]
+    ) -> Dict[str, float]:
+        max_keyword = max(keyword_scores.values(), default=0) or 1
+        w = self.classifier_weight
+
+        scores: Dict[str, float] = {}
+        for agent_name in agents:
+            kw = keyword_scores.get(agent_name, 0)
+            decision = decision_scores.get(agent_name)
+            if kw <= 0 and (decision is None or decision <= 0):
                 continue
 
-            # Try keyword fallback if .keywords() exists
-            if hasattr(agent, "keywords"):
-                keywords = agent.keywords()
-                kw_score = keyword_match_score(prompt, keywords)
-                if kw_score > 0:
-                    ranked.append((agent, kw_score))
+            confidence = 1.0 / (1.0 + math.exp(-decision)) if decision is not None else 0.0
+            scores[agent_name] = (1 - w) * (kw / max_keyword) + w * confidence
+
+        return scores
+
+
+_STRATEGIES: Dict[str, ScoringStrategy] = {}
+
+
+def get_scoring_strategy(mode: Optional[str] = None) -> ScoringStrategy:
+    """
+    Returns the (cached) strategy for a scoring mode, defaulting to SCORING_MODE.
+    """
+    mode = (mode or SCORING_MODE).lower()
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Unknown scoring mode '{mode}'. Use one of {SCORING_MODES}.")
+
+    if mode not in _STRATEGIES:
+        strategy_cls = {"keyword": KeywordScoring, "classifier": ClassifierScoring, "hybrid": HybridScoring}[mode]
+        _STRATEGIES[mode] = strategy_cls()
+    return _STRATEGIES[mode]
+
+
+def label_aliases(agents: Dict[str, BaseAgent]) -> Dict[str, str]:
+    """
+    Maps lowercase classifier labels (registry, agent, and class names) to registry names.
+    """
+    aliases: Dict[str, str] = {}
+    for agent_name, agent in agents.items():
+        aliases[agent_name.lower()] = agent_name
+        aliases[agent.name.lower()] = agent_name
+        aliases[agent.__class__.__name__.lower()] = agent_name
+    return aliases
+
 
-        except Exception as e:
-            print(f"[Ranker] Error scoring agent '{agent_name}': {e}")
-            continue
+def scorable_agents() -> Dict[str, BaseAgent]:
+    """
+    Returns the registry agents that may receive prompts. The RouterAgent is
+    excluded so routing never dispatches back into itself.
+    """
+    from backend.agent_registry import AGENT_REGISTRY, ROUTER
 
-    # Sort by score descending
-    ranked.sort(key=lambda x: x[1], reverse=True)
+    return {
+        name: agent for name, agent in AGENT_REGISTRY.items()
+        if name != ROUTER and isinstance(agent, BaseAgent)
+    }
 
-    # Debugging output
-    print("[Router] Agent Ranking:", [(a.name, s) for a, s in ranked])
+
+def rank_agents(prompt: str, mode: Optional[str] = None) -> List[Tuple[BaseAgent, float]]:
+    """
+    Ranks all registered agents by their relevance to the prompt using the
+    configured scoring strategy. Classifier-based modes fall back to keyword
+    scoring when no trained model is available.
+
+    Args:
+        prompt (str): The user input prompt.
+        mode (str, optional): Override SCORING_MODE for this call.
+
+    Returns:
+        List[Tuple[BaseAgent, float]]: Sorted list of (agent, score)
+    """
+    ranked = rank_agents_batch([prompt], mode)[0]
+
+    # Sampled debug event: logged for a share of requests at LOG_LEVEL=DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Agent ranking", extra={"ranking": [(a.name, s) for a, s in ranked]})
 
     return ranked
+
+
+def rank_agents_batch(prompts: Sequence[str], mode: Optional[str] = None) -> List[List[Tuple[BaseAgent, float]]]:
+    """
+    Ranks agents for many prompts with one scoring pass, so classifier-based
+    modes vectorize and score the whole batch at once.
+
+    Args:
+        prompts (Sequence[str]): The user input prompts.
+        mode (str, optional): Override SCORING_MODE for this call.
+
+    Returns:
+        List[List[Tuple[BaseAgent, float]]]: For each prompt, a sorted list of (agent, score).
+    """
+    agents = scorable_agents()
+    strategy = get_scoring_strategy(mode)
+
+    try:
+        batch_scores = strategy.score_batch(prompts, agents)
+    except FileNotFoundError as e:
+        logger.warning("Scoring unavailable, using keywords", extra={"strategy": strategy.name, "error": str(e)})
+        batch_scores = get_scoring_strategy("keyword").score_batch(prompts, agents)
+
+    rankings = []
+    for scores in batch_scores:
+        ranked: List[Tuple[BaseAgent, float]] = [(agents[name], score) for name, score in scores.items()]
+
+        # Sort by score descending
+        ranked.sort(key=lambda x: x[1], reverse=True)
+        rankings.append(ranked)
+    return rankings
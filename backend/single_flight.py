@@ -0,0 +1,66 @@
+"""
+This module implements single-flight request coalescing: concurrent callers
+that ask for the same key share one in-flight call instead of each starting
+their own. The RouterAgent uses it so a burst of identical prompts results in
+a single Gemini request.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent async calls by key.
+
+    The shared call runs in its own task, so one caller being cancelled
+    (e.g. a client disconnecting) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Task[Any]"] = {}
+
+        # Counters
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs fn() unless a call with the same key is already in flight, in
+        which case the caller awaits that call's result (or exception).
+
+        Args:
+            key (str): Identity of the call.
+            fn (Callable): Zero-argument coroutine function performing the call.
+
+        Returns:
+            T: The shared result.
+        """
+        task = self._calls.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.leaders += 1
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns how many calls ran and how many callers reused an in-flight call.
+        """
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
@@ -0,0 +1,250 @@
+"""
+This module times the stages of a request. Code wraps a stage in
+
+    with tracing.span("context.build"):
+        ...
+
+and the span's duration is recorded in the stage histogram at /metrics. The
+API middleware opens a trace per request, so the spans of one request are
+collected together: they are returned in the Server-Timing header (visible in
+browser dev tools and curl -v), kept at /debug/traces when the request took
+longer than TRACE_SLOW_REQUEST_SECONDS, and logged with their breakdown.
+
+Spans nest, and attributes set on a span are visible to the spans under it,
+which is how LLM token counts are attributed to the agent that made the call.
+
+When the OpenTelemetry API is installed every span is also started as an
+OpenTelemetry span, so an SDK configured at startup (for example with
+opentelemetry-instrument) exports them with no code changes. Other exporters
+can subscribe with add_span_hook().
+
+Author: Emzyking AI
+"""
+
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+
+from backend.log import get_logger
+from backend.metrics import STAGE_SECONDS
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional dependency
+    otel_trace = None
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_OTEL_ENABLED = os.getenv("TRACE_OTEL_ENABLED", "true").lower() == "true"
+TRACE_SLOW_REQUEST_SECONDS = float(os.getenv("TRACE_SLOW_REQUEST_SECONDS", "2"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "50"))
+
+logger = get_logger(__name__)
+
+_tracer = otel_trace.get_tracer("emzyking_ai") if otel_trace is not None and TRACE_OTEL_ENABLED else None
+
+
+class Span:
+    """
+    One timed stage. Attributes are inherited from the parent span.
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.otel_span: Any = None
+
+    def attribute(self, key: str) -> Any:
+        span = self
+        while span is not None:
+            if key in span.attributes:
+                return span.attributes[key]
+            span = span.parent
+        return None
+
+    def to_dict(self, trace_start: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - trace_start) * 1000, 1),
+            "duration_ms": round((self.duration or 0.0) * 1000, 1),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """
+    The spans of one request, in the order they finished.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+
+    def breakdown(self) -> Dict[str, float]:
+        """
+        Returns the total seconds per stage name.
+        """
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + (span.duration or 0.0)
+        return totals
+
+    def server_timing(self) -> str:
+        """
+        Formats the breakdown as a Server-Timing header value.
+        """
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.breakdown().items()]
+        if self.duration is not None:
+            entries.append(f"total;dur={self.duration * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0.0) * 1000, 1),
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_span_hooks: List[Callable[[Span], None]] = []
+_slow_traces: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+def _reset(var: ContextVar, token: Token) -> None:
+    try:
+        var.reset(token)
+    except ValueError:
+        # An async generator finalized from another context; nothing to restore there
+        pass
+
+
+def add_span_hook(hook: Callable[[Span], None]) -> None:
+    """
+    Registers a function called with every finished span.
+    """
+    _span_hooks.append(hook)
+
+
+def current_attribute(key: str) -> Any:
+    """
+    Returns an attribute of the current span or its ancestors, or None.
+    """
+    span = _current_span.get()
+    return span.attribute(key) if span is not None else None
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """
+    Sets an attribute on the current span (e.g. the agent a request was routed to).
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.attributes[key] = value
+        if span.otel_span is not None:
+            span.otel_span.set_attribute(key, _otel_value(value))
+
+
+def _otel_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Times a stage of the current request.
+
+    Args:
+        name (str): Stage name, e.g. "db.session_lookup".
+        **attributes: Values describing the stage (agent, provider, ...).
+
+    Yields:
+        Span | None: The span, or None when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    if _tracer is not None:
+        # Not attached to the OpenTelemetry context: spans may end in another
+        # context (streams), so parents are taken from our own span tree
+        otel_parent = None
+        if parent is not None and parent.otel_span is not None:
+            otel_parent = otel_trace.set_span_in_context(parent.otel_span)
+        current.otel_span = _tracer.start_span(
+            name, context=otel_parent,
+            attributes={k: _otel_value(v) for k, v in attributes.items() if v is not None}
+        )
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _reset(_current_span, token)
+        if current.otel_span is not None:
+            if current.error:
+                current.otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, current.error))
+            current.otel_span.end()
+        _finish(current)
+
+
+def _finish(finished: Span) -> None:
+    STAGE_SECONDS.observe(finished.duration, stage=finished.name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(finished)
+    for hook in _span_hooks:
+        try:
+            hook(finished)
+        except Exception as e:
+            logger.warning("Span hook failed", extra={"span": finished.name, "error": str(e)})
+
+
+@contextmanager
+def request_trace(name: str) -> Iterator[Trace]:
+    """
+    Collects the spans of one request. Requests slower than
+    TRACE_SLOW_REQUEST_SECONDS are kept for /debug/traces and logged.
+    """
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - trace.start
+        _reset(_current_trace, token)
+        if TRACING_ENABLED and trace.duration >= TRACE_SLOW_REQUEST_SECONDS:
+            _slow_traces.append(trace)
+            logger.warning("Slow request", extra={
+                "request": trace.name,
+                "duration_ms": round(trace.duration * 1000, 1),
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in trace.breakdown().items()},
+            })
+
+
+def slow_traces() -> List[Dict[str, Any]]:
+    """
+    Returns the most recent slow requests with their spans, newest first.
+    """
+    return [trace.to_dict() for trace in reversed(_slow_traces)]
@@ -1,14 +1,123 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Size of the per-session term-frequency sketch and number of summary keywords
+SUMMARY_SKETCH_CAPACITY = 32
+SUMMARY_KEYWORD_COUNT = 5
+
+
+def tokenize_keywords(text: str) -> List[str]:
+    """
+    Splits text into lowercase candidate keywords longer than three characters.
+    """
+    words = (w.strip(".,!?()[]") for w in text.lower().split() if len(w) > 3)
+    return [w for w in words if w]
+
+
+def update_keyword_sketch(
+    sketch: Optional[Dict[str, int]],
+    text: str,
+    capacity: int = SUMMARY_SKETCH_CAPACITY
+) -> Dict[str, int]:
+    """
+    Folds one message into a bounded term-frequency sketch (Space-Saving).
+
+    The sketch never holds more than `capacity` terms: when it is full, the
+    least frequent term is replaced by the new one, which inherits its count
+    plus one. Only the new message is tokenized.
+
+    Args:
+        sketch (Dict[str, int] | None): Existing sketch, or None for a new session.
+        text (str): The newly appended user message.
+        capacity (int): Maximum number of tracked terms.
+
+    Returns:
+        Dict[str, int]: A new sketch dictionary (the input is not mutated).
+    """
+    counts = dict(sketch or {})
+
+    for word in tokenize_keywords(text):
+        if word in counts:
+            counts[word] += 1
+        elif len(counts) < capacity:
+            counts[word] = 1
+        else:
+            evicted = min(counts, key=counts.get)
+            min_count = counts.pop(evicted)
+            counts[word] = min_count + 1
+
+    return counts
+
+
+def summarize_keyword_sketch(sketch: Optional[Dict[str, int]], top_n: int = SUMMARY_KEYWORD_COUNT) -> str:
+    """
+    Renders the most frequent sketch terms as a title-cased summary.
+    Ties keep the order in which terms entered the sketch, so the result is deterministic.
+    """
+    if not sketch:
+        return "Untitled Chat"
+
+    keywords = sorted(sketch, key=lambda w: -sketch[w])[:top_n]
+    return ", ".join(keywords).title()
+
+
 def extract_keywords(messages: list[str]) -> str:
     """
     Basic fallback summarizer: Extract key phrases from the most recent messages.
     """
-    if not messages:
-        return "Untitled Chat"
+    sketch: Dict[str, int] = {}
+    for message in messages[-10:]:
+        sketch = update_keyword_sketch(sketch, message)
+    return summarize_keyword_sketch(sketch)
+
+
+def is_error_response(text: str) -> bool:
+    """
+    True for the warning/error replies agents return instead of raising
+    (they start with ⚠️ or ❌, or end with such a line when a stream fails
+    part-way). Such replies must not be cached.
+    """
+    lines = text.strip().splitlines()
+    if not lines:
+        return False
+    return lines[0].lstrip().startswith(("⚠️", "❌")) or lines[-1].lstrip().startswith(("⚠️", "❌"))
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Formats a payload as a Server-Sent Events message with a JSON data line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 
-    # Combine and tokenize the last 5–10 messages
-    text = " ".join(messages[-10:])
-    words = [w.strip(".,!?()[]") for w in text.lower().split() if len(w) > 3]
-    
-    # Get unique words (naive summary)
-    keywords = list(set(words))[:5]
-    return ", ".join(keywords).title() or "Untitled Chat"
+def format_ndjson(data: Any) -> str:
+    """
+    Formats a payload as one line of newline-delimited JSON.
+    """
+    return json.dumps(data, default=str) + "\n"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Encodes a (created_at, id) keyset position as an opaque URL-safe cursor.
+    """
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,124 @@
+"""
+Compares generating code for a list of prompts one request at a time, as
+internal tools did with /generate-code, against RouterAgent.route_batch()
+behind /generate-code/batch. A stub Gemini model with variable latency
+replaces the API, and the response cache is off so every prompt is a model
+call. Also compares ranking the prompts one by one against one batched
+scoring pass in classifier mode:
+
+    python -m benchmarks.batch_generation
+    python -m benchmarks.batch_generation --prompts 50 --concurrency 8 --latency 0.2
+
+If no trained ranking model exists, a synthetic one is trained at
+--model-path. Requires DATABASE_URL like the app.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from backend import ranking_model
+from backend.agent_registry import router_agent
+from backend.llm_client import llm_client
+from backend.llm_providers import GeminiProvider
+from backend.log import configure_logging
+from backend.model_registry import ModelRegistry
+from backend.rate_limiter import RateLimiter
+from backend.response_cache import response_cache
+from backend.scorer import rank_agents, rank_agents_batch
+from benchmarks.scoring_modes import synthetic_training_data
+
+_TASKS = ["sort a list", "parse a csv file", "reverse a string", "call an api", "merge two dicts"]
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubModel:
+    """Imitates GenerativeModel with log-normally distributed latency."""
+
+    latency = 0.2
+
+    def __init__(self, model_name: str, **settings):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream=False):
+        await asyncio.sleep(StubModel.latency * random.lognormvariate(0, 0.5))
+        return _Response("def solution():\n    pass")
+
+
+async def sequential(prompts) -> float:
+    start = time.perf_counter()
+    for prompt in prompts:
+        await router_agent.route(prompt)
+    return time.perf_counter() - start
+
+
+async def batched(prompts, concurrency: int) -> float:
+    start = time.perf_counter()
+    results = [None] * len(prompts)
+    async for index, result in router_agent.route_batch(prompts, concurrency):
+        results[index] = result
+    return time.perf_counter() - start
+
+
+def time_ranking(prompts, mode: str):
+    start = time.perf_counter()
+    for prompt in prompts:
+        rank_agents(prompt, mode=mode)
+    one_by_one = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rank_agents_batch(prompts, mode=mode)
+    return one_by_one, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="Median stub model latency in seconds.")
+    parser.add_argument("--model-path", default=ranking_model.MODEL_PATH)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    configure_logging(level="ERROR")
+
+    random.seed(args.seed)
+    StubModel.latency = args.latency
+    llm_client.providers = [GeminiProvider(
+        registry=ModelRegistry(model_factory=StubModel),
+        limiter=RateLimiter(rpm=0, tpm=0, max_concurrency=0)
+    )]
+    response_cache.enabled = False
+
+    prompts = [f"write a python function to {_TASKS[i % len(_TASKS)]} (variant {i})" for i in range(args.prompts)]
+
+    one_at_a_time = asyncio.run(sequential(prompts))
+    batch = asyncio.run(batched(prompts, args.concurrency))
+    unbounded = asyncio.run(batched(prompts, args.prompts))
+
+    print(f"{args.prompts} prompts, median model latency {args.latency:.2f}s:")
+    print(f"  one request per prompt:          {one_at_a_time:.2f}s")
+    print(f"  batch, concurrency {args.concurrency:<3}          {batch:.2f}s")
+    print(f"  batch, concurrency {args.prompts:<3}          {unbounded:.2f}s")
+
+    ranking_model.MODEL_PATH = args.model_path
+    if not os.path.exists(args.model_path):
+        ranking_model.train_ranking_model(synthetic_training_data())
+    ranking_model.get_model()
+    one_by_one, vectorized = time_ranking(prompts, "classifier")
+    print(f"classifier ranking of {args.prompts} prompts:")
+    print(f"  one by one:                      {one_by_one * 1000:.1f}ms")
+    print(f"  one batched pass:                {vectorized * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
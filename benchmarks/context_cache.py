@@ -0,0 +1,127 @@
+"""
+Replays multi-turn conversations through build_context and persist_turn and
+checks that every context served from the context cache matches one built
+from the database, while counting the queries build_context issues per turn:
+
+    python -m benchmarks.context_cache                      # in-process LRU store
+    python -m benchmarks.context_cache --store fake-redis   # Redis store on an in-process fake
+    python -m benchmarks.context_cache --store redis --redis-url redis://localhost:6379/15
+
+Uses a temporary SQLite database. A real Redis server should be a scratch
+instance: keys are written under the emzyking:ctx: prefix.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from collections import defaultdict
+
+from tests.fake_redis import FakeRedis
+
+
+async def run(args) -> None:
+    from sqlalchemy import event, select
+    from backend.context import context_builder
+    from backend.context.context_cache import (
+        ContextCache, InMemoryContextStore, RedisContextStore, CONTEXT_CACHE_WINDOW
+    )
+    from backend.database import db_models
+    from backend.database.db_connection import AsyncSessionLocal, Base, async_engine
+    from backend.database import turn_persistence
+
+    if args.store == "memory":
+        store = InMemoryContextStore(CONTEXT_CACHE_WINDOW, max_sessions=args.chats, ttl_seconds=600)
+    else:
+        if args.store == "redis":
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(args.redis_url)
+        else:
+            client = FakeRedis()
+        store = RedisContextStore(client, CONTEXT_CACHE_WINDOW, ttl_seconds=600)
+
+    cache = ContextCache(store, enabled=True)
+    uncached = ContextCache(store, enabled=False)
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    queries = {"count": 0}
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def _count(*_):
+        queries["count"] += 1
+
+    rng = random.Random(args.seed)
+    chat_ids = [f"bench-{i}-{rng.random():.6f}" for i in range(args.chats)]
+    async with AsyncSessionLocal() as db:
+        for chat_id in chat_ids:
+            db.add(db_models.ChatSession(chat_id=chat_id))
+        await db.commit()
+
+    per_turn = defaultdict(list)
+    mismatches = 0
+
+    for turn in range(args.turns):
+        for chat_id in chat_ids:
+            prompt = f"turn {turn}: write a python function #{rng.randrange(1000)}"
+
+            async with AsyncSessionLocal() as db:
+                context_builder.context_cache = uncached
+                expected = await context_builder.build_context(chat_id, db, pending_prompt=prompt)
+
+                context_builder.context_cache = cache
+                queries["count"] = 0
+                served = await context_builder.build_context(chat_id, db, pending_prompt=prompt)
+                per_turn["first" if turn == 0 else "later"].append(queries["count"])
+                mismatches += served != expected
+
+                chat_session = await db.scalar(
+                    select(db_models.ChatSession).where(db_models.ChatSession.chat_id == chat_id)
+                )
+                turn_persistence.context_cache = cache
+                await turn_persistence.persist_turn(db, chat_session, prompt, f"reply to {prompt}", None, None)
+
+            if rng.random() < args.memory_rate:
+                async with AsyncSessionLocal() as db:
+                    content = f"fact {rng.randrange(1000)}"
+                    db.add(db_models.MemoryStore(chat_id=chat_id, memory_type="fact", content=content))
+                    await db.commit()
+                    await cache.add_memory(chat_id, "fact", content)
+
+    for phase, counts in per_turn.items():
+        print(f"{phase:>6} turns: {sum(counts) / len(counts):.2f} queries per build_context")
+    print(f"contexts compared: {sum(len(c) for c in per_turn.values())}, mismatches: {mismatches}")
+    print(cache.stats())
+
+    if args.store != "memory":
+        for chat_id in chat_ids:
+            await store.invalidate(chat_id)
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", choices=["memory", "fake-redis", "redis"], default="memory")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--memory-rate", type=float, default=0.1, help="Chance of storing a memory after a turn.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measures the background job queue against a stub Gemini model with
+variable latency: how long a client waits for /generate-code to answer when
+it runs synchronously versus when it only enqueues a job, and how fast
+worker pools of different sizes drain a backlog of queued jobs. Also checks
+that no job was claimed twice:
+
+    python -m benchmarks.job_queue
+    python -m benchmarks.job_queue --jobs 200 --workers 1 4 16 --latency 0.2
+
+Requires DATABASE_URL like the app, migrated to include generation_jobs.
+The jobs the benchmark creates are deleted again.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import delete, func, select
+
+from backend import generation, job_queue
+from backend.database.db_connection import AsyncSessionLocal
+from backend.database.db_models import GenerationJob
+from backend.llm_client import llm_client
+from backend.llm_providers import GeminiProvider
+from backend.log import configure_logging
+from backend.model_registry import ModelRegistry
+from backend.rate_limiter import RateLimiter
+from backend.response_cache import response_cache
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubModel:
+    """Imitates GenerativeModel with log-normally distributed latency."""
+
+    latency = 0.2
+
+    def __init__(self, model_name: str, **settings):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream=False):
+        await asyncio.sleep(StubModel.latency * random.lognormvariate(0, 0.5))
+        return _Response("def solution():\n    pass")
+
+
+async def enqueue_jobs(count: int, tag: str):
+    ids, latencies = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            job = await job_queue.enqueue(db, job_queue.GENERATE_CODE, f"write a python function #{i} {tag}")
+        latencies.append(time.perf_counter() - start)
+        ids.append(job.id)
+    return ids, latencies
+
+
+async def drain(ids, workers: int) -> float:
+    pool = job_queue.JobWorkerPool()
+    start = time.perf_counter()
+    pool.start(workers)
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                pending = await db.scalar(
+                    select(func.count()).select_from(GenerationJob)
+                    .where(GenerationJob.id.in_(ids), GenerationJob.status.not_in(job_queue.FINISHED))
+                )
+            if not pending:
+                return time.perf_counter() - start
+            await asyncio.sleep(0.05)
+    finally:
+        await pool.stop()
+
+
+async def discard(ids) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(GenerationJob).where(GenerationJob.id.in_(ids)))
+        await db.commit()
+
+
+async def run(args):
+    sync_latencies = []
+    for i in range(args.sync_requests):
+        start = time.perf_counter()
+        await generation.generate_code(f"write a python function #{i} sync")
+        sync_latencies.append(time.perf_counter() - start)
+
+    ids, enqueue_latencies = await enqueue_jobs(args.sync_requests, "enqueue-only")
+    await discard(ids)
+
+    drains, duplicates = {}, 0
+    for workers in args.workers:
+        ids, _ = await enqueue_jobs(args.jobs, f"workers-{workers}")
+        drains[workers] = await drain(ids, workers)
+        async with AsyncSessionLocal() as db:
+            duplicates += await db.scalar(
+                select(func.count()).select_from(GenerationJob)
+                .where(GenerationJob.id.in_(ids), GenerationJob.attempts != 1)
+            )
+        await discard(ids)
+
+    return statistics.median(sync_latencies), statistics.median(enqueue_latencies), drains, duplicates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--sync-requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Median stub model latency in seconds.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    configure_logging(level="ERROR")
+
+    random.seed(args.seed)
+    StubModel.latency = args.latency
+    llm_client.providers = [GeminiProvider(
+        registry=ModelRegistry(model_factory=StubModel),
+        limiter=RateLimiter(rpm=0, tpm=0, max_concurrency=0)
+    )]
+    response_cache.enabled = False
+    job_queue.JOB_POLL_INTERVAL_SECONDS = 0.05
+
+    sync_wait, enqueue_wait, drains, duplicates = asyncio.run(run(args))
+
+    print("client wait per /generate-code request:")
+    print(f"  synchronous:                  {sync_wait * 1000:.1f}ms median")
+    print(f"  background (enqueue only):    {enqueue_wait * 1000:.1f}ms median")
+    print(f"draining {args.jobs} queued jobs, median model latency {args.latency:.2f}s:")
+    for workers, elapsed in drains.items():
+        print(f"  {workers:>3} workers:                  {elapsed:.2f}s ({args.jobs / elapsed:.1f} jobs/s)")
+    print(f"jobs claimed more than once: {duplicates}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for agent keyword scoring on prompts from 100 B to 100 KB.
+
+Compares the previous approach (one lowercase + one substring scan per keyword
+per agent) with the shared KeywordIndex, using both its Aho-Corasick backend
+(when pyahocorasick is installed) and its substring fallback:
+
+    python -m benchmarks.keyword_matching
+
+Author: Emzyking AI
+"""
+
+import argparse
+import random
+import time
+
+from backend import keyword_index
+from backend.keyword_index import KeywordIndex
+from backend.agent_registry import AGENT_REGISTRY, ROUTER
+
+PROMPT_SIZES = [100, 1_000, 10_000, 100_000]
+
+_CODE_LINES = [
+    "def load_users(path):",
+    "    with open(path) as fh:",
+    "        rows = [line.strip().split(',') for line in fh]",
+    "    return {row[0]: row[1:] for row in rows if row}",
+    "class Cache:",
+    "    def __init__(self, size=128):",
+    "        self.size = size",
+    "        self.items = {}",
+    "for i in range(len(items)):",
+    "    total += items[i] * weights[i]",
+    "# TODO: handle the empty case",
+    "SELECT id, name FROM accounts WHERE active = 1;",
+    "const total = values.reduce((a, b) => a + b, 0);",
+]
+
+
+def make_prompt(size: int, rng: random.Random) -> str:
+    lines = ["Can you fix this? It throws an error when the file is empty:"]
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(rng.choice(_CODE_LINES))
+    return "\n".join(lines)[:size]
+
+
+def legacy_hit_counts(prompt: str, keywords_by_agent) -> dict:
+    counts = {}
+    for agent_name, keywords in keywords_by_agent.items():
+        prompt_lower = prompt.lower()
+        counts[agent_name] = sum(1 for kw in keywords if kw in prompt_lower)
+    return counts
+
+
+def timed(fn, prompt: str, min_runs: int = 5, budget_s: float = 0.2) -> float:
+    runs, start = 0, time.perf_counter()
+    while runs < min_runs or time.perf_counter() - start < budget_s:
+        fn(prompt)
+        runs += 1
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    keywords_by_agent = {
+        name: [kw.lower() for kw in agent.keywords()]
+        for name, agent in AGENT_REGISTRY.items()
+        if name != ROUTER and agent.keywords()
+    }
+
+    indexes = {}
+    if keyword_index.ahocorasick is not None:
+        indexes["aho-corasick"] = KeywordIndex(keywords_by_agent)
+    saved = keyword_index.ahocorasick
+    keyword_index.ahocorasick = None
+    indexes["substring"] = KeywordIndex(keywords_by_agent)
+    keyword_index.ahocorasick = saved
+
+    rng = random.Random(args.seed)
+    header = f"{'size':>8}{'legacy us':>12}" + "".join(f"{name + ' us':>18}" for name in indexes)
+    print(header)
+
+    for size in PROMPT_SIZES:
+        prompt = make_prompt(size, rng)
+        expected = legacy_hit_counts(prompt, keywords_by_agent)
+        for index in indexes.values():
+            assert index.hit_counts(prompt) == expected, "index disagrees with legacy scoring"
+
+        row = f"{size:>8}{timed(lambda p: legacy_hit_counts(p, keywords_by_agent), prompt):>12.1f}"
+        for index in indexes.values():
+            row += f"{timed(index.hit_counts, prompt):>18.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures how many concurrent LLM requests one worker sustains through the
+shared async client, and how much the event loop lags while they run.
+
+By default a stub model with a fixed latency replaces Gemini, so the numbers
+reflect the client and the event loop rather than the network:
+
+    python -m benchmarks.llm_concurrency --requests 200 --latency 0.5
+    python -m benchmarks.llm_concurrency --mode threadpool --workers 16
+    python -m benchmarks.llm_concurrency --live --requests 10   # real Gemini calls
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import time
+
+from backend.llm_client import LLMClient
+from backend.model_registry import ModelRegistry
+
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """Imitates GenerativeModel with a fixed response latency."""
+
+    def __init__(self, model_name: str, latency: float):
+        self.model_name = model_name
+        self.latency = latency
+
+    def generate_content(self, prompt: str) -> _StubResponse:
+        time.sleep(self.latency)
+        return _StubResponse(f"stub response to {len(prompt)} chars")
+
+    async def generate_content_async(self, prompt: str) -> _StubResponse:
+        await asyncio.sleep(self.latency)
+        return _StubResponse(f"stub response to {len(prompt)} chars")
+
+
+async def _measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Returns the worst delay seen between scheduled heartbeats."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(client: LLMClient, requests: int) -> None:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.generate(f"write a python function #{i}") for i in range(requests)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    worst_lag = await lag_task
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    stats = client.stats()
+
+    print(f"mode={client.providers[0].stats().get('mode')} requests={requests} errors={errors}")
+    print(f"wall time:        {elapsed:.3f}s")
+    print(f"throughput:       {requests / elapsed:.1f} req/s")
+    print(f"peak in-flight:   {stats['peak_in_flight']}")
+    print(f"avg call latency: {stats['avg_latency_s']:.3f}s")
+    print(f"worst loop lag:   {worst_lag * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Number of concurrent requests")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency in seconds")
+    parser.add_argument("--mode", choices=["native", "threadpool"], default="native")
+    parser.add_argument("--workers", type=int, default=16, help="Thread pool size for threadpool mode")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini API instead of the stub")
+    args = parser.parse_args()
+
+    if args.live:
+        client = LLMClient(mode=args.mode, max_workers=args.workers)
+    else:
+        client = LLMClient(
+            mode=args.mode,
+            max_workers=args.workers,
+            registry=ModelRegistry(model_factory=lambda name, **settings: StubModel(name, args.latency))
+        )
+
+    asyncio.run(run(client, args.requests))
+
+
+if __name__ == "__main__":
+    main()
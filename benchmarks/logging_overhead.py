@@ -0,0 +1,92 @@
+"""
+Measures what logging costs the event loop when stdout is slow (a pipe to a
+busy log shipper, a full terminal buffer): concurrent requests each log a
+few lines, once written synchronously like print() did and once through the
+backend's queued logger. Also shows how many debug records sampling keeps:
+
+    python -m benchmarks.logging_overhead
+    python -m benchmarks.logging_overhead --requests 500 --write-latency 0.002
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import statistics
+import time
+
+from backend import log
+
+
+class SlowStream(io.StringIO):
+    """A stdout whose every write blocks for a fixed time."""
+
+    latency = 0.001
+
+    def write(self, text: str) -> int:
+        time.sleep(SlowStream.latency)
+        return super().write(text)
+
+
+async def handle_request(logger: logging.Logger, i: int, lines: int) -> float:
+    start = time.perf_counter()
+    for step in range(lines):
+        logger.info("Request step", extra={"request": i, "step": step})
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def run(logger: logging.Logger, requests: int, lines: int):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(handle_request(logger, i, lines) for i in range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+def synchronous_logger(stream: io.StringIO) -> logging.Logger:
+    logger = logging.getLogger("benchmark.synchronous")
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(log.JsonFormatter())
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=5, help="Lines logged per request.")
+    parser.add_argument("--write-latency", type=float, default=0.001, help="Seconds each stdout write blocks.")
+    parser.add_argument("--debug-records", type=int, default=10000)
+    args = parser.parse_args()
+
+    SlowStream.latency = args.write_latency
+    results = {}
+
+    results["synchronous"] = asyncio.run(run(synchronous_logger(SlowStream()), args.requests, args.lines))
+
+    log.configure_logging(level="INFO", stream=SlowStream())
+    results["queued"] = asyncio.run(run(log.get_logger("benchmark.queued"), args.requests, args.lines))
+    dropped = log.stats()["dropped"]
+
+    sampled = io.StringIO()
+    log.configure_logging(level="DEBUG", stream=sampled)
+    logger = log.get_logger("benchmark.sampled")
+    for i in range(args.debug_records):
+        logger.debug("Ranking", extra={"request": i})
+    log.configure_logging(level="ERROR")  # stops the listener, flushing the sampled records
+    kept = len(sampled.getvalue().splitlines())
+
+    print(f"{args.requests} concurrent requests x {args.lines} lines, "
+          f"stdout write latency {args.write_latency * 1000:.1f}ms:")
+    for label, (elapsed, latencies) in results.items():
+        print(f"  {label + ':':<13} {elapsed * 1000:8.1f}ms total, "
+              f"request p50 {statistics.median(latencies) * 1000:.1f}ms, max {max(latencies) * 1000:.1f}ms")
+    print(f"  queued records dropped: {dropped}")
+    print(f"{args.debug_records} debug records at sample rate {log.LOG_DEBUG_SAMPLE_RATE}: {kept} written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Replays a long-running chat through the LLM client with a stub Gemini model
+and a stub cached-content API, once with prefix caching and once without, and
+reports how many prompt tokens each call sent versus read from cache:
+
+    python -m benchmarks.prompt_cache
+    python -m benchmarks.prompt_cache --turns 60 --reply-lines 80 --budget 6000
+
+The stub model rebuilds the full conversation it would have seen (cached
+prefix plus sent contents) and checks that it ends with the uncached prompt's
+contents, so a wrong split between cached and sent turns shows up as a
+mismatch. A cached prefix may add a few older turns in front.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import json
+
+from backend.agents.code_generator import CodeGeneratorAgent
+from backend.context.chat_context import ChatContext
+from backend.context.token_budget import estimate_tokens, fit_turns
+from backend.llm_client import LLMClient
+from backend.model_registry import ModelRegistry
+from backend.prompt_cache import PromptCache
+
+
+def _tokens(contents) -> int:
+    if isinstance(contents, str):
+        return estimate_tokens(contents)
+    return sum(estimate_tokens(part) for content in contents for part in content["parts"])
+
+
+class _Usage:
+    def __init__(self, prompt_token_count: int, cached_content_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+
+class _Response:
+    def __init__(self, text: str, usage: _Usage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class _Handle:
+    def __init__(self, name: str, system_instruction: str, contents):
+        self.name = name
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.tokens = estimate_tokens(system_instruction) + _tokens(contents)
+
+
+class StubCachedContentAPI:
+    """Stands in for Gemini cached content and tracks live entries."""
+
+    def __init__(self):
+        self.created = 0
+        self.deleted = 0
+        self.live = {}
+
+    async def create(self, model_name, system_instruction, contents, ttl_seconds):
+        self.created += 1
+        handle = _Handle(f"cachedContents/{self.created}", system_instruction, contents)
+        self.live[handle.name] = handle
+        return handle
+
+    async def delete(self, handle):
+        self.deleted += 1
+        self.live.pop(handle.name, None)
+
+    def model(self, handle, config):
+        return StubModel(config.model_name, cached=handle)
+
+
+class StubModel:
+    """Imitates GenerativeModel and records what each call sent."""
+
+    expected = None
+    mismatches = 0
+
+    def __init__(self, model_name: str, system_instruction: str = None, cached: _Handle = None, **settings):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached = cached
+
+    async def generate_content_async(self, contents, stream=False):
+        if self.cached is not None:
+            seen = (self.cached.system_instruction, self.cached.contents + contents)
+            older = len(seen[1]) - len(StubModel.expected[1])
+            seen = (seen[0], seen[1][max(older, 0):])
+            sent = _tokens(contents)
+            cached_tokens = self.cached.tokens
+        else:
+            seen = (self.system_instruction, contents)
+            sent = estimate_tokens(self.system_instruction or "") + _tokens(contents)
+            cached_tokens = 0
+
+        if json.dumps(seen) != json.dumps(StubModel.expected):
+            StubModel.mismatches += 1
+        return _Response("ok", _Usage(sent + cached_tokens, cached_tokens))
+
+
+async def replay(args, cache_enabled: bool) -> None:
+    api = StubCachedContentAPI()
+    cache = PromptCache(api=api, min_tokens=args.min_tokens, enabled=cache_enabled)
+    client = LLMClient(registry=ModelRegistry(model_factory=StubModel), prompt_cache=cache)
+    agent = CodeGeneratorAgent()
+    StubModel.mismatches = 0
+
+    history = []
+    for turn in range(args.turns):
+        request = f"turn {turn}: extend the parser to handle case {turn}"
+        turns, used = fit_turns(history[-args.window:], args.budget)
+        context = ChatContext(chat_id="bench-chat", turns=turns, token_count=used)
+        prompt = agent._build_prompt(request, context)
+        StubModel.expected = (prompt.system_instruction, prompt.contents())
+
+        await client.generate(prompt, model_key=agent.name)
+
+        reply = "\n".join(f"    step_{turn}_{i} = parse(token_{i})" for i in range(args.reply_lines))
+        history += [("user", request), ("assistant", f"```python\n{reply}\n```")]
+
+    stats = client.stats()
+    sent = stats["prompt_tokens"] - stats["cached_prompt_tokens"]
+    label = "with prefix cache" if cache_enabled else "without prefix cache"
+    print(f"{label}:")
+    print(f"  prompt tokens:     {stats['prompt_tokens']:,}")
+    print(f"  read from cache:   {stats['cached_prompt_tokens']:,}")
+    print(f"  sent per call:     {sent / args.turns:,.0f} (avg)")
+    print(f"  caches created:    {api.created} (deleted {api.deleted}, live {len(api.live)})")
+    print(f"  prefix reuses:     {cache.hits}")
+    print(f"  prompt mismatches: {StubModel.mismatches}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--reply-lines", type=int, default=40, help="Lines of code in each stub reply.")
+    parser.add_argument("--budget", type=int, default=4000, help="History token budget per prompt.")
+    parser.add_argument("--window", type=int, default=20, help="Recent messages considered.")
+    parser.add_argument("--min-tokens", type=int, default=1024)
+    args = parser.parse_args()
+
+    asyncio.run(replay(args, cache_enabled=False))
+    asyncio.run(replay(args, cache_enabled=True))
+
+
+if __name__ == "__main__":
+    main()
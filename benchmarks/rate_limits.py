@@ -0,0 +1,121 @@
+"""
+Sends a burst of requests through the LLM client to a stub provider that
+enforces a request quota and answers 429 (with a retry delay) once it is
+exceeded, and compares sending them unthrottled with the shared rate limiter:
+
+    python -m benchmarks.rate_limits
+    python -m benchmarks.rate_limits --requests 300 --quota 30 --period 1
+
+To keep the run short the quota applies per --period seconds rather than per
+minute; the limiter is given the same period.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import deque
+
+from google.api_core import exceptions as google_exceptions
+
+from backend.llm_client import LLMClient
+from backend.model_registry import ModelRegistry
+from backend.rate_limiter import RateLimiter
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubProvider:
+    """Allows `quota` requests in any sliding window of `period` seconds."""
+
+    def __init__(self, quota: int, period: float, latency: float):
+        self.quota = quota
+        self.period = period
+        self.latency = latency
+        self.recent = deque()
+        self.served = 0
+        self.rejected = 0
+
+    def model(self, model_name: str, **settings):
+        return _StubModel(self)
+
+    async def call(self) -> _Response:
+        now = time.monotonic()
+        while self.recent and self.recent[0] <= now - self.period:
+            self.recent.popleft()
+        if len(self.recent) >= self.quota:
+            self.rejected += 1
+            wait = self.recent[0] + self.period - now
+            raise google_exceptions.ResourceExhausted(
+                f"429 You exceeded your current quota. Please retry in {wait:.3f}s."
+            )
+        self.recent.append(now)
+        await asyncio.sleep(self.latency)
+        self.served += 1
+        return _Response("ok")
+
+
+class _StubModel:
+    def __init__(self, provider: StubProvider):
+        self.provider = provider
+
+    async def generate_content_async(self, contents, stream=False):
+        return await self.provider.call()
+
+
+async def burst(args, label: str, limiter: RateLimiter) -> None:
+    provider = StubProvider(args.quota, args.period, args.latency)
+    client = LLMClient(registry=ModelRegistry(model_factory=provider.model), limiter=limiter)
+
+    async def one(i: int):
+        start = time.perf_counter()
+        try:
+            await client.generate(f"write a python function #{i}")
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, error in results if error is None)
+    failed = sum(1 for _, error in results if error is not None)
+    print(f"{label}:")
+    print(f"  succeeded:      {len(latencies)} / {args.requests} (failed {failed})")
+    print(f"  provider 429s:  {provider.rejected}")
+    print(f"  wall time:      {elapsed:.2f}s")
+    if latencies:
+        print(f"  latency p50:    {statistics.median(latencies):.2f}s, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}s")
+    print(f"  limiter:        {limiter.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--quota", type=int, default=20, help="Provider requests allowed per period.")
+    parser.add_argument("--period", type=float, default=1.0, help="Quota period in seconds.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub call latency in seconds.")
+    args = parser.parse_args()
+
+    asyncio.run(burst(args, "unthrottled, no retries", RateLimiter(
+        rpm=0, tpm=0, max_concurrency=0, max_retries=0
+    )))
+    asyncio.run(burst(args, "retries only", RateLimiter(
+        rpm=0, tpm=0, max_concurrency=0, max_queue_seconds=60, retry_base_seconds=args.period / 4, max_retries=10
+    )))
+    asyncio.run(burst(args, "rate limiter", RateLimiter(
+        rpm=args.quota, tpm=0, max_concurrency=32, max_queue_seconds=60,
+        retry_base_seconds=args.period / 4, period=args.period
+    )))
+
+
+if __name__ == "__main__":
+    main()
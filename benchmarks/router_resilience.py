@@ -0,0 +1,160 @@
+"""
+Routes a stream of requests through the RouterAgent to stub Gemini models
+with a heavy latency tail, while the BugFixer's model goes through an outage
+in the middle of the run, and compares the router without protection against
+deadlines plus circuit breakers, and against deadlines, breakers and hedging:
+
+    python -m benchmarks.router_resilience
+    python -m benchmarks.router_resilience --requests 600 --stall-rate 0.05 --timeout 0.5
+
+Every model call takes --latency seconds, except a --stall-rate share that
+hangs for --stall seconds. During the outage the BugFixer's model answers
+with an error after --stall seconds. Requires DATABASE_URL like the app.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+from backend import resilience
+from backend.agents import router_agent as router_module
+from backend.agents.router_agent import RouterAgent
+from backend.llm_client import llm_client
+from backend.llm_providers import GeminiProvider
+from backend.log import configure_logging
+from backend.model_registry import DEFAULT_MODEL_KEY, FALLBACK_MODEL_KEY, ModelConfig, ModelRegistry
+from backend.rate_limiter import RateLimiter
+from backend.resilience import CircuitBreaker
+from backend.response_cache import response_cache
+
+PROMPTS = [
+    "Generate a Python function to sort a list #{i}",
+    "Fix this bug, my code throws an error #{i}",
+    "Explain what this SQL query does #{i}",
+]
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubModels:
+    """Builds stub models that share one latency profile and outage switch."""
+
+    def __init__(self, args):
+        self.args = args
+        self.outage = False
+        self.calls = 0
+
+    def model(self, model_name: str, **settings):
+        return _StubModel(self, model_name)
+
+
+class _StubModel:
+    def __init__(self, models: StubModels, model_name: str):
+        self.models = models
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream=False):
+        args = self.models.args
+        self.models.calls += 1
+        if self.model_name == "stub-pro" and self.models.outage:
+            await asyncio.sleep(args.stall)
+            raise google_exceptions.ServiceUnavailable("503 The model is overloaded.")
+        await asyncio.sleep(args.stall if random.random() < args.stall_rate else args.latency)
+        return _Response(f"answer from {self.model_name}")
+
+
+async def run(args, label: str, protected: bool, hedge: bool) -> None:
+    random.seed(args.seed)
+    models = StubModels(args)
+    llm_client.providers = [GeminiProvider(
+        registry=ModelRegistry(
+            configs={
+                DEFAULT_MODEL_KEY: ModelConfig("stub-flash"),
+                "BugFixer": ModelConfig("stub-pro"),
+                FALLBACK_MODEL_KEY: ModelConfig("stub-flash"),
+            },
+            model_factory=models.model
+        ),
+        limiter=RateLimiter(rpm=0, tpm=0, max_concurrency=0, max_retries=0)
+    )]
+    response_cache.enabled = False
+
+    timeout = args.timeout if protected else 3600.0
+    resilience.AGENT_TIMEOUT_SECONDS = timeout
+    router_module.FALLBACK_TIMEOUT_SECONDS = timeout
+    router_module.HEDGE_MIN_DELAY_SECONDS = args.hedge_min_delay
+    router = RouterAgent()
+    router.hedge_enabled = hedge
+    if not protected:
+        for agent in router.agents:
+            router.breakers[agent.name] = CircuitBreaker(agent.name, failure_threshold=10 ** 9)
+        router.breakers["llm_handler"] = CircuitBreaker("llm_handler", failure_threshold=10 ** 9)
+    else:
+        for agent in router.agents:
+            router.breakers[agent.name] = CircuitBreaker(agent.name, reset_seconds=args.reset)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors, fallbacks = [], 0, 0
+
+    async def one(i: int) -> None:
+        nonlocal errors, fallbacks
+        async with semaphore:
+            models.outage = args.requests // 3 <= i < 2 * args.requests // 3
+            start = time.perf_counter()
+            response, _, _, agent_name, _ = await router.route(PROMPTS[i % len(PROMPTS)].format(i=i))
+            latencies.append(time.perf_counter() - start)
+            errors += response.startswith(("❌", "⚠️"))
+            fallbacks += agent_name in ("llm_handler", "router")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)]
+
+    stats = router.resilience_stats()
+    print(f"{label}:")
+    print(f"  latency p50:    {statistics.median(latencies):.3f}s, p95 {pct(95):.3f}s, "
+          f"p99 {pct(99):.3f}s, max {latencies[-1]:.3f}s")
+    print(f"  wall time:      {elapsed:.2f}s")
+    print(f"  error replies:  {errors} / {args.requests} (fallbacks {fallbacks})")
+    print(f"  model calls:    {models.calls} (timeouts {stats['timeouts']}, hedges {stats['hedges']})")
+    print(f"  breaker opens:  {sum(b['times_opened'] for b in stats['breakers'].values())}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Normal model latency in seconds.")
+    parser.add_argument("--stall", type=float, default=2.0, help="Latency of a stalled call in seconds.")
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--timeout", type=float, default=0.5, help="Agent and fallback deadline.")
+    parser.add_argument("--reset", type=float, default=1.0, help="Seconds a breaker stays open.")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Agent failures and timeouts are the point of this run; keep them out of the report
+    configure_logging(level="ERROR")
+
+    asyncio.run(run(args, "no deadlines, breakers or hedging", protected=False, hedge=False))
+    asyncio.run(run(args, "deadlines and circuit breakers", protected=True, hedge=False))
+    asyncio.run(run(args, "deadlines, breakers and hedging", protected=True, hedge=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compares routing latency of the keyword, classifier, and hybrid scoring modes
+and shows where each mode would send a set of sample prompts.
+
+If no trained ranking model exists, a small one is trained from synthetic
+prompts so the classifier modes can run offline:
+
+    python -m benchmarks.scoring_modes --iterations 500
+    python -m benchmarks.scoring_modes --model-path /tmp/agent_ranking_model.joblib
+
+Author: Emzyking AI
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from backend import ranking_model
+from backend.log import configure_logging
+from backend.scorer import rank_agents, SCORING_MODES
+
+SAMPLE_PROMPTS = [
+    "write a python function to sort a list",
+    "fix this bug: TypeError: 'NoneType' object is not subscriptable",
+    "explain what this SQL query does: SELECT * FROM users WHERE id = 1",
+    "remember that I prefer Python over Java",
+    "my javascript loop is not working, it throws an error",
+    "what is polymorphism",
+    "hello",
+]
+
+_TEMPLATES = {
+    "code_generator": ["write a {lang} function to {task}", "generate a {lang} script that can {task}", "create a {lang} class to {task}"],
+    "bug_fixer": ["fix this {lang} code, it throws an error", "debug my {lang} function, it is not working", "why does this {lang} code fail to {task}"],
+    "code_explainer": ["explain what this {lang} code does", "what is a {lang} decorator", "describe how this {lang} loop works"],
+    "memory": ["remember that I prefer {lang}", "recall what my favorite language was", "remind me what I told you about {lang}"],
+}
+_LANGS = ["python", "javascript", "java", "sql", "c++", "go"]
+_TASKS = ["sort a list", "parse a csv file", "reverse a string", "call an api", "merge two dicts"]
+
+
+def synthetic_training_data(samples_per_label: int = 60):
+    rng = random.Random(42)
+    data = []
+    for label, templates in _TEMPLATES.items():
+        for _ in range(samples_per_label):
+            template = rng.choice(templates)
+            data.append((template.format(lang=rng.choice(_LANGS), task=rng.choice(_TASKS)), label))
+    return data
+
+
+def time_mode(mode: str, prompts, iterations: int):
+    latencies = []
+    rank_agents(prompts[0], mode=mode)  # warm-up
+    for i in range(iterations):
+        prompt = prompts[i % len(prompts)]
+        start = time.perf_counter()
+        rank_agents(prompt, mode=mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "mean": statistics.fmean(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--model-path", default=ranking_model.MODEL_PATH)
+    args = parser.parse_args()
+
+    configure_logging(level="ERROR")
+
+    ranking_model.MODEL_PATH = args.model_path
+    if not os.path.exists(args.model_path):
+        print(f"No model at {args.model_path}; training a synthetic one.")
+        ranking_model.train_ranking_model(synthetic_training_data())
+
+    # Warm the model cache so the first timed call does not include loading it
+    ranking_model.get_model()
+
+    print(f"\n{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for mode in SCORING_MODES:
+        result = time_mode(mode, SAMPLE_PROMPTS, args.iterations)
+        print(f"{mode:<12}{result['p50']:>10.3f}{result['p95']:>10.3f}{result['mean']:>10.3f}")
+
+    print("\nRouting decisions (top agent, score):")
+    decisions = {
+        prompt: [rank_agents(prompt, mode=mode)[:1] for mode in SCORING_MODES]
+        for prompt in SAMPLE_PROMPTS
+    }
+    for prompt, per_mode in decisions.items():
+        print(f"- {prompt[:60]}")
+        for mode, top in zip(SCORING_MODES, per_mode):
+            label = f"{top[0][0].name} ({top[0][1]:.2f})" if top else "fallback (llm_handler)"
+            print(f"    {mode:<11} {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measures what request tracing costs: the time to open and close one span,
+and the latency of routing prompts through the RouterAgent to a stub Gemini
+model with tracing on and off. The response cache is off so every prompt is
+a model call:
+
+    python -m benchmarks.tracing_overhead
+    python -m benchmarks.tracing_overhead --requests 500 --latency 0.01
+
+Requires DATABASE_URL like the app.
+
+Author: Emzyking AI
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from backend import tracing
+from backend.agent_registry import router_agent
+from backend.llm_client import llm_client
+from backend.llm_providers import GeminiProvider
+from backend.log import configure_logging
+from backend.model_registry import ModelRegistry
+from backend.rate_limiter import RateLimiter
+from backend.response_cache import response_cache
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class StubModel:
+    """Imitates GenerativeModel with a fixed latency."""
+
+    latency = 0.005
+
+    def __init__(self, model_name: str, **settings):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, stream=False):
+        await asyncio.sleep(StubModel.latency)
+        return _Response("def solution():\n    pass")
+
+
+def span_cost(iterations: int) -> float:
+    with tracing.request_trace("benchmark"):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with tracing.span("benchmark.stage", agent="none"):
+                pass
+        return (time.perf_counter() - start) / iterations
+
+
+async def route_latencies(requests: int):
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        with tracing.request_trace("benchmark"):
+            await router_agent.route(f"write a python function #{i}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub model latency in seconds.")
+    parser.add_argument("--spans", type=int, default=100000, help="Spans timed for the per-span cost.")
+    args = parser.parse_args()
+
+    configure_logging(level="ERROR")
+
+    StubModel.latency = args.latency
+    llm_client.providers = [GeminiProvider(
+        registry=ModelRegistry(model_factory=StubModel),
+        limiter=RateLimiter(rpm=0, tpm=0, max_concurrency=0)
+    )]
+    response_cache.enabled = False
+    tracing.TRACE_SLOW_REQUEST_SECONDS = float("inf")
+
+    print(f"one span: {span_cost(args.spans) * 1e6:.2f}us")
+
+    results = {}
+    for enabled in (False, True):
+        tracing.TRACING_ENABLED = enabled
+        asyncio.run(route_latencies(20))  # warm up models and scorer
+        results[enabled] = asyncio.run(route_latencies(args.requests))
+
+    print(f"{args.requests} routed requests, stub latency {args.latency * 1000:.1f}ms:")
+    for enabled, latencies in results.items():
+        label = "tracing on:" if enabled else "tracing off:"
+        print(f"  {label:<14} p50 {statistics.median(latencies) * 1000:.2f}ms, "
+              f"mean {statistics.mean(latencies) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
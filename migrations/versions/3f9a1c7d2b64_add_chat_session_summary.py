@@ -0,0 +1,30 @@
+"""add chat_session summary columns
+
+Revision ID: 3f9a1c7d2b64
+Revises: 704ce8a58f00
+Create Date: 2026-10-17 09:12:40.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2b64'
+down_revision: Union[str, Sequence[str], None] = '704ce8a58f00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('summary', sa.String(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('keyword_counts', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_sessions', 'keyword_counts')
+    op.drop_column('chat_sessions', 'summary')
@@ -0,0 +1,40 @@
+"""add llm_response_cache table
+
+Revision ID: 8b2e4d6a9c15
+Revises: 3f9a1c7d2b64
+Create Date: 2026-10-17 11:03:27.542961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d6a9c15'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('llm_response_cache',
+    sa.Column('cache_key', sa.String(), nullable=False),
+    sa.Column('agent_name', sa.String(), nullable=True),
+    sa.Column('model_name', sa.String(), nullable=True),
+    sa.Column('response', sa.Text(), nullable=True),
+    sa.Column('thought', sa.JSON(), nullable=True),
+    sa.Column('tool_calls', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    op.create_index(op.f('ix_llm_response_cache_expires_at'), 'llm_response_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_llm_response_cache_expires_at'), table_name='llm_response_cache')
+    op.drop_table('llm_response_cache')
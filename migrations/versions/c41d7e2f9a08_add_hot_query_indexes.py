@@ -0,0 +1,42 @@
+"""add composite indexes for hot query patterns
+
+Revision ID: c41d7e2f9a08
+Revises: 8b2e4d6a9c15
+Create Date: 2026-10-17 14:22:08.315407
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7e2f9a08'
+down_revision: Union[str, Sequence[str], None] = '8b2e4d6a9c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_chat_messages_chat_id_id', 'chat_messages', ['chat_id', 'id']),
+    ('ix_memory_store_chat_id_updated_at', 'memory_store', ['chat_id', 'updated_at']),
+    ('ix_agent_feedback_message_id', 'agent_feedback', ['message_id']),
+    ('ix_chat_sessions_created_at_id', 'chat_sessions', ['created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Build indexes without locking writes on Postgres; CONCURRENTLY cannot
+    # run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,12 @@
+"""
+Shared test setup. The backend reads its settings when modules are imported,
+so the environment is set here first: an in-memory SQLite database and
+quiet logging.
+
+Author: Emzyking AI
+"""
+
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
@@ -0,0 +1,119 @@
+"""
+In-process fake of the redis.asyncio client, used by the context cache
+tests and the context_cache benchmark.
+
+Author: Emzyking AI
+"""
+
+import time
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the subset of the redis.asyncio client used by
+    RedisContextStore. Commands in a pipeline run back to back, which matches
+    MULTI/EXEC semantics on a single event loop.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+
+    def _purge(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def _list(self, key):
+        self._purge(key)
+        return self._data.setdefault(key, [])
+
+    async def exists(self, *keys):
+        for key in keys:
+            self._purge(key)
+        return sum(1 for key in keys if key in self._data)
+
+    async def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            self._purge(key)
+            removed += self._data.pop(key, None) is not None
+            self._expires.pop(key, None)
+        return removed
+
+    async def set(self, key, value, ex=None):
+        self._data[key] = str(value).encode()
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.monotonic() + ex
+        return True
+
+    async def get(self, key):
+        self._purge(key)
+        return self._data.get(key)
+
+    async def incr(self, key):
+        self._purge(key)
+        value = int(self._data.get(key, b"0")) + 1
+        self._data[key] = str(value).encode()
+        return value
+
+    async def expire(self, key, seconds):
+        self._purge(key)
+        if key not in self._data:
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    async def rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(v.encode() if isinstance(v, str) else v for v in values)
+        return len(items)
+
+    async def lpush(self, key, *values):
+        items = self._list(key)
+        for v in values:
+            items.insert(0, v.encode() if isinstance(v, str) else v)
+        return len(items)
+
+    @staticmethod
+    def _slice(items, start, stop):
+        # Redis ranges are inclusive and accept negative indexes
+        start = max(len(items) + start, 0) if start < 0 else start
+        stop = len(items) + stop if stop < 0 else stop
+        return items[start:stop + 1]
+
+    async def ltrim(self, key, start, stop):
+        items = self._slice(self._list(key), start, stop)
+        if items:
+            self._data[key] = items
+        else:
+            self._data.pop(key, None)
+        return True
+
+    async def lrange(self, key, start, stop):
+        self._purge(key)
+        return self._slice(self._data.get(key, []), start, stop)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = [await command(*args, **kwargs) for command, args, kwargs in self._commands]
+        self._commands = []
+        return results
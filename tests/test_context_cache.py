@@ -0,0 +1,149 @@
+"""
+Tests for the context cache's write-through behaviour on both stores: the
+in-process LRU and the Redis store on an in-process fake.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+
+import pytest
+
+from backend.context.context_cache import ContextCache, InMemoryContextStore, RedisContextStore
+from tests.fake_redis import FakeRedis
+
+WINDOW = 4
+
+
+def make_store(kind):
+    if kind == "memory":
+        return InMemoryContextStore(WINDOW, max_sessions=8, ttl_seconds=600)
+    return RedisContextStore(FakeRedis(), WINDOW, ttl_seconds=600)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request):
+    return ContextCache(make_store(request.param), window=WINDOW, enabled=True)
+
+
+def messages(start, end):
+    return [("user" if i % 2 == 0 else "assistant", f"message {i}") for i in range(start, end)]
+
+
+async def load(cache, chat_id, memories, loaded_messages):
+    await cache.put(chat_id, memories, loaded_messages, await cache.reserve(chat_id))
+
+
+def test_append_to_uncached_session_is_a_no_op(cache):
+    async def run():
+        await cache.append_messages("chat", messages(0, 2))
+        await cache.add_memory("chat", "fact", "likes python")
+        return await cache.get("chat")
+
+    assert asyncio.run(run()) is None
+    assert cache.misses == 1
+
+
+def test_append_extends_a_cached_session(cache):
+    async def run():
+        await load(cache, "chat", [("fact", "likes python")], messages(0, 2))
+        await cache.append_messages("chat", messages(2, 3))
+        await cache.add_memory("chat", "fact", "uses fastapi")
+        return await cache.get("chat")
+
+    assert asyncio.run(run()) == {
+        "memories": [("fact", "uses fastapi"), ("fact", "likes python")],
+        "messages": messages(0, 3),
+    }
+
+
+def test_window_is_trimmed(cache):
+    async def run():
+        await load(cache, "chat", [], messages(0, 6))
+        stored = await cache.get("chat")
+        await cache.append_messages("chat", messages(6, 9))
+        return stored, await cache.get("chat")
+
+    stored, appended = asyncio.run(run())
+
+    assert stored["messages"] == messages(2, 6)
+    assert appended["messages"] == messages(5, 9)
+
+
+def test_load_racing_a_persisted_turn_is_not_cached(cache):
+    async def run():
+        token = await cache.reserve("chat")
+        # A turn is persisted after the loader read the database
+        await cache.append_messages("chat", messages(2, 4))
+        await cache.put("chat", [], messages(0, 2), token)
+        return await cache.get("chat")
+
+    assert asyncio.run(run()) is None
+
+
+def test_load_racing_a_stored_memory_is_not_cached(cache):
+    async def run():
+        token = await cache.reserve("chat")
+        await cache.add_memory("chat", "fact", "likes python")
+        await cache.put("chat", [], messages(0, 2), token)
+        return await cache.get("chat")
+
+    assert asyncio.run(run()) is None
+
+
+def test_only_the_latest_load_is_cached(cache):
+    async def run():
+        first = await cache.reserve("chat")
+        second = await cache.reserve("chat")
+        await cache.put("chat", [], messages(0, 3), second)
+        await cache.put("chat", [], messages(0, 2), first)
+        return await cache.get("chat")
+
+    assert asyncio.run(run())["messages"] == messages(0, 3)
+
+
+def test_redis_put_committed_during_an_append_is_undone():
+    store = make_store("redis")
+    cache = ContextCache(store, window=WINDOW, enabled=True)
+    exists = store.client.exists
+
+    async def run():
+        token = await cache.reserve("chat")
+
+        # The loader's put commits between the append's check and its write
+        async def put_after_check(*keys):
+            found = await exists(*keys)
+            await cache.put("chat", [], messages(0, 2), token)
+            return found
+
+        store.client.exists = put_after_check
+        await cache.append_messages("chat", messages(2, 4))
+        store.client.exists = exists
+        return await cache.get("chat")
+
+    assert asyncio.run(run()) is None
+
+
+def test_store_error_invalidates_the_entry(cache):
+    async def failing_append(chat_id, new_messages):
+        raise ConnectionError("store unavailable")
+
+    async def run():
+        await load(cache, "chat", [], messages(0, 2))
+        cache.store.append_messages = failing_append
+        await cache.append_messages("chat", messages(2, 3))
+        return await cache.get("chat")
+
+    # The entry is dropped rather than served without the new message
+    assert asyncio.run(run()) is None
+    assert cache.errors == 1
+
+
+def test_store_read_error_is_a_miss(cache):
+    async def failing_get(chat_id):
+        raise ConnectionError("store unavailable")
+
+    cache.store.get = failing_get
+
+    assert asyncio.run(cache.get("chat")) is None
+    assert cache.errors == 1
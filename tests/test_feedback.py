@@ -0,0 +1,84 @@
+"""
+Tests POST /feedback end to end: the request is stored as an agent_feedback
+row and summarized by get_feedback_summary.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from backend.database import db_models
+from backend.database.db_connection import Base, get_async_db
+from backend.feedback_handler import get_feedback_summary
+from backend.main import app
+
+
+@pytest.fixture
+def client():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            db.add(db_models.ChatSession(chat_id="chat"))
+            db.add(db_models.ChatMessage(id=1, chat_id="chat", role="assistant", content="def f(): pass"))
+            await db.commit()
+
+    async def get_test_db():
+        async with Session() as db:
+            yield db
+
+    asyncio.run(setup())
+    app.dependency_overrides[get_async_db] = get_test_db
+    # Not entered as a context manager, so the job workers are not started
+    yield TestClient(app), Session
+    app.dependency_overrides.clear()
+    asyncio.run(engine.dispose())
+
+
+def read(Session, query):
+    async def run():
+        async with Session() as db:
+            return await query(db)
+    return asyncio.run(run())
+
+
+def test_feedback_is_stored(client):
+    http, Session = client
+
+    response = http.post("/feedback", json={
+        "message_id": 1, "rating": 4, "comment": "Close, but missed an edge case.", "agent_name": "BugFixerAgent"
+    })
+
+    assert response.status_code == 200
+    rows = read(Session, lambda db: db.scalars(select(db_models.AgentFeedback)))
+    [row] = rows.all()
+    assert (row.message_id, row.rating, row.comments, row.agent_name) == (
+        1, 4, "Close, but missed an edge case.", "BugFixerAgent"
+    )
+
+
+def test_feedback_summary(client):
+    http, Session = client
+    http.post("/feedback", json={"message_id": 1, "rating": 5, "comment": "Great answer!"})
+    http.post("/feedback", json={"message_id": 1, "rating": 2})
+
+    summary = read(Session, lambda db: get_feedback_summary(1, db))
+
+    assert summary == {
+        "message_id": 1, "ratings_count": 2, "average_rating": 3.5, "comments": ["Great answer!"]
+    }
+
+
+def test_rating_out_of_range_is_rejected(client):
+    http, _ = client
+
+    assert http.post("/feedback", json={"message_id": 1, "rating": 6}).status_code == 422
@@ -0,0 +1,98 @@
+"""
+Tests that continue_chat keeps the user's message when the reply cannot be
+produced or saved, on an in-memory SQLite database with a stubbed router.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from backend import generation
+from backend.database import db_models
+from backend.database.db_connection import Base
+
+PROMPT = "write a python sort"
+
+
+async def reply(chat_id, user_input, context):
+    return "def sort(items): ...", None, [], "CodeGeneratorAgent", 0.9
+
+
+async def failing_reply(chat_id, user_input, context):
+    raise RuntimeError("all providers failed")
+
+
+def run_chat():
+    """
+    Runs one continue_chat turn on a fresh database.
+
+    Returns:
+        Tuple: (exception raised or None, stored (role, content) rows).
+    """
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+        error = None
+        try:
+            async with Session() as db:
+                chat_session = db_models.ChatSession(chat_id=str(uuid.uuid4()))
+                db.add(chat_session)
+                await db.commit()
+                try:
+                    await generation.continue_chat(db, chat_session, PROMPT)
+                except Exception as e:
+                    error = e
+
+            async with Session() as db:
+                rows = (await db.execute(
+                    select(db_models.ChatMessage.role, db_models.ChatMessage.content).order_by(db_models.ChatMessage.id)
+                )).all()
+        finally:
+            await engine.dispose()
+        return error, [tuple(row) for row in rows]
+
+    return asyncio.run(run())
+
+
+def test_turn_is_saved(monkeypatch):
+    monkeypatch.setattr(generation.router_agent, "route", reply)
+
+    error, rows = run_chat()
+
+    assert error is None
+    assert rows == [("user", PROMPT), ("assistant", "def sort(items): ...")]
+
+
+def test_user_message_is_saved_when_routing_fails(monkeypatch):
+    monkeypatch.setattr(generation.router_agent, "route", failing_reply)
+
+    error, rows = run_chat()
+
+    assert isinstance(error, RuntimeError)
+    assert rows == [("user", PROMPT)]
+
+
+def test_user_message_is_saved_when_the_turn_cannot_be_written(monkeypatch):
+    persist_turn = generation.persist_turn
+
+    async def failing_full_turn(db, chat_session, user_prompt, response_text=None, *args):
+        if response_text is not None:
+            await db.rollback()
+            raise ConnectionError("database unavailable")
+        return await persist_turn(db, chat_session, user_prompt)
+
+    monkeypatch.setattr(generation.router_agent, "route", reply)
+    monkeypatch.setattr(generation, "persist_turn", failing_full_turn)
+
+    error, rows = run_chat()
+
+    assert isinstance(error, ConnectionError)
+    assert rows == [("user", PROMPT)]
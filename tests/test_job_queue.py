@@ -0,0 +1,35 @@
+"""
+Tests that idle job workers sweep abandoned jobs once per lease period
+rather than on every poll.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+
+from backend import job_queue
+
+
+def test_idle_workers_sweep_once_per_lease(monkeypatch):
+    sweeps = []
+
+    async def no_job(db, worker_id):
+        return None
+
+    async def fail_abandoned(db):
+        sweeps.append(db)
+        return 0
+
+    monkeypatch.setattr(job_queue, "claim", no_job)
+    monkeypatch.setattr(job_queue, "fail_abandoned", fail_abandoned)
+    monkeypatch.setattr(job_queue, "JOB_POLL_INTERVAL_SECONDS", 0.01)
+
+    async def run():
+        pool = job_queue.JobWorkerPool()
+        pool.start(workers=4)
+        await asyncio.sleep(0.2)
+        await pool.stop()
+
+    asyncio.run(run())
+
+    assert len(sweeps) == 1
@@ -0,0 +1,184 @@
+"""
+Tests for PromptCache's prefix coverage: when a cached prefix is reused as
+the history window slides and grows, and when it is cached again. Uses a
+stub cached-content API; every turn is 10 estimated tokens.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+
+from backend.model_registry import ModelConfig
+from backend.prompt_builder import Prompt
+from backend.prompt_cache import PromptCache
+
+CONFIG = ModelConfig("gemini-test")
+SYSTEM_INSTRUCTION = "s" * 40  # 10 tokens
+MIN_TOKENS = 100
+
+
+class StubCachedContentAPI:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    async def create(self, model_name, system_instruction, contents, ttl_seconds):
+        if self.fail:
+            raise ConnectionError("cached content unavailable")
+        handle = f"cachedContents/{len(self.created) + 1}"
+        self.created.append((handle, contents))
+        return handle
+
+    async def delete(self, handle):
+        self.deleted.append(handle)
+
+    def model(self, handle, config):
+        return ("model", handle)
+
+
+def history(start, end):
+    # Even turns are the user's, odd turns the assistant's
+    return tuple(("user" if i % 2 == 0 else "assistant", f"{i:04d}" + "x" * 36) for i in range(start, end))
+
+
+def prompt(turns, system_instruction=SYSTEM_INSTRUCTION):
+    return Prompt(system_instruction=system_instruction, request="next request", history=turns, chat_id="chat")
+
+
+def acquire_all(cache, *prompts):
+    async def run():
+        return [await cache.acquire(p, CONFIG) for p in prompts]
+    return asyncio.run(run())
+
+
+def make_cache(**kwargs):
+    api = StubCachedContentAPI(**kwargs)
+    return PromptCache(api=api, min_tokens=MIN_TOKENS, ttl_seconds=600, max_chats=4, enabled=True), api
+
+
+def test_covered():
+    assert PromptCache._covered(history(0, 4), history(0, 6)) == 4
+    # Two cached turns slid out of the window
+    assert PromptCache._covered(history(0, 4), history(2, 6)) == 2
+    assert PromptCache._covered(history(0, 4), history(4, 6)) is None
+    assert PromptCache._covered(history(0, 4), history(0, 2) + history(5, 7)) is None
+    assert PromptCache._covered(history(0, 4), ()) is None
+
+
+def test_short_prefix_is_not_cached():
+    cache, api = make_cache()
+
+    assert acquire_all(cache, prompt(history(0, 2))) == [None]
+    assert cache.skipped == 1
+    assert api.created == []
+
+
+def test_prefix_ends_at_last_assistant_turn():
+    cache, api = make_cache()
+
+    # The trailing user turn is sent with the request, not cached
+    [(model, covered)] = acquire_all(cache, prompt(history(0, 11)))
+
+    assert model == ("model", "cachedContents/1")
+    assert covered == 10
+    assert len(api.created) == 1
+
+
+def test_prefix_is_reused_as_history_grows():
+    cache, api = make_cache()
+
+    results = acquire_all(cache, prompt(history(0, 10)), prompt(history(0, 12)), prompt(history(0, 18)))
+
+    assert results == [(("model", "cachedContents/1"), 10)] * 3
+    assert cache.hits == 2
+    assert len(api.created) == 1
+
+
+def test_prefix_is_reused_after_turns_slide_out():
+    cache, _ = make_cache()
+
+    results = acquire_all(cache, prompt(history(0, 10)), prompt(history(2, 14)))
+
+    # The two turns that left the window stay in the cached prefix
+    assert results[1] == (("model", "cachedContents/1"), 8)
+    assert cache.hits == 1
+
+
+def test_recached_once_new_turns_reach_min_tokens():
+    cache, api = make_cache()
+
+    results = acquire_all(cache, prompt(history(0, 10)), prompt(history(0, 20)))
+
+    assert results[1] == (("model", "cachedContents/2"), 20)
+    assert cache.hits == 0
+    # The replaced prefix is deleted at once
+    assert api.deleted == ["cachedContents/1"]
+
+
+def test_recached_once_dropped_turns_reach_min_tokens():
+    cache, api = make_cache()
+
+    results = acquire_all(cache, prompt(history(0, 20)), prompt(history(10, 22)))
+
+    assert results[1] == (("model", "cachedContents/2"), 12)
+    assert api.deleted == ["cachedContents/1"]
+
+
+def test_recached_when_history_diverges():
+    cache, _ = make_cache()
+    edited = history(0, 3) + (("assistant", "edited reply" + "x" * 28),) + history(4, 10)
+
+    results = acquire_all(cache, prompt(history(0, 10)), prompt(edited))
+
+    assert results[1] == (("model", "cachedContents/2"), 10)
+    assert cache.hits == 0
+
+
+def test_recached_when_system_instruction_changes():
+    cache, api = make_cache()
+
+    results = acquire_all(cache, prompt(history(0, 10)), prompt(history(0, 12), system_instruction="t" * 40))
+
+    assert results[1] == (("model", "cachedContents/2"), 12)
+    assert len(api.created) == 2
+    # The first agent's prefix is kept for when it answers again
+    assert api.deleted == []
+
+
+def test_alternating_agents_reuse_their_own_prefixes():
+    cache, api = make_cache()
+    other = "t" * 40
+
+    results = acquire_all(
+        cache,
+        prompt(history(0, 10)),
+        prompt(history(0, 12), system_instruction=other),
+        prompt(history(0, 14)),
+        prompt(history(0, 16), system_instruction=other),
+    )
+
+    assert [model for model, _ in results] == [("model", "cachedContents/1"), ("model", "cachedContents/2")] * 2
+    assert cache.hits == 2
+    assert len(api.created) == 2
+    assert api.deleted == []
+    assert cache.stats()["prefixes"] == 2
+
+
+def test_prefixes_per_chat_are_bounded():
+    cache, api = make_cache()
+    instructions = [c * 40 for c in "abcde"]
+
+    acquire_all(cache, *(prompt(history(0, 10), system_instruction=s) for s in instructions))
+
+    # The least recently used agent's prefix makes room for the fifth
+    assert api.deleted == ["cachedContents/1"]
+    assert cache.stats()["prefixes"] == 4
+
+
+def test_api_error_sends_prompt_uncached():
+    cache, _ = make_cache(fail=True)
+
+    assert acquire_all(cache, prompt(history(0, 10))) == [None]
+    assert cache.errors == 1
+    assert cache.stats()["chats"] == 0
@@ -0,0 +1,60 @@
+"""
+Tests that the rate limiter returns the permits a request took when a
+later stage of scheduling it fails.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+
+import pytest
+
+from backend.rate_limiter import RateLimiter, RateLimitExceeded
+
+
+def test_permits_returned_when_concurrency_slot_times_out():
+    limiter = RateLimiter(rpm=60, tpm=1000, max_concurrency=1, max_queue_seconds=0.05)
+
+    async def run():
+        await limiter._acquire(100)  # holds the only slot
+        with pytest.raises(RateLimitExceeded):
+            await limiter._acquire(100)
+
+    asyncio.run(run())
+
+    # Only the first request's permits are spent
+    assert limiter.requests.level == pytest.approx(59, abs=0.5)
+    assert limiter.tokens.level == pytest.approx(900, abs=5)
+    assert limiter.rejected == 1
+
+
+def test_request_permit_returned_when_token_bucket_times_out():
+    limiter = RateLimiter(rpm=60, tpm=1000, max_concurrency=0, max_queue_seconds=0.05)
+
+    async def run():
+        await limiter._acquire(1000)  # empties the token bucket
+        with pytest.raises(RateLimitExceeded):
+            await limiter._acquire(500)
+
+    asyncio.run(run())
+
+    assert limiter.requests.level == pytest.approx(59, abs=0.5)
+    assert limiter.tokens.level == pytest.approx(0, abs=5)
+
+
+def test_permits_returned_when_cancelled_while_queued():
+    limiter = RateLimiter(rpm=60, tpm=1000, max_concurrency=1, max_queue_seconds=10)
+
+    async def run():
+        await limiter._acquire(100)
+        queued = asyncio.create_task(limiter._acquire(100))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+    asyncio.run(run())
+
+    assert limiter.requests.level == pytest.approx(59, abs=0.5)
+    assert limiter.tokens.level == pytest.approx(900, abs=5)
+    assert limiter.rejected == 0
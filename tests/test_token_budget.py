@@ -0,0 +1,27 @@
+"""
+Tests for fitting chat turns into the context token budget.
+
+Author: Emzyking AI
+"""
+
+from backend.context.token_budget import fit_turns
+
+
+def turn(role, tokens):
+    return role, "x" * (tokens * 4)
+
+
+def test_keeps_newest_turns_that_fit():
+    turns = [turn("user", 10), turn("assistant", 10), turn("user", 10)]
+
+    kept, used = fit_turns(turns, token_budget=25)
+
+    assert kept == turns[1:]
+    assert used == 20
+
+
+def test_newest_turn_over_budget_is_left_out():
+    kept, used = fit_turns([turn("user", 10), turn("assistant", 40)], token_budget=30)
+
+    assert kept == []
+    assert used == 0
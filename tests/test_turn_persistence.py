@@ -0,0 +1,92 @@
+"""
+Tests that persist_turn writes a chat turn in one transaction with a fixed
+number of database round-trips, counted on an in-memory SQLite database.
+
+Author: Emzyking AI
+"""
+
+import asyncio
+import uuid
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from backend.database import db_models
+from backend.database.db_connection import Base
+from backend.database.turn_persistence import persist_turn
+
+THOUGHT = {"reasoning": "Handled by CodeGeneratorAgent.", "tool_invoked": "gemini-2.5-flash", "observation": "ok"}
+
+
+def run_turn(response_text=None, thought=None, tool_calls=None):
+    """
+    Persists one turn to a fresh database.
+
+    Returns:
+        Tuple: (round-trips taken, PersistedTurn, row count per table, session summary).
+    """
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+        # Statements plus commits, like the turn_queries benchmark
+        round_trips = {"count": 0}
+
+        def count(*_):
+            round_trips["count"] += 1
+
+        try:
+            async with Session() as db:
+                chat_session = db_models.ChatSession(chat_id=str(uuid.uuid4()))
+                db.add(chat_session)
+                await db.commit()
+
+                event.listen(engine.sync_engine, "before_cursor_execute", count)
+                event.listen(engine.sync_engine, "commit", count)
+                turn = await persist_turn(db, chat_session, "write a python sort", response_text, thought, tool_calls)
+                event.remove(engine.sync_engine, "before_cursor_execute", count)
+                event.remove(engine.sync_engine, "commit", count)
+
+            async with Session() as db:
+                rows = {
+                    model.__tablename__: await db.scalar(select(func.count()).select_from(model))
+                    for model in (db_models.ChatMessage, db_models.AgentThought, db_models.ToolUsage)
+                }
+                summary = await db.scalar(select(db_models.ChatSession.summary))
+        finally:
+            await engine.dispose()
+        return round_trips["count"], turn, rows, summary
+
+    return asyncio.run(run())
+
+
+def test_full_turn_takes_five_round_trips():
+    # Session lock, message insert, thought insert, session update, commit
+    round_trips, turn, rows, summary = run_turn("def sort(items): ...", THOUGHT)
+
+    assert round_trips == 5
+    assert turn.user_message_id is not None
+    assert turn.assistant_message_id is not None
+    assert turn.assistant_message_id != turn.user_message_id
+    assert rows == {"chat_messages": 2, "agent_thoughts": 1, "tool_usages": 0}
+    assert summary
+
+
+def test_tool_usages_add_one_round_trip():
+    tool_calls = [{"tool_name": f"tool_{i}", "input": "{}", "output": "{}"} for i in range(3)]
+
+    round_trips, _, rows, _ = run_turn("def sort(items): ...", THOUGHT, tool_calls)
+
+    assert round_trips == 6
+    assert rows == {"chat_messages": 2, "agent_thoughts": 1, "tool_usages": 3}
+
+
+def test_user_message_only():
+    round_trips, turn, rows, _ = run_turn()
+
+    assert round_trips == 4
+    assert turn.assistant_message_id is None
+    assert rows == {"chat_messages": 1, "agent_thoughts": 0, "tool_usages": 0}